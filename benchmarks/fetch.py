@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+"""
+End-to-end benchmark of MosquitoParallelFetching.run against local servers.
+
+A temporary home directory gets a configuration file and a database with N RSS configurations. Feeds, articles and
+images are served by a local HTTP server, emails go to a local SMTP sink, exec destinations run a stub script.
+
+e.g. python3 benchmarks/fetch.py --configs 50 --entries 20 --grab html text --latency 0.05 --destination mail
+"""
+
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import FeedServer, SMTPSink
+
+CONFIG = """[main]
+alert_email =
+check_ssl = False
+exec_path = {home}/exec
+log_level = {log_level}
+pool = {pool}
+smtp_server = 127.0.0.1
+smtp_port = {smtp_port}
+smtp_auth = True
+smtp_from = mosquito@example.com
+smtp_username = mosquito
+smtp_password = mosquito
+"""
+
+EXEC_SCRIPT = """#!/bin/sh
+exit 0
+"""
+
+EXECBATCH_SCRIPT = """#!/bin/sh
+while read message; do
+    echo ok
+done
+"""
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+
+    values = sorted(values)
+
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end fetch benchmark')
+    parser.add_argument('--configs', type=int, default=20, help='Number of configurations')
+    parser.add_argument('--entries', type=int, default=20, help='Entries per feed')
+    parser.add_argument('--article-size', type=int, default=50000, help='Article size (bytes)')
+    parser.add_argument('--charset', default='utf-8', help='Article charset (utf-8, windows-1251, koi8-r, ...)')
+    parser.add_argument('--images', type=int, default=2, help='Images per article')
+    parser.add_argument('--latency', type=float, default=0, help='Delay of every HTTP response (seconds)')
+    parser.add_argument('--grab', nargs='*', default=['html', 'text'], help='Grab modes (html images text)')
+    parser.add_argument('--destination', nargs='+', default=['mail'], choices=['mail', 'exec', 'execbatch'],
+                        help='Destination types')
+    parser.add_argument('--pool', type=int, default=4, help='Process pool size')
+    parser.add_argument('--log-level', default='warning', help='Log level of mosquito')
+    args = parser.parse_args()
+
+    feeds = FeedServer(args.entries, args.article_size, args.charset, args.images, latency=args.latency)
+    sink = SMTPSink()
+
+    http_port = feeds.start()
+    smtp_port = sink.start()
+
+    with tempfile.TemporaryDirectory() as home:
+        os.environ['HOME'] = home
+        os.makedirs(os.path.join(home, 'exec'))
+
+        with open(os.path.join(home, '.mosquito.ini'), 'w') as f:
+            f.write(CONFIG.format(home=home, log_level=args.log_level, pool=args.pool, smtp_port=smtp_port))
+
+        script = os.path.join(home, 'import.sh')
+
+        with open(script, 'w') as f:
+            f.write(EXEC_SCRIPT)
+
+        os.chmod(script, 0o755)
+
+        batch_script = os.path.join(home, 'import-batch.sh')
+
+        with open(batch_script, 'w') as f:
+            f.write(EXECBATCH_SCRIPT)
+
+        os.chmod(batch_script, 0o755)
+
+        # Settings are read from HOME, import mosquito only now
+        from mosquito.db import MosquitoDB
+        from mosquito.fetch import MosquitoParallelFetching
+        from mosquito.log import setup_logging
+        from mosquito.settings import get_settings
+
+        settings = get_settings()
+        setup_logging(settings)
+
+        destinations = []
+
+        if 'mail' in args.destination:
+            destinations.append('mail:user@example.com')
+        if 'exec' in args.destination:
+            destinations.append('exec:' + script)
+        if 'execbatch' in args.destination:
+            destinations.append('execbatch:' + batch_script)
+
+        db = MosquitoDB()
+
+        for i in range(args.configs):
+            db.create(
+                'True', 'rss', 'http://127.0.0.1:{}/feed/{}.xml'.format(http_port, i), destinations, 3600, 60,
+                'Benchmark {}'.format(i), ['.*'], ['grab=' + x for x in args.grab], '0', '0', '0',
+                ['min:600x300', 'max:800x600'], []
+            )
+
+        configs = list(db.stream())
+
+        # ----------------------------------------------------------------------------
+
+        start = time.monotonic()
+        results = MosquitoParallelFetching(True, settings).run(configs)
+        wall = time.monotonic() - start
+
+        # ----------------------------------------------------------------------------
+
+        latencies = [x[2] for x in results]
+        messages = args.configs * args.entries
+        rss_self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        rss_children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+        print('configs:            {}'.format(args.configs))
+        print('messages:           {}'.format(messages))
+        print('wall time:          {:.3f} s'.format(wall))
+        print('configs/sec:        {:.2f}'.format(args.configs / wall))
+        print('messages/sec:       {:.2f}'.format(messages / wall))
+        print('config latency p50: {:.3f} s'.format(percentile(latencies, 50)))
+        print('config latency p99: {:.3f} s'.format(percentile(latencies, 99)))
+        print('peak RSS main:      {} KiB'.format(rss_self))
+        print('peak RSS worker:    {} KiB'.format(rss_children))
+        print('HTTP requests:      {}'.format(feeds.requests))
+        print('HTTP bytes:         {}'.format(feeds.bytes))
+        print('SMTP messages:      {}'.format(sink.messages))
+        print('SMTP bytes:         {}'.format(sink.bytes))
+
+    feeds.stop()
+    sink.stop()
+
+
+if __name__ == '__main__':
+    main()
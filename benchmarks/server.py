@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+"""
+Local servers for benchmarks: synthetic RSS feeds, HTML articles and images over HTTP, and a SMTP sink.
+"""
+
+import socketserver
+import struct
+import threading
+import time
+import zlib
+
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+WORDS = ['mosquito', 'feed', 'article', 'news', 'benchmark', 'latency', 'archive', 'network', 'image', 'text',
+         'новости', 'статья', 'сеть']
+
+
+def png(width, height):
+    """ A gray PNG image of a specific size """
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    raw = b''.join(b'\x00' + b'\x80' * width for _ in range(height))
+
+    return b'\x89PNG\r\n\x1a\n' + \
+        chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)) + \
+        chunk(b'IDAT', zlib.compress(raw)) + \
+        chunk(b'IEND', b'')
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FeedServer(object):
+    """
+    /feed/<config>.xml - RSS feed with "entries" items
+    /article/<config>/<entry>.html - HTML article of "article_size" bytes in "charset" with "images" images
+    /image/<config>/<entry>/<image>.png - PNG image of "image_size"
+    Every response is delayed by "latency" seconds.
+    """
+
+    def __init__(self, entries=20, article_size=50000, charset='utf-8', images=2, image_size=(700, 400), latency=0):
+        self.entries = entries
+        self.article_size = article_size
+        self.charset = charset
+        self.images = images
+        self.latency = latency
+
+        self.image = png(*image_size)
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes = 0
+
+        self.server = None
+
+    def _feed(self, host, config):
+        items = []
+        now = time.time()
+
+        for entry in range(self.entries):
+            items.append(
+                """<item>
+                <title>{title}</title>
+                <link>http://{host}/article/{config}/{entry}.html</link>
+                <guid>http://{host}/article/{config}/{entry}.html</guid>
+                <pubDate>{date}</pubDate>
+                <description>{title}</description>
+                </item>""".format(
+                    title=' '.join(WORDS[(entry + i) % len(WORDS)] for i in range(8)),
+                    host=host,
+                    config=config,
+                    entry=entry,
+                    date=formatdate(now - entry * 60)
+                )
+            )
+
+        return """<?xml version="1.0" encoding="utf-8"?>
+        <rss version="2.0"><channel>
+        <title>Benchmark feed {}</title>
+        <link>http://{}/</link>
+        <description>Synthetic feed</description>
+        {}
+        </channel></rss>""".format(config, host, '\n'.join(items)).encode('utf-8')
+
+    def _article(self, host, config, entry):
+        images = ''.join(
+            '<img src="http://{}/image/{}/{}/{}.png">'.format(host, config, entry, i) for i in range(self.images)
+        )
+
+        paragraph = '<p>' + ' '.join(WORDS) + '</p>\n'
+        head = '<html><head><meta charset="{}"><title>Article {}</title></head><body>{}\n'.format(
+            self.charset, entry, images)
+
+        body = head + paragraph * max(1, int(self.article_size / len(paragraph.encode('utf-8')))) + '</body></html>'
+
+        return body.encode(self.charset, errors='replace')
+
+    def start(self):
+        benchmark = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if benchmark.latency:
+                    time.sleep(benchmark.latency)
+
+                host = self.headers.get('Host')
+                parts = self.path.strip('/').split('/')
+
+                try:
+                    if parts[0] == 'feed':
+                        body, content_type = benchmark._feed(host, parts[1][:-4]), 'application/rss+xml'
+                    elif parts[0] == 'article':
+                        body, content_type = benchmark._article(host, parts[1], parts[2][:-5]), \
+                            'text/html; charset={}'.format(benchmark.charset)
+                    elif parts[0] == 'image':
+                        body, content_type = benchmark.image, 'image/png'
+                    else:
+                        raise IndexError
+
+                except IndexError:
+                    self.send_error(404)
+                    return
+
+                with benchmark.lock:
+                    benchmark.requests += 1
+                    benchmark.bytes += len(body)
+
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        return self.server.server_port
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SMTPSink(object):
+    """ Accept and drop every message, AUTH is accepted with any credentials """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.messages = 0
+        self.recipients = 0
+        self.bytes = 0
+
+        self.server = None
+
+    def start(self):
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode('ascii') + b'\r\n')
+
+            def handle(self):
+                self.reply('220 localhost SMTP sink')
+
+                while True:
+                    line = self.rfile.readline()
+
+                    if not line:
+                        return
+
+                    command = line.decode('ascii', errors='replace').strip()
+                    verb = command.split(' ', 1)[0].upper()
+
+                    if verb == 'EHLO':
+                        self.reply('250-localhost')
+                        self.reply('250-AUTH PLAIN LOGIN')
+                        self.reply('250 8BITMIME')
+                    elif verb == 'AUTH':
+                        if command.upper().startswith('AUTH LOGIN'):
+                            for _ in range(2 - len(command.split()[2:])):
+                                self.reply('334 VXNlcm5hbWU6')
+                                self.rfile.readline()
+                        elif len(command.split()) == 2:
+                            self.reply('334 ')
+                            self.rfile.readline()
+
+                        self.reply('235 Authentication successful')
+                    elif verb == 'RCPT':
+                        with sink.lock:
+                            sink.recipients += 1
+
+                        self.reply('250 OK')
+                    elif verb == 'DATA':
+                        self.reply('354 End data with <CR><LF>.<CR><LF>')
+
+                        size = 0
+
+                        while True:
+                            data = self.rfile.readline()
+
+                            if not data or data == b'.\r\n':
+                                break
+
+                            size += len(data)
+
+                        with sink.lock:
+                            sink.messages += 1
+                            sink.bytes += size
+
+                        self.reply('250 OK')
+                    elif verb == 'QUIT':
+                        self.reply('221 Bye')
+                        return
+                    else:
+                        # HELO, MAIL, RSET, NOOP
+                        self.reply('250 OK')
+
+        self.server = ThreadingTCPServer(('127.0.0.1', 0), Handler)
+
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        return self.server.server_address[1]
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
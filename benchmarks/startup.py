@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+"""
+Startup budget for light commands (list, set, create).
+
+Every command runs with "python -X importtime" against a temporary home directory. The check fails if a heavy
+module is imported or if total import time exceeds the budget.
+
+e.g. python3 benchmarks/startup.py --budget 300
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+# Modules which must be imported only by fetch/drain code paths
+HEAVY_MODULES = [
+    'bs4', 'chardet', 'feedparser', 'html2text', 'PIL', 'requests', 'selenium', 'smtplib', 'twitter'
+]
+
+COMMANDS = {
+    'list': ['list'],
+    'set': ['set', '--id', '1', '--enabled', 'False'],
+    'create': ['create', '--plugin', 'rss', '--source', 'http://example.com/rss',
+               '--destination', 'mail:user@example.com'],
+}
+
+CONFIG = """[main]
+destination = mail:user@example.com
+log_level = error
+"""
+
+
+def run(command, home):
+    """ Run a command, return imported modules and total import time (ms) """
+
+    env = dict(os.environ, HOME=home)
+
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-m', 'mosquito'] + command,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+
+    modules = []
+    total = 0
+
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+
+        self_time, _, module = line[len('import time:'):].split('|')
+
+        modules.append(module.strip())
+        total += int(self_time)
+
+    return result.returncode, modules, total / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Startup budget for light commands')
+    parser.add_argument('--budget', type=float, default=300, help='Total import time per command (ms)')
+    args = parser.parse_args()
+
+    status = True
+
+    with tempfile.TemporaryDirectory() as home:
+        with open(os.path.join(home, '.mosquito.ini'), 'w') as f:
+            f.write(CONFIG)
+
+        for name, command in COMMANDS.items():
+            returncode, modules, total = run(command, home)
+            heavy = sorted(set(x.split('.')[0] for x in modules) & set(HEAVY_MODULES))
+
+            print('{:<8} {:>8.1f} ms  modules: {:<5} heavy: {}'.format(
+                name, total, len(modules), ', '.join(heavy) or '-'))
+
+            if returncode != 0 or heavy or total > args.budget:
+                status = False
+
+    sys.exit(0 if status else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,696 +2,30 @@
 
 import argparse
 import ast
-import chardet
-import coloredlogs
-import eventlet
 import fcntl
 import logging
 import multiprocessing
 import os
 import re
-import requests
 import sys
 import time
-import validators
 import warnings
 
-from bs4 import BeautifulSoup
 from datetime import datetime
-from distutils.util import strtobool
-from html2text import HTML2Text
-from io import BytesIO
-from selenium import webdriver
-from terminaltables import AsciiTable
 from textwrap import wrap
-from PIL import Image
 
 from mosquito.db import MosquitoDB
-from mosquito.settings import MosquitoSettings
+from mosquito.settings import get_settings, reload_settings
 from mosquito.help import MosquitoHelp
-
-from mosquito.plugins.dst_exec import MosquitoExec
-from mosquito.plugins.dst_mail import MosquitoMail
-from mosquito.plugins.src_rss import MosquitoRSS
-from mosquito.plugins.src_twitter import MosquitoTwitter
-
-
-class MosquitoParallelFetching(object):
-    def __init__(self, force, settings):
-        self.settings = settings
-        self.force = force
-
-        coloredlogs.install(level=self.settings.log_level)
-        self.logger = logging.getLogger('[POOL]')
-
-    def _convert_encoding(self, data, id, queue, new_encoding='UTF-8'):
-        """ Detect encoding and convert it to UTF-8 """
-
-        encoding = chardet.detect(data)['encoding']
-
-        queue.put([
-            id,
-            "debug",
-            "Detected encoding: {}".format(encoding)
-        ])
-
-        if encoding.upper() != new_encoding.upper():
-            data = data.decode(encoding, new_encoding)
-        else:
-            data = data.decode()
-
-        return data
-
-    def _grab_content(self, url, mode, id, queue, params=None):
-        """ Grab data in different formats """
-
-        eventlet.monkey_patch()
-
-        headers = {"User-Agent": self.settings.user_agent}
-
-        if mode == "images":
-            image_min_width = 0
-            image_min_height = 0
-            image_max_width = 0
-            image_max_height = 0
-            formats = []
-
-            if params:
-                for param in params:
-                    k, v = param.split(':')
-
-                    if k == 'min':
-                        w, h = v.split('x')
-
-                        image_min_width = int(w)
-                        image_min_height = int(h)
-
-                    elif k == 'max':
-                        w, h = v.split('x')
-
-                        image_max_width = int(w)
-                        image_max_height = int(h)
-
-                    elif k == 'format':
-                        formats = v.split(',')
-
-            with eventlet.Timeout(self.settings.grab_timeout):
-                try:
-                    # -------------------------------------------------------------------------------------
-
-                    links = []
-                    images = []
-
-                    # -------------------------------------------------------------------------------------
-
-                    with requests.get(url, headers=headers, verify=ast.literal_eval(self.settings.check_ssl)) as r:
-                        body = self._convert_encoding(r.content, id, queue)
-
-                    # -------------------------------------------------------------------------------------
-
-                    soup = BeautifulSoup(body, "lxml")
-
-                    for image in soup.find_all('img', src=True):
-                        link = image['src']
-
-                        if validators.url(link):
-                            links.append(link)
-
-                    # -------------------------------------------------------------------------------------
-
-                    for link in links:
-                        with requests.get(link, headers=headers, verify=ast.literal_eval(self.settings.check_ssl)) as r:
-                            image_data = BytesIO(r.content)
-
-                            try:
-                                with Image.open(image_data) as image:
-                                    width, height = image.size
-
-                                    if width >= image_min_width and height >= image_min_height:
-                                        if width <= image_max_width and height <= image_max_height:
-                                            queue.put([
-                                                id,
-                                                "debug",
-                                                "Image was matched: {}".format(link)
-                                            ])
-
-                                            # Get image format
-                                            image_format = image.format.lower()
-
-                                            # Derive image name from an URL
-                                            image_name = link[link.rfind("/") + 1:].split(".")[0]
-
-                                            if len(formats) > 0:
-                                                if image_format in formats:
-                                                    images.append([image_data.getvalue(), image_format, image_name])
-                                                else:
-                                                    queue.put([
-                                                        id,
-                                                        "warning",
-                                                        "Image format is not suitable: {}. Skipping.".format(image_format)
-                                                    ])
-                                            else:
-                                                images.append([image_data.getvalue(), image_format, image_name])
-                            except:
-                                pass
-
-                    return images
-
-                except eventlet.timeout.Timeout:
-                    queue.put([
-                        id,
-                        "warning",
-                        "Timeout for URL was reached: {}".format(url)
-                    ])
-
-                except requests.exceptions.SSLError:
-                    queue.put([
-                        id,
-                        "warning",
-                        "SSL verification for URL was failed: {}".format(url)
-                    ])
-
-                except Exception as error:
-                    queue.put([
-                        id,
-                        "warning",
-                        "Cannot grab images from URL: {} -> {}".format(url, error)
-                    ])
-
-        elif mode == "html":
-            with eventlet.Timeout(self.settings.grab_timeout):
-                try:
-                    with requests.get(url, headers=headers, verify=ast.literal_eval(self.settings.check_ssl)) as r:
-                        body = self._convert_encoding(r.content, id, queue)
-
-                    return body
-
-                except eventlet.timeout.Timeout:
-                    queue.put([
-                        id,
-                        "warning",
-                        "Timeout for URL was reached: {}".format(url)
-                    ])
-
-                except requests.exceptions.SSLError:
-                    queue.put([
-                        id,
-                        "warning",
-                        "SSL verification for URL was failed: {}".format(url)
-                    ])
-
-                except Exception as error:
-                    queue.put([
-                        id,
-                        "warning",
-                        "Cannot grab HTML from URL: {} -> {}".format(url, error)
-                    ])
-
-        elif mode == "screenshot":
-            if re.search("firefox", self.settings.browser_path):
-                browser_options = webdriver.FirefoxOptions()
-                browser_options.add_argument("--headless")
-                browser_options.binary_location = self.settings.browser_path
-
-                driver = webdriver.Firefox(
-                    executable_path=self.settings.browser_driver_path,
-                    firefox_options=browser_options
-                )
-
-            elif re.search("chrome|chromium", self.settings.browser_path):
-                browser_options = webdriver.ChromeOptions()
-                browser_options.add_argument("--headless")
-                browser_options.binary_location = self.settings.browser_path
-
-                driver = webdriver.Chrome(
-                    executable_path=self.settings.browser_driver_path,
-                    chrome_options=browser_options
-                )
-
-            with eventlet.Timeout(self.settings.grab_timeout):
-                try:
-                    driver.get(url)
-                    element = driver.find_element_by_tag_name('body')
-                    screenshot = element.screenshot_as_png
-                    driver.quit()
-
-                    return screenshot
-
-                except eventlet.timeout.Timeout:
-                    queue.put([
-                        id,
-                        "warning",
-                        "Timeout for URL was reached: {}".format(url)
-                    ])
-
-                except Exception as error:
-                    queue.put([
-                        id,
-                        "warning"
-                        "Cannot grab screenshot from URL: {} -> {}".format(url, error)
-                    ])
-
-        elif mode == "text":
-            with eventlet.Timeout(self.settings.grab_timeout):
-                try:
-                    with requests.get(url, headers=headers, verify=ast.literal_eval(self.settings.check_ssl)) as r:
-                        h2t = HTML2Text()
-                        h2t.body_width = 0
-                        h2t.ignore_emphasis = True
-                        #h2t.ignore_images = True
-
-                        text = self._convert_encoding(r.content, id, queue)
-                        text = h2t.handle(text)
-
-                    return text
-
-                except eventlet.timeout.Timeout:
-                    queue.put([
-                        id,
-                        "warning",
-                        "Timeout for URL was reached: {}".format(url)
-                    ])
-
-                except requests.exceptions.SSLError:
-                    queue.put([
-                        id,
-                        "warning",
-                        "SSL verification for URL was failed: {}".format(url)
-                    ])
-
-                except Exception as error:
-                    queue.put([
-                        id,
-                        "warning",
-                        "Cannot grab text from URL: {} -> {}".format(url, error)
-                    ])
-
-    def _logger(self, queue):
-        while True:
-            item = queue.get()
-
-            if item:
-                config_id = item[0]
-                level = item[1]
-                message = item[2]
-
-                coloredlogs.DEFAULT_LOG_FORMAT = '%(asctime)s %(name)s[{}] %(levelname)s  %(message)s'.format(config_id)
-                coloredlogs.install(level=self.settings.log_level)
-
-                if level == "debug":
-                    self.logger.debug(message)
-                elif level == "error":
-                    self.logger.error(message)
-                elif level == "info":
-                    self.logger.info(message)
-                elif level == "warning":
-                    self.logger.warning(message)
-
-    def _match_regex(self, data, regexs, id, queue):
-        """ Search patterns in data """
-
-        if regexs:
-            regex_found = False
-
-            for regex in regexs:
-                pattern = re.compile(regex,re.IGNORECASE + re.UNICODE)
-
-                if re.search(pattern, data):
-                    regex_found = True
-                    queue.put([
-                        id,
-                        "debug",
-                        "Regex was matched: {}".format(regex)
-                    ])
-                else:
-                    queue.put([
-                        id,
-                        "debug",
-                        "Regex wasn't matched: {}".format(regex)
-                    ])
-
-            if regex_found:
-                queue.put([
-                    id,
-                    "debug",
-                    "Content was matched"
-                ])
-            else:
-                if regex_found:
-                    queue.put([
-                        id,
-                        "debug",
-                        "Content wasn't matched"
-                    ])
-
-            return regex_found
-        else:
-            print("Regexp list is empty!")
-            return False
-
-    def _process_config(self, config):
-        config_id = config[0]
-        config_enabled = config[1]
-        config_plugin = config[2]
-        config_source = config[3]
-        config_destination = ast.literal_eval(config[4])
-        config_update_alert = config[5]
-        config_update_interval = config[6]
-        config_regex = ast.literal_eval(config[8])
-        config_regex_action = ast.literal_eval(config[9])
-        config_timestamp = config[10]
-        config_alert_timestamp = config[12]
-        config_images_settings = ast.literal_eval(config[13])
-        config_url_tags = ast.literal_eval(config[14])
-        current_timestamp = time.mktime(datetime.utcnow().timetuple())
-        queue = config[15]
-
-        db = MosquitoDB(config_id, queue)
-        exec = MosquitoExec(config_id, queue)
-        mail = MosquitoMail(config_id, queue)
-
-        if self.force or config_enabled == "True":
-            if self.force or (current_timestamp - config_timestamp) > config_update_interval:
-
-                queue.put([
-                    config_id,
-                    "info",
-                    "Working with configuration: {}".format(config_id)
-                ])
-
-                if config_plugin == "rss":
-                    plugin = MosquitoRSS(config_id, queue)
-                elif config_plugin == "twitter":
-                    plugin = MosquitoTwitter(config_id, queue)
-
-                messages = plugin.fetch(config_source)
-
-                count = 0
-
-                for message in messages:
-                    message_timestamp = message[0]
-                    message_url = message[2]
-                    message_title = re.sub(r"https?:\/\/.*", "", message[1])
-
-                    if message_timestamp > config_timestamp:
-                        if self._match_regex(message_title, config_regex, config_id, queue):
-                            grab_list = []
-                            tags = {}
-
-                            mail_priority = None
-                            mail_subject = None
-
-                            grabbed_images = []
-                            grabbed_html = None
-                            grabbed_screenshot = None
-                            grabbed_text = None
-
-                            for action in config_regex_action:
-                                action_type = action.split("=")[0]
-                                action_value = action.split("=")[1]
-
-                                if action_type == "grab":
-                                    grab_list.append(action_value)
-                                elif action_type == "priority":
-                                    mail_priority = action_value
-                                elif action_type == "subject":
-                                    mail_subject = action_value
-                                elif action_type == "tag":
-                                    tag_name, tag_value = action_value.split(":")
-                                    tags[tag_name] = tag_value
-
-                            if message_url:
-                                for url_tag in config_url_tags:
-                                    url, tag = url_tag.split(":",1)
-
-                                    if re.search(url, message_url):
-                                        tag = tag.split("=")
-                                        tag_name, tag_value = tag[1].split(":")
-                                        tags[tag_name] = tag_value
-
-                            # ------------------------------------------------------------------------
-                            # Process a grab list
-
-                            if grab_list and message_url:
-                                for grab in grab_list:
-
-                                    if grab == "full":
-                                        grabbed_images = self._grab_content(message_url, "images", config_id, queue, params=config_images_settings)
-                                        grabbed_html = self._grab_content(message_url, "html", config_id, queue)
-                                        grabbed_screenshot = self._grab_content(message_url, "screenshot", config_id, queue)
-                                        grabbed_text = self._grab_content(message_url, "text", config_id, queue)
-
-                                    elif grab == "images":
-                                        grabbed_images = self._grab_content(message_url, grab, config_id, queue, params=config_images_settings)
-
-                                    elif grab == "html":
-                                        grabbed_html = self._grab_content(message_url, grab, config_id, queue)
-
-                                    elif grab == "screenshot":
-                                        grabbed_screenshot = self._grab_content(message_url, grab, config_id, queue)
-
-                                    elif grab == "text":
-                                        grabbed_text = self._grab_content(message_url, grab, config_id, queue)
-
-                            # ------------------------------------------------------------------------
-
-                            for destination in config_destination:
-                                k, v = destination.split(":", 1)
-
-                                if k == "exec":
-                                    tags["id"] = str(config_id)
-                                    tags["plugin"] = str(config_plugin)
-                                    tags["source"] = str(config_source)
-                                    tags["url"] = str(message_url)
-
-                                    exec.run(
-                                        v,                      # path to executable
-                                        message_timestamp,
-                                        tags,
-                                        message_title,
-                                        grabbed_html,
-                                        grabbed_screenshot,
-                                        grabbed_text,
-                                        grabbed_images
-                                    )
-
-                                elif k == "mail":
-                                    # Transform subject
-                                    if mail_subject:
-                                        subject = mail_subject + " " + message_title.split("\n", 1)[0]
-                                    else:
-                                        subject = message_title.split("\n", 1)[0]
-
-                                    if subject:
-                                        if len(subject) > self.settings.subject_length:
-                                            subject = subject[:self.settings.subject_length] + " ..."
-
-                                    # Add default headers
-                                    headers = tags
-                                    headers["X-mosquito-id"] = str(config_id)
-                                    headers["X-mosquito-plugin"] = str(config_plugin)
-                                    headers["X-mosquito-source"] = str(config_source)
-                                    headers["X-mosquito-message-url"] = str(message_url)
-
-                                    # Set email priority
-                                    if mail_priority:
-                                        if mail_priority == "high":
-                                            priority = "1"
-                                        elif mail_priority == "normal":
-                                            priority = "3"
-                                        elif mail_priority == "low":
-                                            priority = "5"
-                                    else:
-                                        priority = "3"
-
-                                    # Append URL to mail body
-                                    body = message_title + "\n\n---\n{}".format(message_url)
-
-                                    if not mail.send(
-                                            v, headers, priority, subject, body, grabbed_html,
-                                            grabbed_screenshot, grabbed_text, grabbed_images
-                                    ):
-                                        queue.put([
-                                            config_id,
-                                            "warning",
-                                            "SMTP server is not available. Add message to archive!"
-                                        ])
-
-                                        db.add_archive(
-                                            config_id, v, headers, priority, subject, body,
-                                            grabbed_html, grabbed_screenshot, grabbed_text, current_timestamp
-                                        )
-
-                            count += 1
-                    else:
-                        queue.put([
-                            config_id,
-                            "debug",
-                            "The message timestamp is lower than the config timestamp, skipping: {} < {}".format(
-                                int(message_timestamp), int(config_timestamp))
-                        ])
-
-                if count > 0:
-                    # Update timestamp for a configuration
-                    db.update_timestamp(config_id, time.mktime(datetime.utcnow().timetuple()))
-
-                    # Increase counter for a configuration
-                    db.update_counter(config_id, count)
-                else:
-                    # Check if we haven't received new data during a specific interval
-                    if current_timestamp > (config_timestamp + int(config_update_alert)):
-                        queue.put([
-                            config_id,
-                            "warning",
-                            "No new data for the configuration: {}".format(config_id)
-                        ])
-
-                        # Check if we are reached "alert_interval". If so, send a letter.
-                        if current_timestamp > (int(config_alert_timestamp) +
-                                                self._validate_interval(self.settings.alert_interval)):
-                            queue.put([
-                                config_id,
-                                "warning",
-                                "Alert interval reached. Sending an alert email: {}".format(config_id)
-                            ])
-
-                            if self.settings.alert_email:
-                                if mail.send(
-                                        self.settings.alert_email,
-                                        None,
-                                        None,
-                                        self.settings.alert_subject,
-                                        "{} -> {} -> {}".format(config_id, config_plugin, config_source),
-                                        None,
-                                        None,
-                                        None,
-                                        None
-                                ):
-                                    db.update_alert_timestamp(config_id, current_timestamp)
-                            else:
-                                queue.put([
-                                    config_id,
-                                    "warning",
-                                    ("Alert email address doesn't set, warnings about absence of new data will be"
-                                     " shown only in console.")
-                                ])
-
-            else:
-                queue.put([
-                    config_id,
-                    "info",
-                    "Update interval hasn't been reached, skipping: {}".format(config_id)
-                ])
-
-                return False
-
-        else:
-            queue.put([
-                config_id,
-                "info",
-                "Configuration is disabled, skipping: {}".format(config_id)
-            ])
-
-            return False
-
-        queue.put([
-            config_id,
-            "info",
-            "Configuration has been processed: {}".format(config_id)
-        ])
-
-        return True
-
-    def _validate_interval(self, interval):
-        """
-        Validate time types:
-        "s" - seconds
-        "m" - minutes
-        "h" - hours
-        "d" - days
-        """
-
-        if interval:
-            if re.match('^[0-9]+[smhd]', interval):
-                if interval.endswith('s'):
-                    return int(interval[:-1])
-
-                elif interval.endswith('m'):
-                    return int(interval[:-1]) * 60
-
-                elif interval.endswith('h'):
-                    return int(interval[:-1]) * 60 * 60
-
-                elif interval.endswith('d'):
-                    return int(interval[:-1]) * 60 * 60 * 24
-
-            elif interval.isdigit():
-                return interval
-            else:
-                self.logger.error("Time interval must be a digit or a digit with suffix: {}".format(interval))
-                sys.exit(1)
-
-    def run(self, configs):
-        # ----------------------------------------------------------------------------
-        m = multiprocessing.Manager()
-        q = m.Queue()
-
-        lp = multiprocessing.Process(target=self._logger, args=(q,))
-        lp.daemon = True
-        lp.start()
-
-        # ----------------------------------------------------------------------------
-
-        configs_number = len(configs)
-
-        if configs_number < self.settings.pool:
-            pool_size = configs_number
-        else:
-            pool_size = self.settings.pool
-
-        self.logger.info("Process pool size: {}".format(pool_size))
-
-        # ----------------------------------------------------------------------------
-
-        if (configs_number % pool_size) == 0:
-            chunk_size = int(configs_number / pool_size)
-        else:
-            chunk_size = int((configs_number / pool_size) + 1)
-
-        self.logger.info("Chunk size of the pool: {}".format(chunk_size))
-
-        # ----------------------------------------------------------------------------
-
-        configs_with_queue = []
-
-        for config in configs:
-            config = config + (q,)
-            configs_with_queue.append(config)
-
-        # ----------------------------------------------------------------------------
-
-        self.logger.info("Putting configurations to the process pool: {}".format(configs_number))
-
-        p = multiprocessing.Pool(pool_size)
-        results = p.map(self._process_config, configs_with_queue, chunk_size)
-
-        p.close()
-        p.join()
-        lp.terminate()
-
-        # ----------------------------------------------------------------------------
-
-        self.logger.info("Number of processed configurations: {}".format(results.count(True)))
-        self.logger.info("Number of skipped configurations: {}".format(results.count(False)))
+from mosquito.log import setup_logging
 
 
 class Mosquito(object):
 
     def __init__(self):
-        self.settings = MosquitoSettings()
+        self.settings = get_settings()
 
-        coloredlogs.DEFAULT_LOG_FORMAT = '%(asctime)s %(name)s %(levelname)s  %(message)s'
-        coloredlogs.install(level=self.settings.log_level)
+        setup_logging(self.settings)
 
         self.logger = logging.getLogger('[MAIN]')
 
@@ -707,14 +41,6 @@ class Mosquito(object):
 
         self.db = MosquitoDB()
         self.help = MosquitoHelp()
-        self.mail = MosquitoMail()
-
-        # Try to send archived data
-        if self.mail.status:
-            self._send_archive()
-
-        # Try to clean database
-        self.db.clean()
 
         # Create root parser
         parser = argparse.ArgumentParser(prog='mosquito', description=self.help.description)
@@ -738,6 +64,13 @@ class Mosquito(object):
         parser_create.add_argument('--url-tags', nargs='+', default=[], help=self.help.create11)
         parser_create.set_defaults(func=self.create)
 
+        # Create 'daemon' parser
+        parser_daemon = subparsers.add_parser('daemon', help=self.help.daemon1)
+        parser_daemon.add_argument('--plugin', nargs='+', help=self.help.daemon2)
+        parser_daemon.add_argument('--id', nargs='+', help=self.help.daemon3)
+        parser_daemon.add_argument('--interval', help=self.help.daemon4)
+        parser_daemon.set_defaults(func=self.daemon)
+
         # Create 'delete' parser
         parser_delete = subparsers.add_parser('delete', help=self.help.delete1)
         group_delete = parser_delete.add_mutually_exclusive_group(required=True)
@@ -745,18 +78,60 @@ class Mosquito(object):
         group_delete.add_argument('--id', nargs='+', help=self.help.delete3)
         group_delete.set_defaults(func=self.delete)
 
+        # Create 'drain' parser
+        parser_drain = subparsers.add_parser('drain', help=self.help.drain1)
+        parser_drain.add_argument('--retries', type=int, default=self.settings.drain_retries, help=self.help.drain2)
+        parser_drain.set_defaults(func=self.drain)
+
+        # Create 'export' parser
+        parser_export = subparsers.add_parser('export', help=self.help.export1)
+        parser_export.add_argument('--plugin', nargs='+', help=self.help.export2)
+        parser_export.add_argument('--id', nargs='+', help=self.help.export3)
+        parser_export.add_argument('--format', choices=['jsonl', 'opml'], default='jsonl', help=self.help.export4)
+        parser_export.add_argument('--file', help=self.help.export5)
+        parser_export.set_defaults(func=self.export_configs)
+
         # Create 'fetch' parser
         parser_fetch = subparsers.add_parser('fetch', help=self.help.fetch1)
         parser_fetch.add_argument('--plugin', nargs='+', help=self.help.fetch2)
         parser_fetch.add_argument('--id', nargs='+', help=self.help.fetch3)
         parser_fetch.add_argument('--force', action='store_true', help=self.help.fetch4)
+        parser_fetch.add_argument('--profile', metavar='DIR', help=self.help.fetch5)
+        parser_fetch.add_argument('--profile-top', type=int, default=10, help=self.help.fetch6)
         parser_fetch.set_defaults(func=self.fetch)
 
+        # Create 'import' parser
+        parser_import = subparsers.add_parser('import', help=self.help.import1)
+        parser_import.add_argument('--file', required=True, help=self.help.import2)
+        parser_import.add_argument('--format', choices=['jsonl', 'opml'], help=self.help.import3)
+        parser_import.add_argument('--destination', nargs='+', default=self.settings.destination,
+                                   help=self.help.import4)
+        parser_import.add_argument('--update-alert', default=self.settings.update_alert, help=self.help.import5)
+        parser_import.add_argument('--update-interval', default=self.settings.update_interval, help=self.help.import6)
+        parser_import.add_argument('--regex', nargs='+', default=self.settings.regex, help=self.help.import7)
+        parser_import.add_argument('--regex-action', nargs='+', default=self.settings.regex_action,
+                                   help=self.help.import8)
+        parser_import.add_argument('--images-settings', nargs='+',
+                                   default=['min:' + self.settings.images_min, 'max:' + self.settings.images_max],
+                                   help=self.help.import9)
+        parser_import.add_argument('--url-tags', nargs='+', default=[], help=self.help.import10)
+        parser_import.set_defaults(func=self.import_configs)
+
         # Create 'list' parser
         parser_list = subparsers.add_parser('list', help=self.help.list1)
         parser_list.add_argument('--plugin', nargs='+', help=self.help.list2)
         parser_list.add_argument('--id', nargs='+', help=self.help.list3)
         parser_list.add_argument('--full', action='store_true', help=self.help.list4)
+        parser_list.add_argument('--source', help=self.help.list5)
+        parser_list.add_argument('--destination', help=self.help.list6)
+        parser_list.add_argument('--enabled', choices=['True', 'False'], help=self.help.list7)
+        parser_list.add_argument('--stale-since', help=self.help.list8)
+        parser_list.add_argument('--sort', choices=['id', 'plugin', 'source', 'update', 'count'], default='id',
+                                 help=self.help.list9)
+        parser_list.add_argument('--reverse', action='store_true', help=self.help.list10)
+        parser_list.add_argument('--limit', type=int, help=self.help.list11)
+        parser_list.add_argument('--offset', type=int, default=0, help=self.help.list12)
+        parser_list.add_argument('--format', choices=['table', 'json', 'csv'], default='table', help=self.help.list13)
         parser_list.set_defaults(func=self.list)
 
         # Create 'set' parser
@@ -775,6 +150,13 @@ class Mosquito(object):
         parser_set.add_argument('--url-tags', nargs='+', help=self.help.set13)
         parser_set.set_defaults(func=self.set)
 
+        # Create 'stats' parser
+        parser_stats = subparsers.add_parser('stats', help=self.help.stats1)
+        parser_stats.add_argument('--id', nargs='+', help=self.help.stats2)
+        parser_stats.add_argument('--window', default='1d', help=self.help.stats3)
+        parser_stats.add_argument('--top', type=int, default=10, help=self.help.stats4)
+        parser_stats.set_defaults(func=self.stats)
+
         args = parser.parse_args()
 
         try:
@@ -799,34 +181,72 @@ class Mosquito(object):
          
         return object_string
     
-    def _send_archive(self):
-        """ Send archived data to a SMTP server """
+    def _percentile(self, values, percent):
+        """ Percentile of sorted values """
+
+        if not values:
+            return 0
+
+        return values[min(len(values) - 1, int(percent / 100 * len(values)))]
+
+    def _drain(self):
+        """ Create an archive drain worker """
+
+        from mosquito.drain import MosquitoArchiveDrain
 
-        records = self.db.list_archive()
+        return MosquitoArchiveDrain(
+            self.settings.drain_batch,
+            self.settings.drain_backoff_min_seconds,
+            self.settings.drain_backoff_max_seconds,
+            {
+                'max_age': self.settings.archive_max_age_seconds,
+                'max_bytes': self.settings.archive_max_size,
+                'max_rows': self.settings.archive_max_rows
+            }
+        )
+
+    def _fetch(self, plugins, ids, force, profile=None, profile_top=10):
+        """ Fetch data from selected configurations """
+
+        configs = list(self.db.stream(self._validate_plugin(plugins), self._validate_ids(ids)))
+
+        if configs:
+            self.logger.debug("Configurations were retrieved: {}".format(len(configs)))
 
-        if isinstance(records, list):
-            for record in records:
-                id = record[0]
-                destinations = record[2]
-                headers = ast.literal_eval(record[3])
-                priority = record[4]
-                subject = record[5]
-                original_content = record[6]
-                grabbed_html = record[7]
-                grabbed_screenshot = record[8]
-                grabbed_text = record[9]
+            from mosquito.fetch import MosquitoParallelFetching
 
-                if self.mail.send(destinations, headers, priority, subject, original_content, grabbed_html,
-                                  grabbed_screenshot, grabbed_text, None):
+            pf = MosquitoParallelFetching(force, self.settings, profile, profile_top)
+            pf.run(configs)
+        else:
+            self.logger.info("There are no configurations!")
 
-                    self.logger.warning('Archived records are sending ...')
-                    self.db.delete_archive(id)
+    def _lock(self):
+        """ Set lock, only one instance can fetch data """
+
+        try:
+            flock = open(self.settings.lock_file, 'a')
+            fcntl.flock(flock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.logger.error('Mosquito already running. Cannot set lock on: {}'.format(self.settings.lock_file))
+            sys.exit(1)
+
+        return flock
+
+    def _unlock(self, flock):
+        """ Unset lock """
+
+        try:
+            fcntl.flock(flock, fcntl.LOCK_UN)
+        except:
+            pass
 
     def _validate_action(self, destinations, actions):
         """
         Validate actions types:
         "execute" - execute script if data matches
         "grab" - fetch data in different formats
+        "digest" - send matched messages to emails as one digest per interval
+        "parser" - parse RSS feeds with lxml, feedparser or lxml with a fallback to feedparser
         "priority" - set priority for an email
         "subject" - set subject for an email
         "tag" - add a tag to an email or pass a tag to executable
@@ -838,10 +258,13 @@ class Mosquito(object):
             for destination in destinations:
                 k, v = destination.split(":", 1)
 
-                if k == "exec":
+                if k == "exec" or k == "execbatch":
                     available_actions.extend(["grab", "tag"])
                 elif k == "mail":
-                    available_actions.extend(["grab", "priority", "subject", "tag"])
+                    available_actions.extend(["digest", "grab", "priority", "subject", "tag"])
+
+        # Actions of a source are available for every destination
+        available_actions.append("parser")
 
         available_actions = list(set(available_actions))
 
@@ -872,6 +295,24 @@ class Mosquito(object):
                             self.logger.error("Action \"tag\" must be in format: tag=Foo:Bar")
                             sys.exit(1)
 
+                    elif action_type == "digest":
+                        try:
+                            if not re.fullmatch('[0-9]+[smhd]?', action.split("=")[1]):
+                                raise Exception
+
+                        except Exception:
+                            self.logger.error("Action \"digest\" must be in format: digest=1s|2m|3h|4d")
+                            sys.exit(1)
+
+                    elif action_type == "parser":
+                        try:
+                            if action.split("=")[1] not in ["auto", "lxml", "feedparser"]:
+                                raise Exception
+
+                        except Exception:
+                            self.logger.error("Action \"parser\" must be in format: parser=auto|lxml|feedparser")
+                            sys.exit(1)
+
                     elif action_type == "priority":
                         try:
                             priority_type = action.split("=")[1]
@@ -905,6 +346,8 @@ class Mosquito(object):
     def _validate_confirmation(self, question):
         """ Ask user confirmation """
 
+        from distutils.util import strtobool
+
         sys.stdout.write('%s [y/n]: ' % question)
 
         while True:
@@ -925,6 +368,9 @@ class Mosquito(object):
 
     def _validate_destination(self, params):
         """ Validate destinations  """
+
+        import validators
+
         status = True
 
         if params:
@@ -932,10 +378,10 @@ class Mosquito(object):
                 try:
                     k, v = param.split(":", 1)
 
-                    if k not in ["exec", "mail"]:
+                    if k not in ["exec", "execbatch", "mail"]:
                         raise NameError("There are no valid destinations!")
 
-                    if k == "exec":
+                    if k == "exec" or k == "execbatch":
                         if not os.path.isfile(v):
                             raise NameError("There is no valid executable file!")
 
@@ -985,6 +431,17 @@ class Mosquito(object):
                 self.logger.error("Time interval must be a digit or a digit with suffix: {}".format(interval))
                 sys.exit(1)
 
+    def _validate_ids(self, ids):
+        """ IDs of configurations are numbers """
+
+        if ids:
+            for id in ids:
+                if not str(id).isdigit():
+                    self.logger.error("ID of a configuration must be a number: {}".format(id))
+                    sys.exit(1)
+
+        return ids
+
     def _validate_images_settings(self, params):
         status = True
 
@@ -1001,6 +458,18 @@ class Mosquito(object):
                         if not v:
                             raise Exception
 
+                    elif k == "edge" or k == "quality":
+                        if not v.isdigit():
+                            raise Exception
+
+                    elif k == "convert":
+                        if v.lower() not in ["jpeg", "png", "webp"]:
+                            raise Exception
+
+                    elif k == "strip":
+                        if v.lower() not in ["true", "false"]:
+                            raise Exception
+
                 except:
                     status = False
 
@@ -1092,6 +561,9 @@ class Mosquito(object):
         "id": all or a space separated list of IDs
         """
 
+        plugins = []
+        ids = self._validate_ids(args.id)
+
         if args.plugin:
             for plugin in args.plugin:
                 self.logger.info(
@@ -1099,63 +571,194 @@ class Mosquito(object):
                 )
 
                 if self._validate_confirmation('Please, confirm plugin deletion'):
-                    self.db.delete(plugin, None)
+                    plugins.append(plugin)
+
+        if ids:
+            self.logger.info('IDs have been selected for deletion: {}'.format(' '.join(str(i) for i in ids)))
+
+            if not self._validate_confirmation('Please, confirm ID deletion'):
+                ids = None
+
+        # All selected configurations are deleted in one transaction
+        if plugins or ids:
+            self.db.delete(plugins, ids)
+
+        # Try to clean database
+        self.db.clean()
+
+    def daemon(self, args):
+        """ Fetch data and drain the archive periodically """
+
+        flock = self._lock()
+        dp = None
+
+        if args.interval:
+            interval = int(self._validate_interval(args.interval))
+        else:
+            interval = self.settings.daemon_interval_seconds
+
+        self.logger.info("Daemon mode, fetch interval: {}".format(self._human_time(interval)))
+
+        if self.settings.metrics_port:
+            from mosquito.metrics import start_metrics_server
+
+            start_metrics_server(self.settings.metrics_port)
+
+            self.logger.info("Metrics are available on: http://127.0.0.1:{}/metrics".format(self.settings.metrics_port))
+
+        try:
+            while True:
+                # Pick up changes of the configuration file, workers will inherit new settings
+                if reload_settings():
+                    self.settings = get_settings()
+
+                    setup_logging(self.settings)
+
+                    if not args.interval:
+                        interval = self.settings.daemon_interval_seconds
+
+                    if dp:
+                        dp.terminate()
+                        dp.join()
+
+                # Drain the archive in a dedicated process, restart it if it has died
+                if not dp or not dp.is_alive():
+                    dp = multiprocessing.Process(target=self._drain().run, args=(self.settings.drain_interval_seconds,))
+                    dp.daemon = True
+                    dp.start()
+
+                self._fetch(args.plugin, args.id, False)
+
+                time.sleep(interval)
 
-        if args.id:
-            self.logger.info('IDs have been selected for deletion: {}'.format(' '.join(str(i) for i in args.id)))
+        except KeyboardInterrupt:
+            pass
+
+        finally:
+            self._unlock(flock)
+
+    def drain(self, args):
+        """ Send archived data to a SMTP server """
+
+        if not self._drain().drain(args.retries):
+            sys.exit(1)
+
+        # Try to clean database
+        self.db.clean()
+
+    def export_configs(self, args):
+        """ Write configurations to a file or stdout (JSON Lines or OPML) """
 
-            if self._validate_confirmation('Please, confirm ID deletion'):
-                for id in args.id:
-                    self.db.delete(None, id)
+        from mosquito.transfer import MosquitoTransfer
+
+        configs = self.db.stream(self._validate_plugin(args.plugin), self._validate_ids(args.id))
+
+        if args.file:
+            with open(args.file, 'w', encoding='utf-8') as f:
+                count = MosquitoTransfer().write(f, args.format, configs)
+        else:
+            count = MosquitoTransfer().write(sys.stdout, args.format, configs)
+
+        self.logger.info("Configurations have been exported: {}".format(count))
 
     def fetch(self, args):
         """ Fetch data from source """
 
-        # Set lock
+        flock = self._lock()
+
+        self._fetch(args.plugin, args.id, args.force, args.profile, args.profile_top)
+
+        self._unlock(flock)
+
+    def _import_row(self, row, args):
+        """ Validate a configuration from an import file, fields which are not set are taken from arguments """
+
+        def as_list(value, default):
+            if value is None:
+                return default
+
+            return value if isinstance(value, list) else [value]
+
+        enabled = str(row.get('enabled', 'True'))
+
+        if enabled not in ['True', 'False']:
+            self.logger.error("Status of a configuration must be True or False: {}".format(enabled))
+            sys.exit(1)
+
+        plugin = self._validate_plugin(row.get('plugin', 'rss'))
+        source = row.get('source')
+
+        if not source:
+            self.logger.error("Source of a configuration is not set")
+            sys.exit(1)
+
+        destination = self._validate_destination(as_list(row.get('destination'), args.destination))
+        update_alert = self._validate_interval(str(row.get('update_alert') or args.update_alert))
+        update_interval = self._validate_interval(str(row.get('update_interval') or args.update_interval))
+        description = self._validate_description([row['description']] if row.get('description') else None)
+        regex = as_list(row.get('regex'), args.regex)
+        regex_action = self._validate_action(destination, as_list(row.get('regex_action'), args.regex_action))
+        images_settings = self._validate_images_settings(as_list(row.get('images_settings'), args.images_settings))
+        url_tags = self._validate_url_tags(as_list(row.get('url_tags'), args.url_tags))
+
+        return [
+            enabled, plugin, source, destination, update_alert, update_interval, description, regex, regex_action,
+            row.get('timestamp', '0'), row.get('counter', '0'), row.get('alert_timestamp', '0'), images_settings,
+            url_tags
+        ]
+
+    def import_configs(self, args):
+        """
+        Create configurations from a file (JSON Lines or OPML). All of them are validated first and created in one
+        transaction, sources which already exist are skipped.
+        """
+
+        from mosquito.transfer import MosquitoTransfer
+
+        file_format = args.format or ('opml' if args.file.lower().endswith(('.opml', '.xml')) else 'jsonl')
+
         try:
-            flock = open(self.settings.lock_file, 'a')
-            fcntl.flock(flock, fcntl.LOCK_EX | fcntl.LOCK_NB)
-        except BlockingIOError:
-            self.logger.error('Mosquito already running. Cannot set lock on: {}'.format(self.settings.lock_file))
+            with open(args.file, encoding='utf-8') as f:
+                rows = MosquitoTransfer().read(f, file_format)
+
+        except Exception as error:
+            self.logger.error("Cannot read configurations: {} -> {}".format(args.file, error))
             sys.exit(1)
 
-        configs = []
+        existing = set((x[2], x[3]) for x in self.db.stream())
 
-        if not args.plugin and not args.id:
-            configs = self.db.list('all', 'all')
+        configs = []
+        errors = 0
+        skipped = 0
 
-        elif args.plugin and not args.id:
-            for plugin in args.plugin:
-                configs = configs + self.db.list(plugin, 'all')
+        for number, row in enumerate(rows, 1):
+            try:
+                config = self._import_row(row, args)
 
-        elif not args.plugin and args.id:
-            for id in args.id:
-                configs = configs + self.db.list('all', id)
+            except SystemExit:
+                self.logger.error("Configuration cannot be imported: #{} {}".format(number, row.get('source')))
+                errors += 1
+                continue
 
-        elif args.plugin and args.id:
-            for plugin in args.plugin:
-                configs = configs + self.db.list(plugin, 'all')
-            for id in args.id:
-                configs = configs + self.db.list('all', id)
+            if (config[1], config[2]) in existing:
+                skipped += 1
+                continue
 
-        configs = list(set(configs))
+            existing.add((config[1], config[2]))
+            configs.append(config)
 
-        if configs:
-            self.logger.debug("Configurations were retrieved: {}".format(len(configs)))
+        if errors:
+            self.logger.error("Nothing has been imported, invalid configurations: {}".format(errors))
+            sys.exit(1)
 
-            pf = MosquitoParallelFetching(args.force, self.settings)
-            pf.run(configs)
-        else:
-            self.logger.info("There are no configurations!")
+        if skipped:
+            self.logger.info("Configurations already exist, skipping: {}".format(skipped))
 
-        # Unset lock
-        try:
-            fcntl.flock(flock, fcntl.LOCK_UN)
-        except:
-            pass
+        if configs and not self.db.create_many(configs):
+            sys.exit(1)
 
     def list(self, args):
-        """ List configurations """
+        """ List configurations as a table or stream them as JSON/CSV """
 
         if args.full:
             table = [[
@@ -1167,26 +770,29 @@ class Mosquito(object):
                 'ID', 'Source', 'Destination', 'Regex', 'Regex Action', 'Images', 'URL Tags'
             ]]
 
-        configs = []
+        updated_before = None
 
-        if not args.plugin and not args.id:
-            configs = self.db.list('all', 'all')
+        if args.stale_since:
+            updated_before = time.mktime(datetime.utcnow().timetuple()) - int(self._validate_interval(args.stale_since))
 
-        elif args.plugin and not args.id:
-            for plugin in args.plugin:
-                configs = configs + self.db.list(plugin, 'all')
+        if (args.limit is not None and args.limit < 1) or args.offset < 0:
+            self.logger.error("Limit must be a positive number and offset mustn't be negative: {} {}".format(
+                args.limit, args.offset))
+            sys.exit(1)
 
-        elif not args.plugin and args.id:
-            for id in args.id:
-                configs = configs + self.db.list('all', id)
+        # Filters, sorting and pagination are done by SQL
+        configs = self.db.stream(
+            self._validate_plugin(args.plugin), self._validate_ids(args.id), args.source, args.destination,
+            args.enabled, updated_before, {'update': 'timestamp', 'count': 'counter'}.get(args.sort, args.sort),
+            args.reverse, args.limit, args.offset
+        )
 
-        elif args.plugin and args.id:
-            for plugin in args.plugin:
-                configs = configs + self.db.list(plugin, 'all')
-            for id in args.id:
-                configs = configs + self.db.list('all', id)
+        if args.format != 'table':
+            from mosquito.transfer import MosquitoTransfer
 
-        configs = sorted(list(set(configs)))
+            MosquitoTransfer().write(sys.stdout, args.format, configs)
+
+            return
 
         if configs:
             for config in configs:
@@ -1220,6 +826,8 @@ class Mosquito(object):
                         ])
 
         if len(table) > 1:
+            from terminaltables import AsciiTable
+
             table = AsciiTable(table)
             table.inner_row_border = True
 
@@ -1251,111 +859,156 @@ class Mosquito(object):
             self.logger.info('There are no configurations!')
     
     def set(self, args):
-        """ Set parameters for configurations """
+        """ Set parameters for configurations, all selected configurations are updated by one statement """
 
-        ids = args.id
-        enabled = args.enabled
+        ids = self._validate_ids(args.id)
         plugins = self._validate_plugin(args.plugin)
-        source = args.source
-        destination = args.destination
-        update_alert = self._validate_interval(args.update_alert)
-        update_interval = self._validate_interval(args.update_interval)
-        description = self._validate_description(args.description)
-        regex = args.regex
-        regex_action = args.regex_action
-        images_settings = self._validate_images_settings(args.images_settings)
-        url_tags = self._validate_url_tags(args.url_tags)
-
-        configs = []
+        destination = self._validate_destination(args.destination)
 
         if not plugins and not ids:
             self.logger.error("You must choose --id and/or --plugin parameters")
             sys.exit(1)
 
-        elif plugins and not ids:
-            for plugin in plugins:
-                configs = configs + self.db.list(plugin, 'all')
+        # Changed columns only
+        fields = {}
 
-        elif not plugins and ids:
-            for id in ids:
-                configs = configs + self.db.list('all', id)
+        if args.enabled == "True" or args.enabled == "False":
+            fields['enabled'] = args.enabled
 
-        elif plugins and ids:
-            for plugin in plugins:
-                configs = configs + self.db.list(plugin, 'all')
-            for id in ids:
-                configs = configs + self.db.list('all', id)
+        if args.source:
+            fields['source'] = args.source
 
-        configs = sorted(list(set(configs)))
+        if destination:
+            fields['destination'] = destination
 
-        if configs:
-            if self._validate_confirmation('Please, confirm configurations changes'):
-                for config in configs:
-                    config_id = config[0]
+        if args.update_alert:
+            fields['update_alert'] = self._validate_interval(args.update_alert)
 
-                    if enabled != "True" and enabled != "False":
-                        config_enabled = config[1]
-                    else:
-                        config_enabled = enabled
+        if args.update_interval:
+            fields['update_interval'] = self._validate_interval(args.update_interval)
 
-                    if source:
-                        config_source = source
-                    else:
-                        config_source = config[3]
+        if args.description:
+            fields['description'] = self._validate_description(args.description)
 
-                    if destination:
-                        config_destination = self._validate_destination(destination)
-                    else:
-                        config_destination = ast.literal_eval(config[4])
+        if args.regex:
+            fields['regexp'] = args.regex
 
-                    if update_alert:
-                        config_update_alert = update_alert
-                    else:
-                        config_update_alert = config[5]
+        if args.images_settings:
+            fields['images_settings'] = self._validate_images_settings(args.images_settings)
 
-                    if update_interval:
-                        config_update_interval = update_interval
-                    else:
-                        config_update_interval = config[6]
+        if args.url_tags:
+            fields['url_tags'] = self._validate_url_tags(args.url_tags)
 
-                    if description:
-                        config_description = description
-                    else:
-                        config_description = config[7]
+        # Actions depend on destinations: new actions are checked against destinations of every configuration,
+        # actions of every configuration are checked against new destinations
+        if args.regex_action:
+            for config_destination in [destination] if destination else self.db.distinct('destination', plugins, ids):
+                if not isinstance(config_destination, list):
+                    config_destination = ast.literal_eval(config_destination)
 
-                    if regex:
-                        config_regex = regex
-                    else:
-                        config_regex = config[8]
+                self._validate_action(config_destination, args.regex_action)
 
-                    if regex_action:
-                        config_regex_action = self._validate_action(config_destination, regex_action)
-                    else:
-                        config_regex_action = self._validate_action(config_destination, ast.literal_eval(config[9]))
+            fields['regexp_action'] = args.regex_action
 
-                    if images_settings:
-                        config_images_settings = images_settings
-                    else:
-                        config_images_settings = config[13]
+        elif destination:
+            for config_regex_action in self.db.distinct('regexp_action', plugins, ids):
+                self._validate_action(destination, ast.literal_eval(config_regex_action))
 
-                    if url_tags:
-                        config_url_tags = url_tags
-                    else:
-                        config_url_tags = config[14]
+        if not fields:
+            self.logger.info("There are no changes!")
+            return
 
-                    config_plugin = config[2]
-                    config_timestamp = config[10]
-                    config_counter = config[11]
-                    config_alert_timestamp = config[12]
+        count = self.db.count(plugins, ids)
 
-                    self.db.update(
-                        config_id, config_enabled, config_plugin, config_source, config_destination, config_update_alert,
-                        config_update_interval, config_description, config_regex, config_regex_action, config_timestamp,
-                        config_counter, config_alert_timestamp, config_images_settings, config_url_tags
-                    )
+        if count:
+            self.logger.info("Configurations have been selected for changes: {}".format(count))
+
+            if self._validate_confirmation('Please, confirm configurations changes'):
+                if self.db.update_many(plugins, ids, fields) is False:
+                    sys.exit(1)
         else:
             self.logger.info("There are no configurations for changes!")
 
+    def stats(self, args):
+        """ Show statistics of sources over a time window """
+
+        window = int(self._validate_interval(args.window))
+        since = time.time() - window
+
+        sources = self.db.stats_journal(since, args.id)
+
+        if not sources:
+            self.logger.info("There are no journaled runs during the window: {}".format(args.window))
+            return
+
+        # Run durations are ordered by configuration and duration
+        durations = {}
+
+        for config_id, duration in self.db.durations_journal(since, args.id):
+            durations.setdefault(config_id, []).append(duration)
+
+        from terminaltables import AsciiTable
+
+        stats = []
+
+        # config_id, plugin, source, runs, failing runs, entries, matched, grabbed, delivered, failed, feed bytes,
+        # run time, time per stage
+        for source in sources:
+            values = durations.get(source[0], [])
+
+            stats.append({
+                'row': source,
+                'p50': self._percentile(values, 50),
+                'p95': self._percentile(values, 95),
+                'p99': self._percentile(values, 99),
+                'throughput': source[5] / source[11] if source[11] else 0
+            })
+
+        # ----------------------------------------------------------------------------
+
+        table = [['ID', 'Plugin', 'Source', 'Runs', 'Entries', 'Matched', 'Grabbed', 'Delivered', 'Failed', 'KiB',
+                  'Entries/s', 'p50', 'p95', 'p99']]
+
+        for item in sorted(stats, key=lambda x: x['row'][0]):
+            row = item['row']
+
+            table.append(
+                [row[0], row[1], '\n'.join(wrap(str(row[2]))), row[3], row[5], row[6], row[7], row[8], row[9],
+                 int(row[10] / 1024), '{:.1f}'.format(item['throughput']), '{:.3f}'.format(item['p50']),
+                 '{:.3f}'.format(item['p95']), '{:.3f}'.format(item['p99'])]
+            )
+
+        print(AsciiTable(table, 'Sources for {} (seconds)'.format(args.window)).table)
+
+        # ----------------------------------------------------------------------------
+
+        table = [['ID', 'Source', 'Runs', 'p95', 'Fetch', 'Regex', 'Grab', 'Mail', 'Exec', 'DB']]
+
+        for item in sorted(stats, key=lambda x: x['p95'], reverse=True)[:args.top]:
+            row = item['row']
+
+            table.append(
+                [row[0], '\n'.join(wrap(str(row[2]))), row[3], '{:.3f}'.format(item['p95'])] +
+                ['{:.3f}'.format(x / row[3]) for x in row[12:18]]
+            )
+
+        print(AsciiTable(table, 'Slowest sources (average per run, seconds)').table)
+
+        # ----------------------------------------------------------------------------
+
+        table = [['ID', 'Source', 'Runs', 'Failing runs', 'Failed deliveries']]
+
+        for item in sorted(stats, key=lambda x: (x['row'][4], x['row'][9]), reverse=True)[:args.top]:
+            row = item['row']
+
+            if row[4]:
+                table.append([row[0], '\n'.join(wrap(str(row[2]))), row[3], row[4], row[9]])
+
+        if len(table) > 1:
+            print(AsciiTable(table, 'Most failing sources').table)
+        else:
+            self.logger.info("There are no failing sources during the window: {}".format(args.window))
+
 
 def main():
     Mosquito()
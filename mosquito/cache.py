@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import os
+import requests
+import sqlite3
+import time
+import zlib
+
+from email.utils import parsedate_to_datetime
+
+from mosquito.deadline import remaining
+from mosquito.message import url_hash
+from mosquito.metrics import get_metrics
+from mosquito.settings import get_settings
+
+# HTTP cache of a pool worker, all workers share the same storage
+_http_cache = None
+
+# Heuristic freshness of responses with Last-Modified only: a part of their age, but not more than a day
+HEURISTIC_FRACTION = 0.1
+HEURISTIC_MAX = 86400
+
+# Version of the cache schema, a cache of another version is dropped
+CACHE_VERSION = 1
+
+
+def get_http_cache():
+    """ Return the HTTP cache of the current process """
+
+    global _http_cache
+
+    if not _http_cache:
+        _http_cache = MosquitoHTTPCache()
+
+    return _http_cache
+
+
+def read_response(r, max_size, timeout=None):
+    """
+    Body of a streamed response, ValueError if it's larger than max_size (0 - no limit), TimeoutError if it takes
+    longer than "timeout" seconds (a server which sends data slowly doesn't hit the read timeout of requests)
+    """
+
+    deadline = time.monotonic() + timeout if timeout else None
+
+    length = r.headers.get('Content-Length', '')
+
+    if max_size and length.isdigit() and int(length) > max_size:
+        raise ValueError("Response is too large: {} > {} bytes".format(length, max_size))
+
+    chunks = []
+    size = 0
+
+    for chunk in r.iter_content(65536):
+        size += len(chunk)
+
+        if max_size and size > max_size:
+            raise ValueError("Response is too large: > {} bytes".format(max_size))
+
+        if deadline and time.monotonic() > deadline:
+            raise TimeoutError("Response is read longer than {:.1f}s".format(timeout))
+
+        chunks.append(chunk)
+
+    return b''.join(chunks)
+
+
+class MosquitoHTTPCache(object):
+    """
+    On-disk cache of grabbed web-pages and images (http_cache_path). Responses are stored compressed in a SQLite
+    database which is shared by pool workers, freshness and validators (ETag, Last-Modified) follow Cache-Control and
+    Expires headers. A response with Vary is used only for the same values of the named request headers. The least
+    recently used responses are dropped when the cache exceeds http_cache_size.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger('[CACHE]')
+        self.settings = get_settings()
+
+        self.path = self.settings.http_cache_path
+        self.size = self.settings.http_cache_size
+        self.conn = None
+
+    def _logger(self, level, message):
+        if level == "debug":
+            self.logger.debug(message)
+        elif level == "error":
+            self.logger.error(message)
+        elif level == "info":
+            self.logger.info(message)
+        elif level == "warning":
+            self.logger.warning(message)
+
+    def _connect(self):
+        if not self.conn:
+            os.makedirs(self.path, exist_ok=True)
+
+            conn = sqlite3.connect(os.path.join(self.path, 'cache.sqlite3'), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+
+            # INSERT OR REPLACE fires delete triggers only with recursive triggers
+            conn.execute("PRAGMA recursive_triggers = ON")
+
+            if conn.execute("PRAGMA user_version").fetchone()[0] < CACHE_VERSION:
+                # Other workers could create the cache at the same time
+                conn.execute("BEGIN IMMEDIATE")
+
+                if conn.execute("PRAGMA user_version").fetchone()[0] < CACHE_VERSION:
+                    self._create(conn)
+
+                conn.execute("COMMIT")
+
+            self.conn = conn
+
+        return self.conn
+
+    def _create(self, conn):
+        """ Schema of the cache, a cache of an older version is dropped """
+
+        conn.execute("DROP TABLE IF EXISTS response")
+        conn.execute("DROP TABLE IF EXISTS response_size")
+
+        conn.execute(
+            """CREATE TABLE response (
+                                      key TEXT PRIMARY KEY NOT NULL,
+                                      url TEXT NOT NULL,
+                                      body BLOB NOT NULL,
+                                      size INTEGER NOT NULL,
+                                      expires REAL NOT NULL,
+                                      etag TEXT,
+                                      last_modified TEXT,
+                                      vary TEXT,
+                                      accessed REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX response_accessed ON response (accessed)")
+
+        # A running total, eviction doesn't scan the whole cache after every stored response
+        conn.execute(
+            """CREATE TABLE response_size (
+                                           id INTEGER PRIMARY KEY NOT NULL,
+                                           bytes INTEGER NOT NULL
+            )
+            """
+        )
+        conn.execute("INSERT INTO response_size (id, bytes) VALUES (0, 0)")
+
+        conn.execute(
+            """CREATE TRIGGER response_size_insert AFTER INSERT ON response BEGIN
+                UPDATE response_size SET bytes = bytes + NEW.size WHERE id = 0;
+            END
+            """
+        )
+        conn.execute(
+            """CREATE TRIGGER response_size_delete AFTER DELETE ON response BEGIN
+                UPDATE response_size SET bytes = bytes - OLD.size WHERE id = 0;
+            END
+            """
+        )
+
+        conn.execute("PRAGMA user_version = {}".format(CACHE_VERSION))
+
+    def _vary(self, vary, headers):
+        """ Values of request headers which are named in a Vary header of a response, as JSON """
+
+        names = sorted(set(x.strip().lower() for x in vary.split(',') if x.strip()))
+
+        if not names:
+            return None
+
+        headers = {k.lower(): v for k, v in headers.items()}
+
+        return json.dumps({name: headers.get(name) for name in names}, sort_keys=True)
+
+    def _freshness(self, headers):
+        """ Lifetime of a response in seconds, None if it must not be stored """
+
+        cache_control = {}
+
+        for directive in headers.get('Cache-Control', '').lower().split(','):
+            name, _, value = directive.strip().partition('=')
+            cache_control[name] = value.strip('"')
+
+        if 'no-store' in cache_control or headers.get('Vary', '').strip() == '*':
+            return None
+
+        if 'no-cache' in cache_control:
+            return 0
+
+        # A missing or invalid Date is replaced with the time of receipt
+        try:
+            date = parsedate_to_datetime(headers['Date']).timestamp()
+        except (KeyError, TypeError, ValueError, IndexError, OverflowError):
+            date = time.time()
+
+        # Time a response has already spent in other caches (RFC 9111, section 4.2.3)
+        try:
+            age = max(0, int(headers.get('Age', 0)), time.time() - date)
+        except ValueError:
+            age = max(0, time.time() - date)
+
+        try:
+            if 'max-age' in cache_control:
+                return max(0, int(cache_control['max-age']) - age)
+
+            if 'Expires' in headers:
+                return max(0, parsedate_to_datetime(headers['Expires']).timestamp() - date - age)
+
+            if 'Last-Modified' in headers:
+                modified = date - parsedate_to_datetime(headers['Last-Modified']).timestamp()
+                return max(0, min(HEURISTIC_MAX, modified * HEURISTIC_FRACTION) - age)
+
+        except (TypeError, ValueError, IndexError, OverflowError):
+            # Invalid dates mean that a response is already expired
+            return 0
+
+        return 0
+
+    def _lookup(self, key):
+        return self._connect().execute(
+            "SELECT body, expires, etag, last_modified, vary FROM response WHERE key = ?", [key]
+        ).fetchone()
+
+    def _store(self, key, url, content, lifetime, headers, vary):
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+
+        # A response which is neither fresh nor can be revalidated is useless
+        if lifetime is None or (not lifetime and not etag and not last_modified):
+            return
+
+        body = zlib.compress(content)
+
+        # One response must not push out a big part of the cache
+        if len(body) > self.size / 4:
+            return
+
+        now = time.time()
+        conn = self._connect()
+
+        conn.execute(
+            """INSERT OR REPLACE INTO response (key, url, body, size, expires, etag, last_modified, vary, accessed)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            [key, url, sqlite3.Binary(body), len(body), now + lifetime, etag, last_modified, vary, now]
+        )
+
+        self._evict(conn)
+
+    def _evict(self, conn):
+        """ Drop the least recently used responses down to 90% of the cache size """
+
+        total = conn.execute("SELECT bytes FROM response_size WHERE id = 0").fetchone()[0]
+
+        if total <= self.size:
+            return
+
+        keys = []
+
+        for key, size in conn.execute("SELECT key, size FROM response ORDER BY accessed"):
+            if total <= self.size * 0.9:
+                break
+
+            keys.append(key)
+            total -= size
+
+        conn.execute("BEGIN IMMEDIATE")
+
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            conn.execute("DELETE FROM response WHERE key IN ({})".format(", ".join("?" * len(chunk))), chunk)
+
+        conn.execute("COMMIT")
+
+        self._logger(
+            "debug",
+            "Responses have been evicted from the cache: {}".format(len(keys))
+        )
+
+    def get(self, url, headers, verify, key=None):
+        """
+        Body of a response: from the cache if it's fresh or not modified, otherwise from the network within
+        grab_timeout and the time budget of a configuration. "key" - a hash of the URL if it's already known.
+        """
+
+        metrics = get_metrics()
+
+        if not self.size:
+            timeout = remaining(self.settings.grab_timeout)
+
+            with requests.get(url, headers=headers, verify=verify, stream=True, timeout=timeout) as r:
+                content = read_response(r, self.settings.http_max_size, timeout)
+                metrics.inc('mosquito_downloaded_bytes_total', len(content), stage='grab')
+
+                return content
+
+        key = key or url_hash(url)
+        cached = None
+
+        try:
+            cached = self._lookup(key)
+
+            # A response which varies on request headers is only used for the same values of them
+            if cached and cached[4] and self._vary(','.join(json.loads(cached[4])), headers) != cached[4]:
+                cached = None
+
+            if cached and cached[1] > time.time():
+                self._connect().execute("UPDATE response SET accessed = ? WHERE key = ?", [time.time(), key])
+                metrics.inc('mosquito_http_cache_total', result='hit')
+
+                return zlib.decompress(cached[0])
+
+        except (sqlite3.Error, OSError, zlib.error) as error:
+            self._logger(
+                "warning",
+                "Cannot read the HTTP cache: {}".format(error)
+            )
+
+            cached = None
+
+        # Validators of a stale response
+        if cached:
+            headers = dict(headers)
+
+            if cached[2]:
+                headers['If-None-Match'] = cached[2]
+            if cached[3]:
+                headers['If-Modified-Since'] = cached[3]
+
+        timeout = remaining(self.settings.grab_timeout)
+
+        with requests.get(url, headers=headers, verify=verify, stream=True, timeout=timeout) as r:
+            content = read_response(r, self.settings.http_max_size, timeout)
+            metrics.inc('mosquito_downloaded_bytes_total', len(content), stage='grab')
+
+            if r.status_code == 304 and cached:
+                metrics.inc('mosquito_http_cache_total', result='revalidated')
+                content = zlib.decompress(cached[0])
+            else:
+                metrics.inc('mosquito_http_cache_total', result='miss')
+
+            try:
+                if r.status_code == 304 and cached:
+                    self._connect().execute(
+                        "UPDATE response SET expires = ?, accessed = ? WHERE key = ?",
+                        [time.time() + (self._freshness(r.headers) or 0), time.time(), key]
+                    )
+
+                elif r.status_code == 200:
+                    self._store(key, url, content, self._freshness(r.headers), r.headers,
+                                self._vary(r.headers.get('Vary', ''), headers))
+
+            except (sqlite3.Error, OSError, zlib.error) as error:
+                self._logger(
+                    "warning",
+                    "Cannot write the HTTP cache: {}".format(error)
+                )
+
+        return content
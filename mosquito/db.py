@@ -1,17 +1,23 @@
 #!/usr/bin/env python3
 
+import ast
 import os
 import logging
 import sys
 import sqlite3
+import time
 
+from datetime import datetime
+from mosquito.metrics import get_metrics
+
+# Columns of the configuration table in order
+COLUMNS = ['id', 'enabled', 'plugin', 'source', 'destination', 'update_alert', 'update_interval', 'description',
+           'regexp', 'regexp_action', 'timestamp', 'counter', 'alert_timestamp', 'images_settings', 'url_tags']
 
-class MosquitoDB(object):
 
-    def __init__(self, id=None, queue=None):
-        self.id = id
-        self.queue = queue
+class MosquitoDB(object):
 
+    def __init__(self):
         self.db = os.path.join(os.environ['HOME'], '.mosquito.sqlite3')
         self.logger = logging.getLogger('[DB]')
 
@@ -69,25 +75,205 @@ class MosquitoDB(object):
                 )
                 sys.exit(1)
 
-    def _logger(self, level, message):
-        """ Log with logger, or put message to a queue """
+        self._upgrade()
 
-        if self.id and self.queue:
-            self.queue.put([
-                self.id,
-                level,
-                message
-            ])
+    def _delete_ids(self, conn, table, ids):
+        """ Delete records by IDs, keep amount of SQL variables under the SQLite limit """
 
-        else:
-            if level == "debug":
-                self.logger.debug(message)
-            elif level == "error":
-                self.logger.error(message)
-            elif level == "info":
-                self.logger.info(message)
-            elif level == "warning":
-                self.logger.warning(message)
+        ids = list(ids)
+
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            conn.execute("DELETE FROM {} WHERE id IN ({})".format(table, ", ".join("?" * len(chunk))), chunk)
+
+    def _upgrade(self):
+        """ Bring the database schema up to date, PRAGMA user_version is a number of applied upgrades """
+
+        upgrades = [
+            self._upgrade_archive_retention,
+            self._upgrade_journal,
+            self._upgrade_journal_exec,
+            self._upgrade_digest,
+            self._upgrade_source_state,
+            self._upgrade_digest_images,
+            self._upgrade_digest_recipients
+        ]
+
+        try:
+            conn = sqlite3.connect(self.db, isolation_level=None)
+
+            if conn.execute("PRAGMA user_version").fetchone()[0] < len(upgrades):
+                # Other processes could upgrade the database at the same time
+                conn.execute("BEGIN IMMEDIATE")
+
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+
+                for upgrade in upgrades[version:]:
+                    upgrade(conn)
+
+                conn.execute("PRAGMA user_version = {}".format(len(upgrades)))
+                conn.execute("COMMIT")
+
+                self._logger(
+                    "debug",
+                    "Database has been upgraded: {} -> {}".format(version, len(upgrades))
+                )
+
+            conn.close()
+
+        except Exception as error:
+            self._logger(
+                "error",
+                "Cannot upgrade a database: {}".format(error)
+            )
+            sys.exit(1)
+
+    def _upgrade_archive_retention(self, conn):
+        """ Size of every archived record, a running size counter and indexes for retention """
+
+        conn.execute("ALTER TABLE archive ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+        conn.execute(
+            """UPDATE archive SET size = ifnull(length(CAST(header AS BLOB)), 0) + 
+                                         ifnull(length(CAST(subject AS BLOB)), 0) + 
+                                         ifnull(length(CAST(original_content AS BLOB)), 0) + 
+                                         ifnull(length(CAST(grabbed_html AS BLOB)), 0) + 
+                                         ifnull(length(grabbed_screenshot), 0) + 
+                                         ifnull(length(CAST(grabbed_text AS BLOB)), 0)"""
+        )
+
+        conn.execute("CREATE INDEX archive_timestamp ON archive (timestamp)")
+        conn.execute("CREATE INDEX archive_source_id_timestamp ON archive (source_id, timestamp)")
+
+        conn.execute(
+            """CREATE TABLE archive_size (
+                                        id INTEGER PRIMARY KEY NOT NULL CHECK (id = 0),
+                                        rows INTEGER NOT NULL,
+                                        bytes INTEGER NOT NULL
+            )
+            """
+        )
+        conn.execute("INSERT INTO archive_size (id, rows, bytes) SELECT 0, COUNT(*), ifnull(SUM(size), 0) FROM archive")
+
+        conn.execute(
+            """CREATE TRIGGER archive_size_insert AFTER INSERT ON archive BEGIN
+                UPDATE archive_size SET rows = rows + 1, bytes = bytes + NEW.size WHERE id = 0;
+            END
+            """
+        )
+        conn.execute(
+            """CREATE TRIGGER archive_size_delete AFTER DELETE ON archive BEGIN
+                UPDATE archive_size SET rows = rows - 1, bytes = bytes - OLD.size WHERE id = 0;
+            END
+            """
+        )
+
+    def _upgrade_journal(self, conn):
+        """ Results of every processed configuration per run """
+
+        conn.execute(
+            """CREATE TABLE journal (
+                                    id INTEGER PRIMARY KEY NOT NULL,
+                                    run INTEGER NOT NULL,
+                                    config_id INTEGER NOT NULL,
+                                    plugin TEXT NOT NULL,
+                                    source TEXT NOT NULL,
+                                    started REAL NOT NULL,
+                                    finished REAL NOT NULL,
+                                    http_status INTEGER,
+                                    feed_bytes INTEGER NOT NULL,
+                                    entries INTEGER NOT NULL,
+                                    matched INTEGER NOT NULL,
+                                    grabbed INTEGER NOT NULL,
+                                    delivered INTEGER NOT NULL,
+                                    failed INTEGER NOT NULL,
+                                    fetch_seconds REAL NOT NULL,
+                                    regex_seconds REAL NOT NULL,
+                                    grab_seconds REAL NOT NULL,
+                                    mail_seconds REAL NOT NULL,
+                                    exec_seconds REAL NOT NULL,
+                                    db_seconds REAL NOT NULL
+            )
+            """
+        )
+
+        # Statistics are always taken over a time window, per source or for all of them
+        conn.execute("CREATE INDEX journal_started ON journal (started)")
+        conn.execute("CREATE INDEX journal_config_id_started ON journal (config_id, started)")
+
+    def _upgrade_journal_exec(self, conn):
+        """ Failed exec destination scripts of a run: [exec path, exit code, stderr] """
+
+        conn.execute("ALTER TABLE journal ADD COLUMN exec_errors TEXT")
+
+    def _upgrade_digest(self, conn):
+        """ Messages which are waiting to be sent as a digest (digest=<interval> action) """
+
+        conn.execute(
+            """CREATE TABLE digest (
+                                    id INTEGER PRIMARY KEY NOT NULL,
+                                    config_id INTEGER NOT NULL,
+                                    title TEXT,
+                                    url TEXT,
+                                    grabbed_html TEXT,
+                                    grabbed_screenshot BLOB,
+                                    grabbed_text TEXT,
+                                    timestamp INTEGER NOT NULL
+            )
+            """
+        )
+
+        conn.execute("CREATE INDEX digest_config_id ON digest (config_id, timestamp)")
+
+    def _upgrade_digest_images(self, conn):
+        """ Grabbed images of digest messages, they are deleted together with a message """
+
+        conn.execute(
+            """CREATE TABLE digest_image (
+                                          id INTEGER PRIMARY KEY NOT NULL,
+                                          digest_id INTEGER NOT NULL,
+                                          data BLOB NOT NULL,
+                                          format TEXT NOT NULL,
+                                          name TEXT NOT NULL
+            )
+            """
+        )
+
+        conn.execute("CREATE INDEX digest_image_digest_id ON digest_image (digest_id)")
+
+        conn.execute(
+            """CREATE TRIGGER digest_image_delete AFTER DELETE ON digest BEGIN
+                DELETE FROM digest_image WHERE digest_id = OLD.id;
+            END
+            """
+        )
+
+    def _upgrade_digest_recipients(self, conn):
+        """ Recipients of a digest message which haven't got it yet, NULL - all mail destinations """
+
+        conn.execute("ALTER TABLE digest ADD COLUMN recipients TEXT")
+
+    def _upgrade_source_state(self, conn):
+        """ Position of a source plugin per configuration (e.g. the last seen tweet ID) """
+
+        conn.execute(
+            """CREATE TABLE source_state (
+                                          config_id INTEGER PRIMARY KEY NOT NULL,
+                                          state TEXT NOT NULL
+            )
+            """
+        )
+
+    def _logger(self, level, message):
+        """ Log with logger, pool workers send records to the main process """
+
+        if level == "debug":
+            self.logger.debug(message)
+        elif level == "error":
+            self.logger.error(message)
+        elif level == "info":
+            self.logger.info(message)
+        elif level == "warning":
+            self.logger.warning(message)
 
     def _sql_query(self, request):
         """ Execute SQL query """
@@ -116,16 +302,27 @@ class MosquitoDB(object):
             if grabbed_screenshot:
                 grabbed_screenshot = sqlite3.Binary(grabbed_screenshot)
 
+            headers = str(headers)
+
+            size = 0
+
+            for value in [headers, subject, original_content, grabbed_html, grabbed_screenshot, grabbed_text]:
+                if isinstance(value, str):
+                    size += len(value.encode('utf-8'))
+                elif value:
+                    size += len(value)
+
             sql = """INSERT INTO archive (
                                         source_id, destination, header, priority, 
                                         subject, original_content, grabbed_html, 
-                                        grabbed_screenshot, grabbed_text, timestamp) 
-                                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);"""
+                                        grabbed_screenshot, grabbed_text, timestamp, size) 
+                                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);"""
 
-            conn = sqlite3.connect(self.db)
-            conn.execute(sql, [config_id, str(destinations), str(headers), priority, subject, original_content,
-                               grabbed_html, grabbed_screenshot, grabbed_text, timestamp])
-            conn.commit()
+            with get_metrics().timer('mosquito_db_write_seconds', operation='add_archive'):
+                conn = sqlite3.connect(self.db)
+                conn.execute(sql, [config_id, str(destinations), headers, priority, subject, original_content,
+                                   grabbed_html, grabbed_screenshot, grabbed_text, timestamp, size])
+                conn.commit()
 
         except Exception as error:
             self._logger(
@@ -161,157 +358,724 @@ class MosquitoDB(object):
                 "Cannot create configuration: {}".format(error)
             )
         
-    def delete(self, plugin, id):
-        if plugin:
-            query = "DELETE FROM configuration WHERE plugin = '{}'".format(plugin)
-        elif id:
-            query = "DELETE FROM configuration WHERE id = '{}'".format(id)
+    def create_many(self, configs):
+        """
+        Create configurations in one transaction, every item is a list of create() arguments. Nothing is created if
+        any of them cannot be inserted.
+        """
 
-        results = self._sql_query(query)
+        try:
+            sql = """INSERT INTO configuration (
+                                                enabled, plugin, source, destination, 
+                                                update_alert, update_interval, 
+                                                description, regexp, regexp_action, 
+                                                timestamp, counter, alert_timestamp, images_settings, url_tags
+                                                ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?);"""
 
-        if isinstance(results, list):
-            if plugin:
-                self._logger(
-                    "info",
-                    "Plugin specific configurations were deleted: {}".format(plugin)
-                )
-            else:
-                self._logger(
-                    "info",
-                    "Configuration has been deleted: {}".format(id)
+            conn = sqlite3.connect(self.db)
+
+            with conn:
+                conn.executemany(
+                    sql,
+                    ([enabled, plugin, source, str(destination), update_alert, update_interval, description,
+                      str(regex), str(regex_action), timestamp, counter, alert_timestamp, str(images_settings),
+                      str(url_tags)]
+                     for enabled, plugin, source, destination, update_alert, update_interval, description, regex,
+                     regex_action, timestamp, counter, alert_timestamp, images_settings, url_tags in configs)
                 )
 
+            conn.close()
+
+            self._logger(
+                "info",
+                "Configurations have been created: {}".format(len(configs))
+            )
+
             return True
 
+        except Exception as error:
+            self._logger(
+                "error",
+                "Cannot create configurations: {}".format(error)
+            )
+
+            return False
+
+    def _selection(self, plugins, ids):
+        """ WHERE clause of configurations of plugins and/or IDs, all configurations if nothing is selected """
+
+        conditions = []
+        params = []
+
+        if plugins:
+            conditions.append("plugin IN ({})".format(", ".join("?" * len(plugins))))
+            params.extend(plugins)
+
+        # IDs are numbers, they are inlined to select thousands of configurations over the SQLite variables limit
+        if ids:
+            conditions.append("id IN ({})".format(", ".join(str(int(x)) for x in ids)))
+
+        if conditions:
+            return " WHERE " + " OR ".join(conditions), params
         else:
-            if plugin:
-                self._logger(
-                    "error",
-                    "Cannot delete plugin specific configurations: {}".format(plugin)
-                )
-            else:
-                self._logger(
-                    "error",
-                    "Cannot delete configuration: {}".format(id)
+            return "", params
+
+    def count(self, plugins=None, ids=None):
+        """ Amount of selected configurations """
+
+        where, params = self._selection(plugins, ids)
+
+        conn = sqlite3.connect(self.db)
+        result = conn.execute("SELECT COUNT(*) FROM configuration" + where, params).fetchone()[0]
+        conn.close()
+
+        return result
+
+    def distinct(self, column, plugins=None, ids=None):
+        """ Distinct values of a column of selected configurations """
+
+        if column not in COLUMNS:
+            raise ValueError("Unknown column: {}".format(column))
+
+        where, params = self._selection(plugins, ids)
+
+        conn = sqlite3.connect(self.db)
+        results = [x[0] for x in conn.execute("SELECT DISTINCT {} FROM configuration".format(column) + where, params)]
+        conn.close()
+
+        return results
+
+    def update_many(self, plugins, ids, fields):
+        """
+        Set fields ({column: value}, lists are saved as strings) of selected configurations in one statement, return
+        an amount of updated configurations or False
+        """
+
+        for column in fields:
+            if column not in COLUMNS:
+                raise ValueError("Unknown column: {}".format(column))
+
+        where, params = self._selection(plugins, ids)
+
+        try:
+            conn = sqlite3.connect(self.db)
+
+            with conn:
+                cursor = conn.execute(
+                    "UPDATE configuration SET {}".format(", ".join("{} = ?".format(x) for x in fields)) + where,
+                    [str(x) if isinstance(x, list) else x for x in fields.values()] + params
                 )
 
+            conn.close()
+
+            self._logger(
+                "info",
+                "Configurations have been updated: {}".format(cursor.rowcount)
+            )
+
+            return cursor.rowcount
+
+        except Exception as error:
+            self._logger(
+                "error",
+                "Cannot update configurations: {}".format(error)
+            )
+
+            return False
+
+    def delete(self, plugins=None, ids=None):
+        """
+        Delete selected configurations with their states, digests and archived messages in one transaction, return an
+        amount or False
+        """
+
+        if not plugins and not ids:
+            return 0
+
+        where, params = self._selection(plugins, ids)
+
+        try:
+            conn = sqlite3.connect(self.db)
+
+            with conn:
+                for table, column in [('source_state', 'config_id'), ('digest', 'config_id'), ('archive', 'source_id')]:
+                    conn.execute(
+                        "DELETE FROM {} WHERE {} IN (SELECT id FROM configuration{})".format(table, column, where),
+                        params
+                    )
+
+                cursor = conn.execute("DELETE FROM configuration" + where, params)
+
+            conn.close()
+
+            self._logger(
+                "info",
+                "Configurations have been deleted: {}".format(cursor.rowcount)
+            )
+
+            return cursor.rowcount
+
+        except Exception as error:
+            self._logger(
+                "error",
+                "Cannot delete configurations: {}".format(error)
+            )
+
             return False
 
-    def delete_archive(self, id):
-        query = "DELETE FROM archive WHERE id = '{}'".format(id)
-        results = self._sql_query(query)
+    def count_archive(self):
+        """ Number of archived records """
+
+        return self.size_archive()[0]
+
+    def size_archive(self):
+        """ Number of archived records and their total size """
+
+        results = self._sql_query("SELECT rows, bytes FROM archive_size WHERE id = 0")
 
         if isinstance(results, list):
+            return results[0]
+
+        else:
+            self._logger(
+                "error",
+                "Cannot count archived records"
+            )
+
+            return 0, 0
+
+    def delete_archive(self, ids):
+        """ Delete a batch of archived records in a single transaction """
+
+        if not ids:
+            return True
+
+        try:
+            conn = sqlite3.connect(self.db)
+            self._delete_ids(conn, "archive", ids)
+            conn.commit()
+            conn.close()
+
             self._logger(
                 "debug",
-                "Archived record has been deleted: {}".format(id)
+                "Archived records have been deleted: {}".format(len(ids))
             )
 
             return True
 
-        else:
+        except Exception as error:
             self._logger(
                 "error",
-                "Cannot delete archived record: {}".format(id)
+                "Cannot delete archived records: {} -> {}".format(len(ids), error)
             )
 
             return False
 
-    def clean(self):
+    def add_journal(self, records):
+        """ Add results of a run in a single transaction """
+
+        if not records:
+            return True
+
         try:
+            sql = """INSERT INTO journal (
+                                        run, config_id, plugin, source, started, finished, http_status, 
+                                        feed_bytes, entries, matched, grabbed, delivered, failed, 
+                                        fetch_seconds, regex_seconds, grab_seconds, mail_seconds, 
+                                        exec_seconds, db_seconds, exec_errors) 
+                                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);"""
+
             conn = sqlite3.connect(self.db)
-            conn.execute('VACUUM;')
+            conn.executemany(sql, records)
+            conn.commit()
+            conn.close()
 
             self._logger(
                 "debug",
-                "Database has been vacuumed"
+                "Run has been journaled: {}".format(len(records))
             )
 
+            return True
+
         except Exception as error:
             self._logger(
                 "error",
-                "Cannot clean database: {}".format(error)
+                "Cannot add run results to the journal: {}".format(error)
             )
-                   
-    def list(self, plugin, id):
-        if plugin == 'all' and id == 'all':
-            query = "SELECT * FROM configuration"
-        elif plugin == 'all' and id != 'all':
-            query = "SELECT * FROM configuration WHERE id = '{}'".format(id)
-        elif plugin != 'all' and id == 'all':
-            query = "SELECT * FROM configuration WHERE plugin = '{}'".format(plugin)
 
-        results = self._sql_query(query)
+            return False
 
-        if isinstance(results, list):
+    def trim_journal(self, max_age):
+        """ Drop journal records older than "max_age" seconds (0 - no limit) """
 
-            return results
+        if not max_age:
+            return True
+
+        try:
+            conn = sqlite3.connect(self.db)
+            conn.execute("DELETE FROM journal WHERE started < ?", [time.time() - max_age])
+            conn.commit()
+            conn.close()
 
+            return True
+
+        except Exception as error:
+            self._logger(
+                "error",
+                "Cannot apply journal retention: {}".format(error)
+            )
+
+            return False
+
+    def _journal_filter(self, since, ids):
+        """ Window of the journal, for all configurations or only for some of them """
+
+        if ids:
+            return "journal WHERE config_id IN ({}) AND started >= ?".format(", ".join("?" * len(ids))), \
+                list(ids) + [since]
         else:
+            # A window is usually much smaller than the journal, don't scan the whole (config_id, started) index
+            return "journal INDEXED BY journal_started WHERE started >= ?", [since]
+
+    def stats_journal(self, since, ids=None):
+        """
+        Totals per configuration since a timestamp (only for "ids" if they are set):
+        config_id, plugin, source, runs, failing runs, entries, matched, grabbed, delivered, failed, feed bytes,
+        run time and time per stage (fetch, regex, grab, mail, exec, db)
+        """
+
+        journal, params = self._journal_filter(since, ids)
+
+        try:
+            conn = sqlite3.connect(self.db)
+            results = conn.execute(
+                """SELECT config_id, plugin, source, COUNT(*), 
+                          SUM(http_status IS NULL OR http_status >= 400 OR failed > 0), 
+                          SUM(entries), SUM(matched), SUM(grabbed), SUM(delivered), SUM(failed), SUM(feed_bytes), 
+                          SUM(finished - started), SUM(fetch_seconds), SUM(regex_seconds), SUM(grab_seconds), 
+                          SUM(mail_seconds), SUM(exec_seconds), SUM(db_seconds) 
+                   FROM {} GROUP BY config_id""".format(journal),
+                params
+            ).fetchall()
+            conn.close()
+
+            return results
+
+        except Exception as error:
             self._logger(
                 "error",
-                "Cannot retrieve configurations from database"
+                "Cannot get statistics from the journal: {}".format(error)
             )
 
             return False
- 
-    def list_archive(self):
-        query = "SELECT * FROM archive"
-        results = self._sql_query(query)
 
-        if isinstance(results, list):
-            if len(results) > 0:
-                self._logger(
-                    "debug",
-                    "Archived records have been retrieved: {}".format(len(results))
-                )
+    def durations_journal(self, since, ids=None):
+        """ Stream run durations since a timestamp, ordered by configuration and duration """
 
-                return results
+        journal, params = self._journal_filter(since, ids)
 
-            elif len(results) == 0:
-                self._logger(
-                    "debug",
-                    "There are no archived records. Skipping sending archived records."
+        try:
+            conn = sqlite3.connect(self.db)
+            cursor = conn.execute(
+                "SELECT config_id, finished - started AS duration FROM {} ORDER BY config_id, duration".format(journal),
+                params
+            )
+
+            for record in cursor:
+                yield record
+
+            conn.close()
+
+        except Exception as error:
+            self._logger(
+                "error",
+                "Cannot get durations from the journal: {}".format(error)
+            )
+
+    def add_digest(self, config_id, title, url, grabbed_html, grabbed_screenshot, grabbed_text, grabbed_images,
+                   timestamp):
+        """ Put a message to the digest of a configuration, "grabbed_images" - an iterable of [data, format, name] """
+
+        try:
+            if grabbed_screenshot:
+                grabbed_screenshot = sqlite3.Binary(grabbed_screenshot)
+
+            sql = """INSERT INTO digest (
+                                        config_id, title, url, grabbed_html, grabbed_screenshot, grabbed_text, timestamp) 
+                                        VALUES (?, ?, ?, ?, ?, ?, ?);"""
+
+            with get_metrics().timer('mosquito_db_write_seconds', operation='add_digest'):
+                conn = sqlite3.connect(self.db)
+                digest_id = conn.execute(
+                    sql, [config_id, title, url, grabbed_html, grabbed_screenshot, grabbed_text, timestamp]
+                ).lastrowid
+                conn.executemany(
+                    "INSERT INTO digest_image (digest_id, data, format, name) VALUES (?, ?, ?, ?)",
+                    ([digest_id, sqlite3.Binary(data), data_format, name] for data, data_format, name in
+                     grabbed_images or [])
                 )
+                conn.commit()
+                conn.close()
 
-                return True
+            return True
 
-        else:
+        except Exception as error:
             self._logger(
                 "error",
-                "Cannot get archived data!"
+                "Cannot add a message to the digest: {}".format(error)
             )
 
             return False
 
-    def update(self, id, enabled, plugin, source, destination, update_alert, update_interval, description,
-               regex, regex_action, timestamp, counter, alert_timestamp, images_settings, url_tags):
+    def state_digest(self, config_id):
+        """ Number of messages in the digest of a configuration and timestamp of the oldest one """
 
         try:
-            query = """UPDATE configuration SET enabled=?, plugin=?, source=?, destination=?, update_alert=?, 
-                      update_interval=?, description=?, regexp=?, regexp_action=?, timestamp=?, counter=?,
-                       alert_timestamp=?, images_settings=?, url_tags=? WHERE id=?;"""
+            conn = sqlite3.connect(self.db)
+            results = conn.execute(
+                "SELECT COUNT(*), MIN(timestamp) FROM digest WHERE config_id = ?", [config_id]
+            ).fetchone()
+            conn.close()
+
+            return results
+
+        except Exception as error:
+            self._logger(
+                "error",
+                "Cannot get the digest state: {}".format(error)
+            )
 
+            return 0, None
+
+    def list_digest(self, config_id):
+        """
+        Iterate over messages of the digest of a configuration in order of arrival without their grabbed data:
+        [id, title, url, timestamp, recipients, size of grabbed data], see get_digest()
+        """
+
+        conn = sqlite3.connect(self.db)
+
+        try:
+            cursor = conn.execute(
+                """SELECT id, title, url, timestamp, recipients,
+                          ifnull(length(CAST(grabbed_html AS BLOB)), 0) + ifnull(length(grabbed_screenshot), 0) +
+                          ifnull(length(CAST(grabbed_text AS BLOB)), 0) +
+                          (SELECT ifnull(SUM(length(data)), 0) FROM digest_image WHERE digest_id = digest.id)
+                   FROM digest WHERE config_id = ? ORDER BY id""",
+                [config_id]
+            )
+
+            while True:
+                rows = cursor.fetchmany(500)
+
+                if not rows:
+                    break
+
+                for row in rows:
+                    yield row
+
+        except Exception as error:
+            self._logger(
+                "error",
+                "Cannot get the digest: {}".format(error)
+            )
+
+        finally:
+            conn.close()
+
+    def get_digest(self, id):
+        """ Grabbed data of a digest message: [html, screenshot, text, images] """
+
+        try:
+            conn = sqlite3.connect(self.db)
+            html, screenshot, text = conn.execute(
+                "SELECT grabbed_html, grabbed_screenshot, grabbed_text FROM digest WHERE id = ?", [id]
+            ).fetchone()
+            images = [
+                list(x) for x in
+                conn.execute("SELECT data, format, name FROM digest_image WHERE digest_id = ? ORDER BY id", [id])
+            ]
+            conn.close()
+
+            return [html, screenshot, text, images]
+
+        except Exception as error:
+            self._logger(
+                "error",
+                "Cannot get grabbed data of the digest: {} -> {}".format(id, error)
+            )
+
+            return [None, None, None, []]
+
+    def refuse_digest(self, ids, recipients):
+        """ Keep sent messages of a digest for recipients which have refused them """
+
+        try:
+            conn = sqlite3.connect(self.db)
+
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                conn.execute(
+                    "UPDATE digest SET recipients = ? WHERE id IN ({})".format(", ".join("?" * len(chunk))),
+                    [str(recipients)] + chunk
+                )
+
+            conn.commit()
+            conn.close()
+
+            return True
+
+        except Exception as error:
+            self._logger(
+                "error",
+                "Cannot keep messages of the digest: {} -> {}".format(len(ids), error)
+            )
+
+            return False
+
+    def delete_digest(self, ids):
+        """ Delete sent messages of a digest """
+
+        try:
             conn = sqlite3.connect(self.db)
-            conn.execute(query, [enabled, plugin, source, str(destination), update_alert, update_interval,
-                                 description, str(regex), str(regex_action), timestamp, counter, alert_timestamp,
-                                 str(images_settings), str(url_tags), id])
+            self._delete_ids(conn, "digest", ids)
             conn.commit()
+            conn.close()
 
+            return True
+
+        except Exception as error:
             self._logger(
-                "info",
-                "Configuration has been updated: {}".format(id)
+                "error",
+                "Cannot delete messages of the digest: {} -> {}".format(len(ids), error)
             )
 
+            return False
+
+    def get_state(self, config_id):
+        """ State of a source plugin of a configuration, an empty dict if there is no state yet """
+
+        try:
+            conn = sqlite3.connect(self.db)
+            result = conn.execute("SELECT state FROM source_state WHERE config_id = ?", [config_id]).fetchone()
+            conn.close()
+
+            if result:
+                return ast.literal_eval(result[0])
+
         except Exception as error:
             self._logger(
                 "error",
-                "Cannot update configuration: {}".format(error)
+                "Cannot get a source state: {} -> {}".format(config_id, error)
             )
 
+        return {}
+
+    def set_state(self, config_id, state):
+        """ Save a state of a source plugin of a configuration """
+
+        try:
+            with get_metrics().timer('mosquito_db_write_seconds', operation='set_state'):
+                conn = sqlite3.connect(self.db)
+                conn.execute(
+                    "INSERT OR REPLACE INTO source_state (config_id, state) VALUES (?, ?)", [config_id, str(state)]
+                )
+                conn.commit()
+                conn.close()
+
+            return True
+
+        except Exception as error:
+            self._logger(
+                "error",
+                "Cannot save a source state: {} -> {}".format(config_id, error)
+            )
+
+            return False
+
+    def clean(self):
+        try:
+            conn = sqlite3.connect(self.db)
+            conn.execute('VACUUM;')
+
+            self._logger(
+                "debug",
+                "Database has been vacuumed"
+            )
+
+        except Exception as error:
+            self._logger(
+                "error",
+                "Cannot clean database: {}".format(error)
+            )
+                   
+    def stream(self, plugins=None, ids=None, source=None, destination=None, enabled=None, updated_before=None,
+               order='id', reverse=False, limit=None, offset=0):
+        """
+        Iterate over configurations without loading all of them. Selected plugins/IDs are filtered by:
+        "source" - a pattern with * and ? wildcards (a substring if there are no wildcards)
+        "destination" - a substring of destinations
+        "enabled" - True or False
+        "updated_before" - configurations without new data since a timestamp
+        """
+
+        where, params = self._selection(plugins, ids)
+        conditions = ["(" + where[len(" WHERE "):] + ")"] if where else []
+
+        if source:
+            conditions.append("source GLOB ?")
+            params.append(source if '*' in source or '?' in source else '*' + source + '*')
+
+        if destination:
+            conditions.append("instr(destination, ?) > 0")
+            params.append(destination)
+
+        if enabled:
+            conditions.append("enabled = ?")
+            params.append(enabled)
+
+        if updated_before:
+            conditions.append("timestamp < ?")
+            params.append(updated_before)
+
+        if order not in COLUMNS:
+            raise ValueError("Unknown column: {}".format(order))
+
+        query = "SELECT * FROM configuration"
+
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+
+        query += " ORDER BY {0} {1}, id {1}".format(order, "DESC" if reverse else "ASC")
+
+        # LIMIT -1 - no limit, 0 - no rows
+        if limit is not None or offset:
+            query += " LIMIT ? OFFSET ?"
+            params.extend([-1 if limit is None else limit, offset or 0])
+
+        conn = sqlite3.connect(self.db)
+
+        try:
+            cursor = conn.execute(query, params)
+
+            while True:
+                rows = cursor.fetchmany(500)
+
+                if not rows:
+                    break
+
+                for row in rows:
+                    yield row
+
+        finally:
+            conn.close()
+
+    def list_archive(self, batch_size, after_id=0):
+        """ Stream archived records in id order, one batch at a time """
+
+        last_id = after_id
+
+        while True:
+            try:
+                conn = sqlite3.connect(self.db)
+                records = conn.execute(
+                    "SELECT * FROM archive WHERE id > ? ORDER BY id LIMIT ?", [last_id, batch_size]
+                ).fetchall()
+                conn.close()
+
+            except Exception as error:
+                self._logger(
+                    "error",
+                    "Cannot get archived data: {}".format(error)
+                )
+
+                return
+
+            if not records:
+                return
+
+            self._logger(
+                "debug",
+                "Archived records have been retrieved: {}".format(len(records))
+            )
+
+            yield records
+
+            last_id = records[-1][0]
+
+    def trim_archive(self, max_age=0, max_bytes=0, max_rows=0, config_id=None):
+        """
+        Drop the oldest archived records which are out of limits (0 - no limit):
+        "max_age" - age of a record in seconds
+        "max_bytes" - total size of archived records
+        "max_rows" - amount of records per configuration (only for "config_id" if it's set)
+        """
+
+        try:
+            conn = sqlite3.connect(self.db)
+            rows, size = conn.execute("SELECT rows, bytes FROM archive_size WHERE id = 0").fetchone()
+
+            if max_age:
+                current_timestamp = time.mktime(datetime.utcnow().timetuple())
+                conn.execute("DELETE FROM archive WHERE timestamp < ?", [current_timestamp - max_age])
+
+            if max_rows:
+                if config_id:
+                    source_ids = [config_id]
+                else:
+                    source_ids = [x[0] for x in conn.execute("SELECT DISTINCT source_id FROM archive")]
+
+                for source_id in source_ids:
+                    conn.execute(
+                        """DELETE FROM archive WHERE source_id = ? AND id NOT IN (
+                            SELECT id FROM archive WHERE source_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?
+                        )""",
+                        [source_id, source_id, max_rows]
+                    )
+
+            if max_bytes:
+                excess = conn.execute("SELECT bytes FROM archive_size WHERE id = 0").fetchone()[0] - max_bytes
+
+                if excess > 0:
+                    ids = []
+                    cursor = conn.execute("SELECT id, size FROM archive ORDER BY timestamp, id")
+
+                    for id, record_size in cursor:
+                        ids.append(id)
+                        excess -= record_size
+
+                        if excess <= 0:
+                            break
+
+                    cursor.close()
+                    self._delete_ids(conn, "archive", ids)
+
+            new_rows, new_size = conn.execute("SELECT rows, bytes FROM archive_size WHERE id = 0").fetchone()
+            conn.commit()
+            conn.close()
+
+            if new_rows < rows:
+                self._logger(
+                    "warning",
+                    "Archive retention, records have been dropped: {} ({} bytes)".format(
+                        rows - new_rows, size - new_size)
+                )
+
+            return True
+
+        except Exception as error:
+            self._logger(
+                "error",
+                "Cannot apply archive retention: {}".format(error)
+            )
+
+            return False
+
     def update_counter(self, id, count):
         query = "UPDATE configuration SET counter = counter + '{}' WHERE id = '{}'".format(count, id)
-        results = self._sql_query(query)
+
+        with get_metrics().timer('mosquito_db_write_seconds', operation='update_counter'):
+            results = self._sql_query(query)
 
         if isinstance(results, list):
             self._logger(
@@ -331,7 +1095,9 @@ class MosquitoDB(object):
  
     def update_timestamp(self, id, timestamp):
         query = "UPDATE configuration SET timestamp = '{}' WHERE id = '{}'".format(timestamp, id)
-        results = self._sql_query(query)
+
+        with get_metrics().timer('mosquito_db_write_seconds', operation='update_timestamp'):
+            results = self._sql_query(query)
 
         if isinstance(results, list):
             self._logger(
@@ -351,7 +1117,9 @@ class MosquitoDB(object):
 
     def update_alert_timestamp(self, id, timestamp):
         query = "UPDATE configuration SET alert_timestamp = '{}' WHERE id = '{}'".format(timestamp, id)
-        results = self._sql_query(query)
+
+        with get_metrics().timer('mosquito_db_write_seconds', operation='update_alert_timestamp'):
+            results = self._sql_query(query)
 
         if isinstance(results, list):
             self._logger(
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+import time
+
+# Deadline of the configuration which is processed by the current process (time.monotonic()), None - no limit
+_deadline = None
+
+
+def set_deadline(seconds):
+    """ Start a time budget of a configuration (0 - no limit) """
+
+    global _deadline
+
+    _deadline = time.monotonic() + seconds if seconds else None
+
+
+def expired():
+    """ Check that the time budget of the current configuration has run out """
+
+    return _deadline is not None and time.monotonic() >= _deadline
+
+
+def remaining(limit):
+    """
+    Seconds for an operation: "limit" (0 - no limit), but not more than what is left of the time budget of the
+    current configuration. None - no limit at all, TimeoutError if the budget has run out.
+    """
+
+    if _deadline is None:
+        return limit or None
+
+    left = _deadline - time.monotonic()
+
+    if left <= 0:
+        raise TimeoutError("Time budget of the configuration was reached")
+
+    return min(limit, left) if limit else left
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+import ast
+import logging
+import time
+
+from mosquito.db import MosquitoDB
+from mosquito.message import MosquitoGrabResult
+from mosquito.plugins.dst_mail import MosquitoMail
+
+
+class MosquitoArchiveDrain(object):
+    def __init__(self, batch_size, backoff_min, backoff_max, retention):
+        self.batch_size = batch_size
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.retention = retention
+
+        self.logger = logging.getLogger('[DRAIN]')
+
+        # Connections are opened lazily, so the object can be passed to a child process
+        self.db = None
+        self.mail = None
+
+    def _backoff(self, attempt):
+        """ Exponential delay between reconnection attempts """
+
+        delay = min(self.backoff_min * 2 ** attempt, self.backoff_max)
+
+        self.logger.warning("SMTP server is not available. Next attempt in {}s".format(delay))
+        time.sleep(delay)
+
+    def _connect(self):
+        """ (Re)establish a SMTP session """
+
+        if self.mail:
+            self.mail.close()
+
+        self.mail = MosquitoMail()
+
+        return self.mail.status
+
+    def _send_batch(self, records):
+        """
+        Send a batch of archived records over the current session.
+        Return IDs of sent records, IDs of records to leave in the archive and the session state.
+        """
+
+        sent = []
+        skipped = []
+
+        for record in records:
+            id = record[0]
+            destinations = record[2]
+            headers = ast.literal_eval(record[3])
+            priority = record[4]
+            subject = record[5]
+            original_content = record[6]
+
+            grabbed = MosquitoGrabResult(record[7], record[8], record[9])
+
+            if self.mail.send(destinations, headers, priority, subject, original_content, grabbed):
+                sent.append(id)
+
+            elif self.mail.is_alive():
+                # The server is fine, but doesn't accept this particular record. Leave it in the archive.
+                skipped.append(id)
+
+            else:
+                return sent, skipped, False
+
+        return sent, skipped, True
+
+    def drain(self, retries=None):
+        """
+        Send all archived records. Records are read in id order batch by batch and deleted after every batch.
+        "retries" - amount of reconnection attempts (None - retry forever).
+        Return True if the archive has been drained.
+        """
+
+        if not self.db:
+            self.db = MosquitoDB()
+
+        # Don't send what is already out of the retention policy
+        self.db.trim_archive(**self.retention)
+
+        if not self.db.count_archive():
+            self.logger.debug("There are no archived records. Skipping sending archived records.")
+            return True
+
+        attempt = 0
+        last_id = 0
+        total = 0
+
+        while True:
+            state = (self.mail and self.mail.status) or self._connect()
+
+            if state:
+                for records in self.db.list_archive(self.batch_size, last_id):
+                    sent, skipped, state = self._send_batch(records)
+
+                    self.db.delete_archive(sent)
+                    total += len(sent)
+
+                    if not state:
+                        # Resume from the first record that hasn't been sent
+                        last_id = max(sent + skipped + [last_id])
+                        break
+
+                    last_id = records[-1][0]
+                    attempt = 0
+
+            if state:
+                if total > 0:
+                    self.logger.info("Archived records have been sent: {}".format(total))
+
+                return True
+
+            self.mail.close()
+
+            if retries is not None and attempt >= retries:
+                self.logger.error("Cannot drain the archive, SMTP server is not available")
+                return False
+
+            self._backoff(attempt)
+            attempt += 1
+
+    def run(self, interval):
+        """ Drain the archive forever (daemon mode) """
+
+        while True:
+            self.drain()
+
+            if self.mail:
+                self.mail.close()
+
+            time.sleep(interval)
@@ -0,0 +1,1083 @@
+#!/usr/bin/env python3
+
+import ast
+import chardet
+import logging
+import multiprocessing
+import multiprocessing.util
+import os
+import re
+import requests
+import sys
+import time
+import validators
+
+from bs4 import BeautifulSoup
+from datetime import datetime
+from html2text import HTML2Text
+from io import BytesIO
+from PIL import Image
+
+from mosquito.cache import get_http_cache
+from mosquito.db import MosquitoDB
+from mosquito.deadline import expired, remaining, set_deadline
+from mosquito.images import get_images
+from mosquito.log import MosquitoLogListener, set_context, setup_worker_logging
+from mosquito.message import MosquitoGrabResult
+from mosquito.metrics import get_metrics, reset_metrics
+from mosquito.settings import parse_interval
+from mosquito.spool import MosquitoSpilled, get_spool
+
+from mosquito.plugins.dst_exec import MosquitoExec
+from mosquito.plugins.dst_mail import MosquitoMail
+
+# Profiler of a pool worker (fetch --profile)
+_worker_profiler = None
+
+# Batch scripts of a pool worker (execbatch destinations), they are kept running between configurations
+_worker_exec_batch = None
+
+# Stages of processing a configuration (profile report, journal): name, metrics
+STAGES = [
+    ('Fetch', ['mosquito_feed_fetch_seconds']),
+    ('Regex', ['mosquito_regex_match_seconds']),
+    ('Grab', ['mosquito_grab_seconds', 'mosquito_image_process_seconds']),
+    ('Mail', ['mosquito_mail_assemble_seconds', 'mosquito_mail_send_seconds']),
+    ('Exec', ['mosquito_exec_seconds']),
+    ('DB', ['mosquito_db_write_seconds']),
+]
+
+
+def _rss():
+    """ Resident memory of the current process in bytes """
+
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        # Peak memory (kilobytes) where the current one is unknown
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MosquitoParallelFetching(object):
+    def __init__(self, force, settings, profile=None, profile_top=10):
+        self.settings = settings
+        self.force = force
+        self.profile = profile
+        self.profile_top = profile_top
+
+        self.logger = logging.getLogger('[POOL]')
+
+        self.retention = {
+            'max_age': self.settings.archive_max_age_seconds,
+            'max_bytes': self.settings.archive_max_size,
+            'max_rows': self.settings.archive_max_rows
+        }
+
+    def _convert_encoding(self, data, new_encoding='UTF-8'):
+        """ Detect encoding and convert it to UTF-8 """
+
+        encoding = chardet.detect(data)['encoding']
+
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Detected encoding: {}".format(encoding))
+
+        if encoding.upper() != new_encoding.upper():
+            data = data.decode(encoding, new_encoding)
+        else:
+            data = data.decode()
+
+        return data
+
+    def _grab_content(self, message, mode, params=None):
+        """ Grab data of a message and measure duration per mode """
+
+        with get_metrics().timer('mosquito_grab_seconds', mode=mode):
+            return self._grab(message.url, mode, params, message.url_hash)
+
+    def _keep_image(self, image_data, image_format, image_name, params):
+        """
+        Post-process a matched image right away, images which are larger than grab_spill_size are moved to the spool
+        so a page with many big images doesn't have to fit into memory
+        """
+
+        data, data_format = get_images().process(image_data.getvalue(), image_format, params)
+
+        if self.settings.grab_spill_size and len(data) > self.settings.grab_spill_size:
+            data = get_spool().spill(data)
+
+        return [data, data_format, image_name]
+
+    def _download(self, url, headers, key=None):
+        """ Body of a web-page or an image, fresh responses are taken from the HTTP cache """
+
+        return get_http_cache().get(url, headers, self.settings.check_ssl, key)
+
+    def _grab(self, url, mode, params=None, key=None):
+        """ Grab data in different formats, "key" - a hash of the URL """
+
+        headers = {"User-Agent": self.settings.user_agent}
+
+        if mode == "images":
+            image_min_width, image_min_height = params['min']
+            image_max_width, image_max_height = params['max']
+            formats = params['format']
+
+            links = []
+            images = []
+
+            try:
+                body = self._convert_encoding(self._download(url, headers, key))
+
+                # -------------------------------------------------------------------------------------
+
+                soup = BeautifulSoup(body, "lxml")
+
+                for image in soup.find_all('img', src=True):
+                    link = image['src']
+
+                    if validators.url(link):
+                        links.append(link)
+
+                # -------------------------------------------------------------------------------------
+
+                for link in links:
+                    # A large or slow image is skipped, the rest of images are grabbed while the time budget lasts
+                    try:
+                        image_data = BytesIO(self._download(link, headers))
+                    except (ValueError, requests.exceptions.Timeout) as error:
+                        self.logger.warning("Cannot grab an image: {} -> {}".format(link, error))
+                        continue
+
+                    try:
+                        with Image.open(image_data) as image:
+                            width, height = image.size
+
+                            if width >= image_min_width and height >= image_min_height:
+                                if width <= image_max_width and height <= image_max_height:
+                                    if self.logger.isEnabledFor(logging.DEBUG):
+                                        self.logger.debug("Image was matched: {}".format(link))
+
+                                    # Get image format
+                                    image_format = image.format.lower()
+
+                                    # Derive image name from an URL
+                                    image_name = link[link.rfind("/") + 1:].split(".")[0]
+
+                                    if len(formats) > 0:
+                                        if image_format in formats:
+                                            images.append(self._keep_image(image_data, image_format, image_name, params))
+                                        else:
+                                            self.logger.warning(
+                                                "Image format is not suitable: {}. Skipping.".format(image_format)
+                                            )
+                                    else:
+                                        images.append(self._keep_image(image_data, image_format, image_name, params))
+                    except:
+                        pass
+
+                return images
+
+            except (requests.exceptions.Timeout, TimeoutError):
+                self.logger.warning("Timeout for URL was reached: {}".format(url))
+
+            except requests.exceptions.SSLError:
+                self.logger.warning("SSL verification for URL was failed: {}".format(url))
+
+            except Exception as error:
+                self.logger.warning("Cannot grab images from URL: {} -> {}".format(url, error))
+
+            # Images of a failed grab are not delivered
+            get_spool().discard_spilled(images)
+
+        elif mode == "html":
+            try:
+                body = self._convert_encoding(self._download(url, headers, key))
+
+                return body
+
+            except (requests.exceptions.Timeout, TimeoutError):
+                self.logger.warning("Timeout for URL was reached: {}".format(url))
+
+            except requests.exceptions.SSLError:
+                self.logger.warning("SSL verification for URL was failed: {}".format(url))
+
+            except Exception as error:
+                self.logger.warning("Cannot grab HTML from URL: {} -> {}".format(url, error))
+
+        elif mode == "screenshot":
+            from selenium import webdriver
+            from selenium.common.exceptions import TimeoutException
+
+            driver = None
+
+            try:
+                # A browser isn't started when the time budget has run out
+                timeout = remaining(self.settings.grab_timeout)
+
+                if re.search("firefox", self.settings.browser_path):
+                    browser_options = webdriver.FirefoxOptions()
+                    browser_options.add_argument("--headless")
+                    browser_options.binary_location = self.settings.browser_path
+
+                    driver = webdriver.Firefox(
+                        executable_path=self.settings.browser_driver_path,
+                        firefox_options=browser_options
+                    )
+
+                elif re.search("chrome|chromium", self.settings.browser_path):
+                    browser_options = webdriver.ChromeOptions()
+                    browser_options.add_argument("--headless")
+                    browser_options.binary_location = self.settings.browser_path
+
+                    driver = webdriver.Chrome(
+                        executable_path=self.settings.browser_driver_path,
+                        chrome_options=browser_options
+                    )
+
+                else:
+                    self.logger.warning("Browser is not supported (firefox, chrome, chromium): {}".format(
+                        self.settings.browser_path))
+
+                    return None
+
+                if timeout:
+                    driver.set_page_load_timeout(timeout)
+
+                driver.get(url)
+                element = driver.find_element_by_tag_name('body')
+                screenshot = element.screenshot_as_png
+
+                return screenshot
+
+            except (TimeoutException, TimeoutError):
+                self.logger.warning("Timeout for URL was reached: {}".format(url))
+
+            except Exception as error:
+                self.logger.warning("Cannot grab screenshot from URL: {} -> {}".format(url, error))
+
+            finally:
+                if driver:
+                    driver.quit()
+
+        elif mode == "text":
+            try:
+                h2t = HTML2Text()
+                h2t.body_width = 0
+                h2t.ignore_emphasis = True
+                #h2t.ignore_images = True
+
+                text = self._convert_encoding(self._download(url, headers, key))
+                text = h2t.handle(text)
+
+                return text
+
+            except (requests.exceptions.Timeout, TimeoutError):
+                self.logger.warning("Timeout for URL was reached: {}".format(url))
+
+            except requests.exceptions.SSLError:
+                self.logger.warning("SSL verification for URL was failed: {}".format(url))
+
+            except Exception as error:
+                self.logger.warning("Cannot grab text from URL: {} -> {}".format(url, error))
+
+    def _parse_images_settings(self, params):
+        """
+        Parse images settings of a configuration once (min:600x300 max:800x600 format:jpeg,png), post-processing
+        (edge:1024 convert:webp quality:80 strip:true) defaults to the configuration file
+        """
+
+        images_settings = {
+            'min': (0, 0),
+            'max': (0, 0),
+            'format': [],
+            'edge': self.settings.images_edge,
+            'convert': self.settings.images_convert,
+            'quality': self.settings.images_quality,
+            'strip': self.settings.images_strip
+        }
+
+        for param in params:
+            k, v = param.split(':')
+
+            if k == 'min' or k == 'max':
+                w, h = v.split('x')
+                images_settings[k] = (int(w), int(h))
+
+            elif k == 'format':
+                images_settings[k] = v.split(',')
+
+            elif k == 'edge' or k == 'quality':
+                images_settings[k] = int(v)
+
+            elif k == 'convert':
+                images_settings[k] = v.lower()
+
+            elif k == 'strip':
+                images_settings[k] = v.lower() == 'true'
+
+        return images_settings
+
+    def _match_regex(self, data, regexs):
+        """ Search patterns in data """
+
+        if regexs:
+            regex_found = False
+            debug = self.logger.isEnabledFor(logging.DEBUG)
+
+            for regex in regexs:
+                pattern = re.compile(regex,re.IGNORECASE + re.UNICODE)
+
+                if re.search(pattern, data):
+                    regex_found = True
+
+                    if debug:
+                        self.logger.debug("Regex was matched: {}".format(regex))
+                else:
+                    if debug:
+                        self.logger.debug("Regex wasn't matched: {}".format(regex))
+
+            if debug:
+                if regex_found:
+                    self.logger.debug("Content was matched")
+                else:
+                    self.logger.debug("Content wasn't matched")
+
+            return regex_found
+        else:
+            print("Regexp list is empty!")
+            return False
+
+    def _digest_interval(self, actions):
+        """ Interval of the digest=<interval> action in seconds, 0 - messages are sent one by one """
+
+        for action in actions:
+            action_type, action_value = action.split("=", 1)
+
+            if action_type == "digest":
+                return parse_interval(action_value)
+
+        return 0
+
+    def _parser(self, actions):
+        """ Feed parser of the parser=<auto|lxml|feedparser> action, None - rss_parser from the configuration file """
+
+        for action in actions:
+            action_type, action_value = action.split("=", 1)
+
+            if action_type == "parser":
+                return action_value
+
+        return None
+
+    def _send_digest(self, db, mail, config, interval, journal):
+        """ Send collected messages of a configuration as one email when the oldest one is older than the interval """
+
+        config_id = config[0]
+        config_plugin = config[2]
+        config_source = config[3]
+        config_description = config[7]
+        current_timestamp = time.mktime(datetime.utcnow().timetuple())
+
+        count, oldest = db.state_digest(config_id)
+
+        if not count or current_timestamp - oldest < interval:
+            return
+
+        recipients = []
+
+        for destination in ast.literal_eval(config[4]):
+            k, v = destination.split(":", 1)
+
+            if k == "mail":
+                recipients.append(v)
+
+        headers = {}
+        priority = "3"
+        subject = ""
+
+        for action in ast.literal_eval(config[9]):
+            action_type, action_value = action.split("=", 1)
+
+            if action_type == "priority":
+                priority = {"high": "1", "normal": "3", "low": "5"}[action_value]
+            elif action_type == "subject":
+                subject = action_value + " "
+            elif action_type == "tag":
+                tag_name, tag_value = action_value.split(":")
+                headers[tag_name] = tag_value
+
+        headers["X-mosquito-id"] = str(config_id)
+        headers["X-mosquito-plugin"] = str(config_plugin)
+        headers["X-mosquito-source"] = str(config_source)
+
+        # Messages which have been refused by some recipients are sent to them only
+        groups = {}
+
+        for message in db.list_digest(config_id):
+            groups.setdefault(message[4], []).append(message)
+
+        for kept, messages in groups.items():
+            if kept:
+                # Recipients could be removed from destinations since then
+                group = [x for x in ast.literal_eval(kept) if x in recipients]
+            else:
+                group = recipients
+
+            if group:
+                self._deliver_digest(db, mail, group, headers, priority, subject, config_description or config_source,
+                                     messages, journal)
+            else:
+                db.delete_digest([x[0] for x in messages])
+
+    def _deliver_digest(self, db, mail, recipients, headers, priority, subject, name, messages, journal):
+        """
+        Send messages of a digest ([id, title, url, timestamp, recipients, size], see list_digest()) to recipients.
+        Grabbed data is read from the database only while it fits digest_max_size.
+        """
+
+        headers = dict(headers)
+        headers["X-mosquito-digest"] = str(len(messages))
+
+        subject += "Digest: {} messages from {}".format(len(messages), name)
+
+        if len(subject) > self.settings.subject_length:
+            subject = subject[:self.settings.subject_length] + " ..."
+
+        # ----------------------------------------------------------------------------
+        # A text index of all messages, grabbed data is attached under the same number
+
+        max_size = self.settings.digest_max_size
+
+        body = []
+        items = []
+        size = 0
+        attach = True
+
+        for number, (id, title, url, timestamp, _, item_size) in enumerate(messages, 1):
+            body.append("{}. {}\n   {}\n   {}".format(
+                number, title.split("\n", 1)[0], url, datetime.fromtimestamp(timestamp)))
+
+            # Data of the rest of messages isn't attached after the first one which doesn't fit
+            if attach and max_size and size + item_size > max_size:
+                attach = False
+
+            if attach:
+                items.append(MosquitoGrabResult(*db.get_digest(id)))
+                size += item_size
+
+        ids = [x[0] for x in messages]
+
+        if mail.send_digest(recipients, headers, priority, subject, "\n\n".join(body), items, max_size):
+            db.delete_digest(ids)
+            journal['delivered'] += len(recipients)
+
+            self.logger.info("Digest has been sent: {} messages".format(len(messages)))
+
+        elif len(mail.refused) < len(recipients):
+            # Messages are kept until refused recipients get them
+            db.refuse_digest(ids, mail.refused)
+            journal['delivered'] += len(recipients) - len(mail.refused)
+            journal['failed'] += len(mail.refused)
+
+            self.logger.warning("Digest has been refused, it is kept for recipients: {}".format(
+                ", ".join(mail.refused)))
+
+        else:
+            journal['failed'] += len(recipients)
+
+            self.logger.warning("SMTP server is not available. Digest is kept until the next run!")
+
+    def _profiler(self):
+        """ Profiler of the current worker, its stats are written when the worker exits """
+
+        global _worker_profiler
+
+        if not _worker_profiler:
+            import cProfile
+
+            _worker_profiler = cProfile.Profile()
+
+            multiprocessing.util.Finalize(
+                None,
+                _worker_profiler.dump_stats,
+                args=(os.path.join(self.profile, 'worker-{}.pstats'.format(os.getpid())),),
+                exitpriority=20
+            )
+
+        return _worker_profiler
+
+    def _stage_seconds(self, metrics):
+        """ Time per stage from metrics of a configuration """
+
+        durations = {}
+
+        for (name, labels), histogram in metrics['histograms'].items():
+            durations[name] = durations.get(name, 0) + histogram[1]
+
+        return [sum(durations.get(x, 0) for x in names) for stage, names in STAGES]
+
+    def _exec_batch(self):
+        """ Batch scripts of the current worker, they are stopped when the worker exits """
+
+        global _worker_exec_batch
+
+        if not _worker_exec_batch:
+            from mosquito.plugins.dst_execbatch import MosquitoExecBatch
+
+            _worker_exec_batch = MosquitoExecBatch()
+
+            multiprocessing.util.Finalize(None, _worker_exec_batch.close, exitpriority=20)
+
+        return _worker_exec_batch
+
+    def _profile_report(self, configs, results):
+        """ Merge stats of workers and show the slowest configurations """
+
+        import pstats
+
+        from glob import glob
+        from terminaltables import AsciiTable
+
+        files = glob(os.path.join(self.profile, 'worker-*.pstats'))
+
+        if files:
+            with open(os.path.join(self.profile, 'report.txt'), 'w') as f:
+                stats = pstats.Stats(*files, stream=f)
+                stats.sort_stats('cumulative').print_stats()
+                stats.dump_stats(os.path.join(self.profile, 'merged.pstats'))
+
+            self.logger.info("Profile has been written: {}".format(os.path.join(self.profile, 'report.txt')))
+
+        # ----------------------------------------------------------------------------
+
+        table = [['ID', 'Plugin', 'Source', 'Wall'] + [x[0] for x in STAGES]]
+
+        slowest = sorted(zip(configs, results), key=lambda x: x[1][2], reverse=True)[:self.profile_top]
+
+        for config, result in slowest:
+            table.append(
+                [config[0], config[2], config[3], '{:.3f}'.format(result[2])] +
+                ['{:.3f}'.format(x) for x in self._stage_seconds(result[1])]
+            )
+
+        print(AsciiTable(table, 'Slowest configurations (seconds)').table)
+
+    def _run_config(self, config):
+        """ Process a configuration in a pool worker, return the result with metrics, wall time and journal """
+
+        metrics = reset_metrics()
+        start = time.monotonic()
+
+        journal = {
+            'started': time.time(),
+            'http_status': None,
+            'feed_bytes': 0,
+            'entries': 0,
+            'matched': 0,
+            'grabbed': 0,
+            'delivered': 0,
+            'failed': 0,
+            'exec_errors': []
+        }
+
+        if self.profile:
+            profiler = self._profiler()
+            profiler.enable()
+
+            try:
+                result = self._process_config(config, journal)
+            finally:
+                profiler.disable()
+        else:
+            result = self._process_config(config, journal)
+
+        journal['finished'] = time.time()
+
+        return result, metrics.dump(), time.monotonic() - start, journal
+
+    def _run_chunk(self, configs):
+        """
+        Process configurations in a pool worker which is replaced after the chunk. If the worker grows over
+        pool_max_rss, it stops early and the rest of the chunk is returned to be processed by a fresh worker.
+        """
+
+        results = []
+
+        for number, config in enumerate(configs, 1):
+            results.append(self._run_config(config))
+
+            if self.settings.pool_max_rss and number < len(configs):
+                rss = _rss()
+
+                if rss > self.settings.pool_max_rss:
+                    self.logger.info("Worker memory limit was reached, recycling the worker: {} > {} bytes".format(
+                        rss, self.settings.pool_max_rss))
+
+                    return results, configs[number:]
+
+        return results, []
+
+    def _process_config(self, config, journal):
+        config_id = config[0]
+        config_enabled = config[1]
+        config_plugin = config[2]
+        config_source = config[3]
+        config_destination = ast.literal_eval(config[4])
+        config_update_alert = config[5]
+        config_update_interval = config[6]
+        config_regex = ast.literal_eval(config[8])
+        config_regex_action = ast.literal_eval(config[9])
+        config_timestamp = config[10]
+        config_alert_timestamp = config[12]
+        config_images_settings = self._parse_images_settings(ast.literal_eval(config[13]))
+        config_url_tags = ast.literal_eval(config[14])
+        config_digest = self._digest_interval(config_regex_action)
+        current_timestamp = time.mktime(datetime.utcnow().timetuple())
+
+        set_context(config_id)
+        set_deadline(self.settings.config_timeout_seconds)
+
+        metrics = get_metrics()
+
+        db = MosquitoDB()
+        exec = MosquitoExec()
+        mail = MosquitoMail()
+
+        if self.force or config_enabled == "True":
+            if self.force or (current_timestamp - config_timestamp) > config_update_interval:
+
+                self.logger.info("Working with configuration: {}".format(config_id))
+
+                if config_plugin == "rss":
+                    from mosquito.plugins.src_rss import MosquitoRSS
+                    plugin = MosquitoRSS(self._parser(config_regex_action))
+                elif config_plugin == "twitter":
+                    from mosquito.plugins.src_twitter import MosquitoTwitter
+                    plugin = MosquitoTwitter()
+
+                # A position of the source is saved when messages have been processed
+                source_state = db.get_state(config_id)
+                previous_state = dict(source_state)
+
+                with metrics.timer('mosquito_feed_fetch_seconds', plugin=config_plugin):
+                    messages = plugin.fetch(config_source, source_state, config_timestamp)
+
+                journal['http_status'] = plugin.http_status
+                journal['feed_bytes'] = plugin.feed_bytes
+                journal['entries'] = plugin.entries
+
+                # Actions are the same for all messages of a configuration
+                grab_list = []
+                tags = {}
+
+                mail_priority = None
+                mail_subject = None
+
+                for action in config_regex_action:
+                    action_type = action.split("=")[0]
+                    action_value = action.split("=")[1]
+
+                    if action_type == "grab":
+                        grab_list.append(action_value)
+                    elif action_type == "priority":
+                        mail_priority = action_value
+                    elif action_type == "subject":
+                        mail_subject = action_value
+                    elif action_type == "tag":
+                        tag_name, tag_value = action_value.split(":")
+                        tags[tag_name] = tag_value
+
+                # Set email priority
+                priority = {"high": "1", "normal": "3", "low": "5"}.get(mail_priority, "3")
+
+                # Messages are processed from the oldest one, so a run which is stopped by the time budget is resumed
+                # from the first message which is left
+                messages.sort(key=lambda x: x.timestamp)
+
+                count = 0
+                left = []
+
+                for number, message in enumerate(messages):
+                    if expired():
+                        left = [x for x in messages[number:] if x.timestamp > config_timestamp]
+
+                        if left:
+                            metrics.inc('mosquito_messages_skipped_total', len(left), reason='deadline')
+
+                            self.logger.warning(
+                                "Time budget of the configuration was reached, messages are left to the next run: "
+                                "{}".format(len(left))
+                            )
+
+                        break
+
+                    if message.timestamp > config_timestamp:
+                        with metrics.timer('mosquito_regex_match_seconds'):
+                            matched = self._match_regex(message.title, config_regex)
+
+                        if matched:
+                            metrics.inc('mosquito_messages_matched_total')
+                            journal['matched'] += 1
+
+                            message.share_tags(tags)
+
+                            if message.url:
+                                for url_tag in config_url_tags:
+                                    url, tag = url_tag.split(":",1)
+
+                                    if re.search(url, message.url):
+                                        tag = tag.split("=")
+                                        tag_name, tag_value = tag[1].split(":")
+                                        message.tag(tag_name, tag_value)
+
+                            # ------------------------------------------------------------------------
+                            # Process a grab list
+
+                            grabbed = message.grabbed = MosquitoGrabResult()
+
+                            if grab_list and message.url:
+                                for grab in grab_list:
+
+                                    if grab == "full":
+                                        grabbed.images = self._grab_content(message, "images", params=config_images_settings) or []
+                                        grabbed.html = self._grab_content(message, "html")
+                                        grabbed.screenshot = self._grab_content(message, "screenshot")
+                                        grabbed.text = self._grab_content(message, "text")
+
+                                    elif grab == "images":
+                                        grabbed.images = self._grab_content(message, grab, params=config_images_settings) or []
+
+                                    elif grab == "html":
+                                        grabbed.html = self._grab_content(message, grab)
+
+                                    elif grab == "screenshot":
+                                        grabbed.screenshot = self._grab_content(message, grab)
+
+                                    elif grab == "text":
+                                        grabbed.text = self._grab_content(message, grab)
+
+                            if grabbed:
+                                journal['grabbed'] += 1
+
+                            # Images are shrunk while they are grabbed, a screenshot - before it's written, attached
+                            # and archived
+                            if grabbed.screenshot:
+                                grabbed.screenshot = get_images().process_screenshot(
+                                    grabbed.screenshot, config_images_settings)
+
+                            # ------------------------------------------------------------------------
+
+                            # Grabbed data is written once and shared by all exec destinations of a message
+                            payload = None
+                            exec_tags = None
+                            mail_recipients = []
+
+                            for destination in config_destination:
+                                k, v = destination.split(":", 1)
+
+                                if k == "exec" or k == "execbatch":
+                                    # Tags of scripts are not added to headers of emails
+                                    if exec_tags is None:
+                                        exec_tags = dict(message.tags)
+                                        exec_tags["id"] = str(config_id)
+                                        exec_tags["plugin"] = str(config_plugin)
+                                        exec_tags["source"] = str(config_source)
+                                        exec_tags["url"] = str(message.url)
+
+                                    if k == "exec":
+                                        runner = exec
+                                    else:
+                                        runner = self._exec_batch()
+
+                                    if not payload:
+                                        payload = exec.spool.write(message)
+
+                                    # Results of scripts are collected below
+                                    if not payload or not runner.run(
+                                        v,                      # path to executable
+                                        message.timestamp,
+                                        exec_tags,
+                                        payload
+                                    ):
+                                        journal['failed'] += 1
+
+                                elif k == "mail":
+                                    mail_recipients.append(v)
+
+                            # ------------------------------------------------------------------------
+                            # The message is assembled once and sent to all recipients in one transaction
+
+                            if mail_recipients and config_digest:
+                                # Spilled images are read one by one while they are written to the database
+                                digest_images = (
+                                    [x[0].read() if isinstance(x[0], MosquitoSpilled) else x[0], x[1], x[2]]
+                                    for x in grabbed.images
+                                )
+
+                                if not db.add_digest(
+                                        config_id, message.title, message.url, grabbed.html, grabbed.screenshot,
+                                        grabbed.text, digest_images, current_timestamp
+                                ):
+                                    journal['failed'] += len(mail_recipients)
+
+                            elif mail_recipients:
+                                # Transform subject
+                                if mail_subject:
+                                    subject = mail_subject + " " + message.headline
+                                else:
+                                    subject = message.headline
+
+                                if subject:
+                                    if len(subject) > self.settings.subject_length:
+                                        subject = subject[:self.settings.subject_length] + " ..."
+
+                                # Add default headers
+                                headers = dict(message.tags)
+                                headers["X-mosquito-id"] = str(config_id)
+                                headers["X-mosquito-plugin"] = str(config_plugin)
+                                headers["X-mosquito-source"] = str(config_source)
+                                headers["X-mosquito-message-url"] = str(message.url)
+
+                                # Append URL to mail body
+                                body = message.title + "\n\n---\n{}".format(message.url)
+
+                                if mail.send(mail_recipients, headers, priority, subject, body, grabbed):
+                                    journal['delivered'] += len(mail_recipients)
+                                else:
+                                    journal['delivered'] += len(mail_recipients) - len(mail.refused)
+                                    journal['failed'] += len(mail.refused)
+
+                                    self.logger.warning("SMTP server is not available. Add message to archive!")
+
+                                    for v in mail.refused:
+                                        db.add_archive(
+                                            config_id, v, headers, priority, subject, body,
+                                            grabbed.html, grabbed.screenshot, grabbed.text, current_timestamp
+                                        )
+
+                                    db.trim_archive(config_id=config_id, **self.retention)
+
+                            # Working directories of scripts keep their hard links
+                            if payload:
+                                exec.spool.discard(payload)
+
+                            exec.spool.discard_spilled(grabbed.images)
+
+                            # Grabbed data isn't kept while the rest of messages are processed
+                            message.grabbed = None
+
+                            count += 1
+                        else:
+                            metrics.inc('mosquito_messages_skipped_total', reason='regex')
+                    else:
+                        metrics.inc('mosquito_messages_skipped_total', reason='old')
+
+                        if self.logger.isEnabledFor(logging.DEBUG):
+                            self.logger.debug(
+                                "The message timestamp is lower than the config timestamp, skipping: {} < {}".format(
+                                    int(message.timestamp), int(config_timestamp))
+                            )
+
+                # A position of the source must not pass messages which are left
+                if source_state != previous_state and not left:
+                    db.set_state(config_id, source_state)
+
+                if config_digest:
+                    self._send_digest(db, mail, config, config_digest, journal)
+
+                finished = exec.wait()
+
+                if _worker_exec_batch:
+                    finished += _worker_exec_batch.wait()
+
+                for exec_path, returncode, errors in finished:
+                    if returncode == 0:
+                        journal['delivered'] += 1
+                    else:
+                        journal['failed'] += 1
+                        journal['exec_errors'].append([exec_path, returncode, errors])
+
+                if count > 0:
+                    # Update timestamp for a configuration, the next run starts from messages which are left
+                    if left:
+                        db.update_timestamp(config_id, left[0].timestamp - 1)
+                    else:
+                        db.update_timestamp(config_id, time.mktime(datetime.utcnow().timetuple()))
+
+                    # Increase counter for a configuration
+                    db.update_counter(config_id, count)
+                elif not left:
+                    # Check if we haven't received new data during a specific interval
+                    if current_timestamp > (config_timestamp + int(config_update_alert)):
+                        self.logger.warning("No new data for the configuration: {}".format(config_id))
+
+                        # Check if we are reached "alert_interval". If so, send a letter.
+                        if current_timestamp > (int(config_alert_timestamp) + self.settings.alert_interval_seconds):
+                            self.logger.warning("Alert interval reached. Sending an alert email: {}".format(config_id))
+
+                            if self.settings.alert_email:
+                                if mail.send(
+                                        self.settings.alert_email,
+                                        None,
+                                        None,
+                                        self.settings.alert_subject,
+                                        "{} -> {} -> {}".format(config_id, config_plugin, config_source)
+                                ):
+                                    db.update_alert_timestamp(config_id, current_timestamp)
+                            else:
+                                self.logger.warning(
+                                    ("Alert email address doesn't set, warnings about absence of new data will be"
+                                     " shown only in console.")
+                                )
+
+            else:
+                self.logger.info("Update interval hasn't been reached, skipping: {}".format(config_id))
+
+                return False
+
+        else:
+            self.logger.info("Configuration is disabled, skipping: {}".format(config_id))
+
+            return False
+
+        self.logger.info("Configuration has been processed: {}".format(config_id))
+
+        return True
+
+    def _journal(self, configs, results):
+        """ Save results of processed configurations """
+
+        run = int(time.time())
+        records = []
+
+        for config, (result, metrics, wall, journal) in zip(configs, results):
+            if result:
+                records.append(
+                    [run, config[0], config[2], config[3], journal['started'], journal['finished'],
+                     journal['http_status'], journal['feed_bytes'], journal['entries'], journal['matched'],
+                     journal['grabbed'], journal['delivered'], journal['failed']] + self._stage_seconds(metrics) +
+                    [str(journal['exec_errors']) if journal['exec_errors'] else None]
+                )
+
+        db = MosquitoDB()
+        db.add_journal(records)
+        db.trim_journal(self.settings.journal_max_age_seconds)
+
+    def run(self, configs):
+        """ Process configurations in parallel, return a result, metrics, wall time and journal per configuration """
+
+        # ----------------------------------------------------------------------------
+        # Workers send records in batches, records are printed by the main process handlers
+
+        q = multiprocessing.Queue()
+
+        lp = MosquitoLogListener(q, *logging.getLogger().handlers, respect_handler_level=True)
+        lp.start()
+
+        # ----------------------------------------------------------------------------
+
+        configs_number = len(configs)
+
+        if configs_number < self.settings.pool:
+            pool_size = configs_number
+        else:
+            pool_size = self.settings.pool
+
+        self.logger.info("Process pool size: {}".format(pool_size))
+
+        # ----------------------------------------------------------------------------
+
+        if (configs_number % pool_size) == 0:
+            chunk_size = int(configs_number / pool_size)
+        else:
+            chunk_size = int((configs_number / pool_size) + 1)
+
+        # Every chunk is processed by a new worker
+        if self.settings.pool_max_tasks:
+            chunk_size = min(chunk_size, self.settings.pool_max_tasks)
+
+        self.logger.info("Chunk size of the pool: {}".format(chunk_size))
+
+        # ----------------------------------------------------------------------------
+
+        if self.profile:
+            os.makedirs(self.profile, exist_ok=True)
+
+            for filename in os.listdir(self.profile):
+                if filename.startswith('worker-') and filename.endswith('.pstats'):
+                    os.remove(os.path.join(self.profile, filename))
+
+        # ----------------------------------------------------------------------------
+
+        get_spool().clean()
+
+        # ----------------------------------------------------------------------------
+
+        self.logger.info("Putting configurations to the process pool: {}".format(configs_number))
+
+        p = multiprocessing.Pool(pool_size, setup_worker_logging, (q, self.settings.log_level), maxtasksperchild=1)
+
+        results = [None] * configs_number
+        chunks = [
+            [offset, p.apply_async(self._run_chunk, (configs[offset:offset + chunk_size],))]
+            for offset in range(0, configs_number, chunk_size)
+        ]
+
+        # The rest of a chunk of a recycled worker is put back to the pool
+        while chunks:
+            offset, chunk = chunks.pop(0)
+            chunk_results, rest = chunk.get()
+
+            results[offset:offset + len(chunk_results)] = chunk_results
+
+            if rest:
+                offset += len(chunk_results)
+                chunks.append([offset, p.apply_async(self._run_chunk, (rest,))])
+
+        p.close()
+        p.join()
+        lp.stop()
+
+        # ----------------------------------------------------------------------------
+        # Aggregate metrics of workers
+
+        metrics = get_metrics()
+
+        for result in results:
+            metrics.merge(result[1])
+
+        if self.profile:
+            self._profile_report(configs, results)
+
+        self._journal(configs, results)
+
+        worker_results = results
+        results = [result[0] for result in results]
+
+        metrics.inc('mosquito_configs_total', results.count(True), result='processed')
+        metrics.inc('mosquito_configs_total', results.count(False), result='skipped')
+
+        archive_records, archive_bytes = MosquitoDB().size_archive()
+        metrics.set('mosquito_archive_records', archive_records)
+        metrics.set('mosquito_archive_bytes', archive_bytes)
+
+        if self.settings.metrics_file:
+            metrics.write(self.settings.metrics_file)
+
+        # ----------------------------------------------------------------------------
+
+        self.logger.info("Number of processed configurations: {}".format(results.count(True)))
+        self.logger.info("Number of skipped configurations: {}".format(results.count(False)))
+
+        if self.settings.http_cache_size:
+            self.logger.info("HTTP cache hits: {}, revalidated: {}, misses: {}".format(
+                int(metrics.value('mosquito_http_cache_total', result='hit')),
+                int(metrics.value('mosquito_http_cache_total', result='revalidated')),
+                int(metrics.value('mosquito_http_cache_total', result='miss'))
+            ))
+
+        return worker_results
@@ -18,19 +18,55 @@ class MosquitoHelp(object):
         self.create10 = "Set a space separated list of images settings (see documentation for details)"
         self.create11 = "Set a space separated list of URL tags (see documentation for details)"
 
+        self.daemon1 = "Run fetching and archive draining periodically"
+        self.daemon2 = "Set a space separated list of plugins"
+        self.daemon3 = "Set a space separated list of IDs"
+        self.daemon4 = "Set an interval between fetch runs (1s, 2m, 3h, 4d)"
+
         self.delete1 = "Delete configurations"
         self.delete2 = "Set a space separated list of plugins"
         self.delete3 = "Set a space separated list of IDs"
 
+        self.drain1 = "Send archived data to a SMTP server"
+        self.drain2 = "Set an amount of reconnection attempts"
+
+        self.export1 = "Export configurations (JSON Lines or OPML)"
+        self.export2 = "Set a space separated list of plugins"
+        self.export3 = "Set a space separated list of IDs"
+        self.export4 = "Set a format: jsonl (all fields) or opml (RSS sources only)"
+        self.export5 = "Set a file name (default: stdout)"
+
         self.fetch1 = "Fetch data from a source"
         self.fetch2 = "Set a space separated list of plugins"
         self.fetch3 = "Set a space separated list of IDs"
         self.fetch4 = "Force operation (will process disabled configurations and ignore an update interval)"
+        self.fetch5 = "Profile configurations processing, write stats of workers and a merged report to a directory"
+        self.fetch6 = "Set an amount of the slowest configurations in the profile report"
+
+        self.import1 = "Import configurations (JSON Lines or OPML) in one transaction"
+        self.import2 = "Set a file name"
+        self.import3 = "Set a format: jsonl or opml (default: by a file extension)"
+        self.import4 = "Set a space separated list of destinations for configurations without them"
+        self.import5 = "Set an update alert interval for configurations without it (1s, 2m, 3h, 4d)"
+        self.import6 = "Set an update interval for configurations without it (1s, 2m, 3h, 4d)"
+        self.import7 = "Set a space separated list of regexs for configurations without them"
+        self.import8 = "Set a space separated list of actions for configurations without them"
+        self.import9 = "Set a space separated list of images settings for configurations without them"
+        self.import10 = "Set a space separated list of URL tags for configurations without them"
 
         self.list1 = "List configurations"
         self.list2 = "Set a space separated list of plugins"
         self.list3 = "Set a space separated list of IDs"
         self.list4 = "List configurations in a short format"
+        self.list5 = "Set a source pattern (* and ? wildcards, a substring if there are no wildcards)"
+        self.list6 = "Set a part of a destination (e.g. mail:user@example.com or exec:)"
+        self.list7 = "Set status of configurations (True or False)"
+        self.list8 = "Show configurations without new data during an interval (1s, 2m, 3h, 4d)"
+        self.list9 = "Set a sort order (id, plugin, source, update, count)"
+        self.list10 = "Sort in descending order"
+        self.list11 = "Set a maximum amount of configurations"
+        self.list12 = "Set an amount of configurations to skip"
+        self.list13 = "Set an output format: table, json or csv"
 
         self.set1 = "Set parameters for configurations"
         self.set2 = "Set status of a configuration (True or False)"
@@ -46,4 +82,9 @@ class MosquitoHelp(object):
         self.set12 = "Set a space separated list of images settings (see documentation for details)"
         self.set13 = "Set a space separated list of URL tags (see documentation for details)"
 
+        self.stats1 = "Show throughput, latency and failures of sources from the journal of fetch runs"
+        self.stats2 = "Set a space separated list of IDs"
+        self.stats3 = "Set a time window (1s, 2m, 3h, 4d)"
+        self.stats4 = "Set an amount of the slowest and the most failing sources"
+
 
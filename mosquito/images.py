@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+import hashlib
+import logging
+
+from collections import OrderedDict
+from io import BytesIO
+from PIL import Image
+
+from mosquito.metrics import get_metrics
+
+# Post-processor of a pool worker, its cache is shared by all configurations of the worker
+_images = None
+
+# Target formats: name, Pillow format
+FORMATS = {
+    'jpeg': 'JPEG',
+    'png': 'PNG',
+    'webp': 'WEBP'
+}
+
+# Magic bytes of formats which are attached to emails and written to exec directories
+SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+]
+
+
+def get_images():
+    """ Return the image post-processor of the current process """
+
+    global _images
+
+    if not _images:
+        _images = MosquitoImages()
+
+    return _images
+
+
+def image_format(data, default='png'):
+    """ Detect a format of image data """
+
+    for signature, name in SIGNATURES:
+        if data.startswith(signature):
+            return name
+
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+
+    return default
+
+
+class MosquitoImages(object):
+    """
+    Shrink grabbed images and screenshots before delivery: fit into a maximum edge, convert to another format and
+    strip metadata. Every image is processed once, results are cached by a hash of content and parameters while
+    their total size is under cache_size bytes.
+    """
+
+    def __init__(self, cache_size=8388608):
+        self.logger = logging.getLogger('[IMAGES]')
+
+        # Hash: [data, format] or None
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.cached_bytes = 0
+
+    def _logger(self, level, message):
+        if level == "debug":
+            self.logger.debug(message)
+        elif level == "error":
+            self.logger.error(message)
+        elif level == "info":
+            self.logger.info(message)
+        elif level == "warning":
+            self.logger.warning(message)
+
+    def _process(self, data, params):
+        """ Re-encode an image, return [data, format] or None if it doesn't need it """
+
+        with Image.open(BytesIO(data)) as image:
+            source_format = (image.format or 'png').lower()
+            target_format = params['convert'] or source_format
+
+            if target_format not in FORMATS:
+                return None
+
+            resize = params['edge'] and max(image.size) > params['edge']
+            metadata = any(x in image.info for x in ['exif', 'icc_profile', 'xmp', 'comment'])
+
+            if not resize and target_format == source_format and not (params['strip'] and metadata):
+                return None
+
+            if getattr(image, 'is_animated', False):
+                return None
+
+            image.load()
+
+            if resize:
+                image.thumbnail((params['edge'], params['edge']), Image.LANCZOS)
+
+            if target_format == 'jpeg' and image.mode not in ['RGB', 'L']:
+                image = image.convert('RGB')
+            elif target_format == 'webp' and image.mode not in ['RGB', 'RGBA']:
+                image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.mode else 'RGB')
+            elif target_format == 'png' and image.mode == 'CMYK':
+                image = image.convert('RGB')
+
+            options = {'optimize': True}
+
+            if target_format in ['jpeg', 'webp']:
+                options['quality'] = params['quality']
+
+            # Pillow doesn't copy metadata to a new image unless it's passed explicitly
+            if not params['strip']:
+                for key in ['exif', 'icc_profile']:
+                    if key in image.info:
+                        options[key] = image.info[key]
+
+            output = BytesIO()
+            image.save(output, format=FORMATS[target_format], **options)
+
+        # A re-encoded image can be larger than the original one, it's still used if metadata has to be stripped
+        if not resize and target_format == source_format and output.tell() >= len(data) and \
+                not (params['strip'] and metadata):
+            return None
+
+        return [output.getvalue(), target_format]
+
+    def process(self, data, data_format, params):
+        """ Return [data, format] of a processed image, the original image is returned if it cannot be processed """
+
+        if not data or not (params['edge'] or params['convert'] or params['strip']):
+            return [data, data_format]
+
+        key = hashlib.sha1(
+            data + repr([params[x] for x in ['edge', 'convert', 'quality', 'strip']]).encode('utf-8')
+        ).hexdigest()
+
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            get_metrics().inc('mosquito_images_total', result='cached')
+
+            return self.cache[key] or [data, data_format]
+
+        metrics = get_metrics()
+
+        try:
+            with metrics.timer('mosquito_image_process_seconds'):
+                result = self._process(data, params)
+
+        except Exception as error:
+            self._logger(
+                "warning",
+                "Cannot process an image: {}".format(error)
+            )
+
+            result = None
+
+        if result:
+            metrics.inc('mosquito_images_total', result='processed')
+            metrics.inc('mosquito_images_saved_bytes_total', max(0, len(data) - len(result[0])))
+
+            self._logger(
+                "debug",
+                "Image has been processed: {} ({} bytes) -> {} ({} bytes)".format(
+                    data_format, len(data), result[1], len(result[0]))
+            )
+        else:
+            metrics.inc('mosquito_images_total', result='kept')
+
+        # Only processed images are kept in memory, None - use the original image. One image must not push out a big
+        # part of the cache.
+        size = len(result[0]) if result else 0
+
+        if size <= self.cache_size / 4:
+            self.cache[key] = result
+            self.cached_bytes += size
+
+            while self.cached_bytes > self.cache_size:
+                _, evicted = self.cache.popitem(last=False)
+                self.cached_bytes -= len(evicted[0]) if evicted else 0
+
+        return result or [data, data_format]
+
+    def process_screenshot(self, screenshot, params):
+        """ Process a screenshot, its format is detected on delivery """
+
+        if not screenshot:
+            return screenshot
+
+        return self.process(screenshot, 'png', params)[0]
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+import coloredlogs
+import json
+import logging
+import multiprocessing.util
+import time
+
+from logging.handlers import QueueHandler, QueueListener
+
+# ID of a configuration which is processed by the current process
+_config_id = None
+
+
+def set_context(config_id):
+    """ Mark all following records of the current process with a configuration ID """
+
+    global _config_id
+
+    _config_id = config_id
+
+
+def setup_logging(settings):
+    """ Log to the console in the main process """
+
+    handler = logging.StreamHandler()
+    handler.addFilter(MosquitoContextFilter())
+
+    if settings.log_format == 'json':
+        handler.setFormatter(MosquitoJSONFormatter())
+    else:
+        handler.setFormatter(coloredlogs.ColoredFormatter('%(asctime)s %(name)s%(context)s %(levelname)s  %(message)s'))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(settings.log_level.upper())
+
+
+def setup_worker_logging(queue, level):
+    """ Send records of a pool worker to the main process, the worker drops records below the level itself """
+
+    handler = MosquitoQueueHandler(queue)
+    handler.addFilter(MosquitoContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level.upper())
+
+    # Pool workers don't run atexit handlers, send the last batch on exit: after other finalizers of the worker
+    # (exitpriority 20) and before the queue is closed (exitpriority 10)
+    multiprocessing.util.Finalize(None, handler.flush, exitpriority=15)
+
+
+class MosquitoContextFilter(logging.Filter):
+    """ Add a configuration ID to records """
+
+    def filter(self, record):
+        if not hasattr(record, 'config_id'):
+            record.config_id = _config_id
+
+        if record.config_id:
+            record.context = '[{}]'.format(record.config_id)
+        else:
+            record.context = ''
+
+        return True
+
+
+class MosquitoJSONFormatter(logging.Formatter):
+    """ One JSON object per line """
+
+    def format(self, record):
+        message = {
+            'time': self.formatTime(record),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'config_id': getattr(record, 'config_id', None),
+            'message': record.getMessage()
+        }
+
+        if record.exc_info:
+            message['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(message, ensure_ascii=False)
+
+
+class MosquitoQueueHandler(QueueHandler):
+    """ Put records to a queue in batches """
+
+    def __init__(self, queue, batch_size=100, batch_interval=1):
+        super().__init__(queue)
+
+        self.batch = []
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.batch_time = time.monotonic()
+
+    def emit(self, record):
+        try:
+            self.batch.append(self.prepare(record))
+
+            # Warnings and errors are sent without delay
+            if len(self.batch) >= self.batch_size or record.levelno >= logging.WARNING or \
+                    time.monotonic() - self.batch_time >= self.batch_interval:
+                self._send()
+
+        except Exception:
+            self.handleError(record)
+
+    def _send(self):
+        if self.batch:
+            self.enqueue(self.batch)
+            self.batch = []
+
+        self.batch_time = time.monotonic()
+
+    def flush(self):
+        self.acquire()
+
+        try:
+            self._send()
+        finally:
+            self.release()
+
+
+class MosquitoLogListener(QueueListener):
+    """ Handle batches of records from pool workers """
+
+    def handle(self, record):
+        if isinstance(record, list):
+            for item in record:
+                super().handle(item)
+        else:
+            super().handle(record)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import hashlib
+import re
+
+# Links are cut from titles, tweets usually end with them
+TITLE_LINKS = re.compile(r"https?:\/\/.*")
+
+
+def url_hash(url):
+    """ Hash of an URL (HTTP cache keys, message IDs) """
+
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+class MosquitoGrabResult(object):
+    """ Data grabbed from a web-page of a message: HTML, a screenshot, text and images [[data, format, name], ...] """
+
+    __slots__ = ['html', 'screenshot', 'text', 'images']
+
+    def __init__(self, html=None, screenshot=None, text=None, images=None):
+        self.html = html
+        self.screenshot = screenshot
+        self.text = text
+        self.images = images or []
+
+    def __bool__(self):
+        return bool(self.html or self.screenshot or self.text or self.images)
+
+
+class MosquitoMessage(object):
+    """
+    A message of a source: a timestamp, a title and an URL. Derived fields are computed on first use, tags are shared
+    by messages of a configuration until a message gets a tag of its own.
+    """
+
+    __slots__ = ['timestamp', 'raw_title', 'url', 'grabbed', '_title', '_headline', '_url_hash', '_tags', '_own_tags']
+
+    def __init__(self, timestamp, title, url):
+        self.timestamp = timestamp
+        self.raw_title = title
+        self.url = url
+        self.grabbed = None
+
+        self._title = None
+        self._headline = None
+        self._url_hash = None
+        self._tags = None
+        self._own_tags = False
+
+    def __repr__(self):
+        return "MosquitoMessage({!r}, {!r}, {!r})".format(self.timestamp, self.raw_title, self.url)
+
+    @property
+    def title(self):
+        """ A title without links """
+
+        if self._title is None:
+            self._title = TITLE_LINKS.sub("", self.raw_title or "")
+
+        return self._title
+
+    @property
+    def headline(self):
+        """ The first line of a title (subjects, digests) """
+
+        if self._headline is None:
+            self._headline = self.title.split("\n", 1)[0]
+
+        return self._headline
+
+    @property
+    def url_hash(self):
+        if self._url_hash is None and self.url:
+            self._url_hash = url_hash(self.url)
+
+        return self._url_hash
+
+    @property
+    def tags(self):
+        """ Tags of a message, they must be changed by tag() only """
+
+        if self._tags is None:
+            self._tags = {}
+            self._own_tags = True
+
+        return self._tags
+
+    def share_tags(self, tags):
+        """ Use tags of a configuration, they are copied before the first change """
+
+        self._tags = tags
+        self._own_tags = False
+
+    def tag(self, name, value):
+        if not self._own_tags:
+            self._tags = dict(self._tags or {})
+            self._own_tags = True
+
+        self._tags[name] = value
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+# Name: type, help
+METRICS = {
+    'mosquito_archive_bytes': ('gauge', 'Total size of archived records'),
+    'mosquito_archive_records': ('gauge', 'Number of archived records'),
+    'mosquito_configs_total': ('counter', 'Processed configurations by result'),
+    'mosquito_db_write_seconds': ('histogram', 'Duration of database writes'),
+    'mosquito_downloaded_bytes_total': ('counter', 'Bytes downloaded from feeds and web-pages'),
+    'mosquito_exec_seconds': ('histogram', 'Duration of exec destination scripts'),
+    'mosquito_exec_total': ('counter', 'Finished exec destination scripts by result'),
+    'mosquito_feed_fetch_seconds': ('histogram', 'Duration of fetching a source'),
+    'mosquito_grab_seconds': ('histogram', 'Duration of grabbing a web-page by mode'),
+    'mosquito_http_cache_total': ('counter', 'HTTP cache lookups of grabbed web-pages and images by result'),
+    'mosquito_image_process_seconds': ('histogram', 'Duration of post-processing an image'),
+    'mosquito_images_saved_bytes_total': ('counter', 'Bytes saved by post-processing images'),
+    'mosquito_images_total': ('counter', 'Post-processed images by result'),
+    'mosquito_mail_assemble_seconds': ('histogram', 'Duration of assembling an email'),
+    'mosquito_mail_send_seconds': ('histogram', 'Duration of sending an email'),
+    'mosquito_messages_matched_total': ('counter', 'Messages matched by regex'),
+    'mosquito_messages_skipped_total': ('counter', 'Messages skipped by reason'),
+    'mosquito_regex_match_seconds': ('histogram', 'Duration of matching a message against regexs'),
+}
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Process-wide registry, every pool worker has its own one
+_metrics = None
+
+
+def get_metrics():
+    """ Return the registry of the current process """
+
+    global _metrics
+
+    if not _metrics:
+        _metrics = MosquitoMetrics()
+
+    return _metrics
+
+
+def reset_metrics():
+    """ Start a new registry in the current process """
+
+    global _metrics
+
+    _metrics = MosquitoMetrics()
+
+    return _metrics
+
+
+def start_metrics_server(port):
+    """ Serve the registry of the current process on a local HTTP port """
+
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = get_metrics().render().encode('utf-8')
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', port), Handler)
+
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    return server
+
+
+class MosquitoMetrics(object):
+    def __init__(self):
+        self.logger = logging.getLogger('[METRICS]')
+        self.lock = threading.Lock()
+
+        # (name, labels): value
+        self.counters = {}
+        self.gauges = {}
+
+        # (name, labels): [bucket counts, sum, count]
+        self.histograms = {}
+
+    def _key(self, name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def _labels(self, labels, extra=None):
+        labels = list(labels)
+
+        if extra:
+            labels.append(extra)
+
+        if labels:
+            return '{' + ','.join('{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in labels) + '}'
+        else:
+            return ''
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def value(self, name, **labels):
+        """ Current value of a counter or a gauge """
+
+        key = self._key(name, labels)
+
+        with self.lock:
+            return self.counters.get(key, self.gauges.get(key, 0))
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+
+        with self.lock:
+            histogram = self.histograms.setdefault(key, [[0] * len(BUCKETS), 0, 0])
+
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[0][i] += 1
+                    break
+
+            histogram[1] += value
+            histogram[2] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """ Observe duration of a block """
+
+        start = time.monotonic()
+
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start, **labels)
+
+    def dump(self):
+        """ Plain data which can be sent to another process """
+
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'histograms': {k: [list(v[0]), v[1], v[2]] for k, v in self.histograms.items()}
+            }
+
+    def merge(self, data):
+        """ Add metrics collected by another process """
+
+        with self.lock:
+            for key, value in data['counters'].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+
+            self.gauges.update(data['gauges'])
+
+            for key, value in data['histograms'].items():
+                histogram = self.histograms.setdefault(key, [[0] * len(BUCKETS), 0, 0])
+                histogram[0] = [a + b for a, b in zip(histogram[0], value[0])]
+                histogram[1] += value[1]
+                histogram[2] += value[2]
+
+    def render(self):
+        """ Prometheus text format """
+
+        with self.lock:
+            samples = {}
+
+            for key, value in sorted(list(self.counters.items()) + list(self.gauges.items())):
+                samples.setdefault(key[0], []).append('{}{} {}'.format(key[0], self._labels(key[1]), value))
+
+            for key, (buckets, total, count) in sorted(self.histograms.items()):
+                name, labels = key
+                lines = samples.setdefault(name, [])
+                cumulative = 0
+
+                for bound, bucket in zip(BUCKETS, buckets):
+                    cumulative += bucket
+                    lines.append('{}_bucket{} {}'.format(name, self._labels(labels, ('le', bound)), cumulative))
+
+                lines.append('{}_bucket{} {}'.format(name, self._labels(labels, ('le', '+Inf')), count))
+                lines.append('{}_sum{} {}'.format(name, self._labels(labels), total))
+                lines.append('{}_count{} {}'.format(name, self._labels(labels), count))
+
+        output = []
+
+        for name in sorted(samples):
+            metric_type, metric_help = METRICS.get(name, ('untyped', name))
+
+            output.append('# HELP {} {}'.format(name, metric_help))
+            output.append('# TYPE {} {}'.format(name, metric_type))
+            output.extend(samples[name])
+
+        return '\n'.join(output) + '\n'
+
+    def write(self, filename):
+        """ Write a textfile for the node exporter, the file is replaced atomically """
+
+        try:
+            temp = filename + '.tmp'
+
+            with open(temp, 'w') as f:
+                f.write(self.render())
+
+            os.replace(temp, filename)
+
+            self.logger.debug("Metrics have been written: {}".format(filename))
+
+        except Exception as error:
+            self.logger.error("Cannot write metrics: {} -> {}".format(filename, error))
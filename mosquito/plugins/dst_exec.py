@@ -2,129 +2,171 @@
 
 import logging
 import os
+import signal
 import subprocess
+import tempfile
+import time
 
-from uuid import uuid4
-
-from mosquito.settings import MosquitoSettings
+from mosquito.deadline import expired
+from mosquito.metrics import get_metrics
+from mosquito.settings import get_settings
+from mosquito.spool import get_spool
 
 
 class MosquitoExec(object):
-    def __init__(self, id=None, queue=None):
-        self.id = id
-        self.queue = queue
-
+    def __init__(self):
         self.logger = logging.getLogger('[EXEC]')
-        self.settings = MosquitoSettings()
-
-    def _delete(self, filename):
-        if filename:
-            try:
-                os.remove(filename)
-                self._logger(
-                    "debug",
-                    "Temporary file has been deleted: {}".format(filename)
-                )
-            except Exception as error:
-                self._logger(
-                    "warning",
-                    "Cannot delete the temporary file: {} -> {}".format(filename, error)
-                )
+        self.settings = get_settings()
+        self.spool = get_spool()
 
-    def _logger(self, level, message):
-        if self.id and self.queue:
+        # Started scripts: [process, exec path, working directory, start time, stderr file]
+        self.running = []
+
+        # Results of scripts: [exec path, exit code (None - killed by timeout), stderr]
+        self.finished = []
+
+    def _finish(self, process, exec_path, working_path, started, stderr, returncode):
+        """ Save a result of a script and release its working directory """
+
+        stderr.seek(0)
+        errors = stderr.read().decode('utf-8', errors='replace')[-self.settings.exec_stderr_size:]
+        stderr.close()
+
+        get_metrics().observe('mosquito_exec_seconds', time.monotonic() - started)
 
-            self.queue.put([
-                self.id,
-                level,
-                message
-            ])
+        if returncode == 0:
+            get_metrics().inc('mosquito_exec_total', result='ok')
+
+            self._logger(
+                "debug",
+                "Script has been executed: {}".format(exec_path)
+            )
         else:
-            if level == "debug":
-                self.logger.debug(message)
-            elif level == "error":
-                self.logger.error(message)
-            elif level == "info":
-                self.logger.info(message)
-            elif level == "warning":
-                self.logger.warning(message)
-
-    def _write(self, filename, data, mode):
-        if data:
-            try:
-                f = open(filename, mode)
-                f.write(data)
-                f.close()
-
-                self._logger(
-                    "debug",
-                    "Data has been written to a temporary file: {}".format(filename)
-                )
-
-            except Exception as error:
-                self._logger(
-                    "error",
-                    "Cannot write data to a temporary file: {} -> {}".format(filename, error)
-                )
-
-    def run(self, exec_path, timestamp, tags, title, html, screenshot, text, images):
-        working_path = self.settings.exec_path + "/" + str(uuid4())
-
-        if not os.path.isdir(working_path):
-            try:
-                os.makedirs(working_path)
-            except Exception as e:
-                self._logger(
-                    "error",
-                    "Cannot create a temporary directory where data will be processed: {}".format(e)
-                )
-
-                return False
+            get_metrics().inc('mosquito_exec_total', result='error' if returncode is not None else 'timeout')
 
-        if not tags:
-            tags = {"None": "None"}
+            self._logger(
+                "warning",
+                "Script execution was finished with errors: {} -> {} {}".format(exec_path, returncode, errors.strip())
+            )
+
+        self.finished.append([exec_path, returncode, errors])
+
+        self.spool.release(working_path, returncode == 0)
 
-        self._write(working_path + "/title.txt", title, "w")
-        self._write(working_path + "/content.html", html, "w")
-        self._write(working_path + "/screenshot.png", screenshot, "wb")
-        self._write(working_path + "/content.txt", text, "w")
+    def _reap(self):
+        """
+        Collect finished scripts, kill process groups of scripts which are out of time: exec_timeout or the time budget
+        of the configuration
+        """
 
-        if images:
-            if not os.path.isdir(working_path + "/images"):
+        running = []
+        budget = expired()
+
+        for process, exec_path, working_path, started, stderr in self.running:
+            returncode = process.poll()
+
+            if returncode is None:
+                if time.monotonic() - started < self.settings.exec_timeout_seconds and not budget:
+                    running.append([process, exec_path, working_path, started, stderr])
+                    continue
+
+                # Scripts could start their own children, kill the whole group
                 try:
-                    os.makedirs(working_path + "/images")
-                except Exception as e:
-                    self._logger(
-                        "error",
-                        "Cannot create a temporary directory where images will be saved: {}".format(e)
-                    )
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+                process.wait()
+
+                if budget:
+                    stderr.write(b"Time budget of the configuration was reached")
+                else:
+                    stderr.write(
+                        "Timeout was reached: {}s".format(self.settings.exec_timeout_seconds).encode('utf-8'))
+                returncode = None
+
+            self._finish(process, exec_path, working_path, started, stderr, returncode)
 
-            for image in images:
-                image_data = image[0]
-                image_format = image[1]
-                image_name = image[2]
+        self.running = running
 
-                filename = working_path + "/images/" + image_name + "." + image_format.lower()
-                self._write(filename, image_data, "wb")
+    def _wait_slot(self, exec_path):
+        """ Wait until the amount of running scripts (all and for a path) is under limits """
+
+        while True:
+            self._reap()
+
+            inflight = sum(1 for x in self.running if x[1] == exec_path)
+
+            if len(self.running) < self.settings.exec_pool and inflight < self.settings.exec_max_inflight:
+                return
+
+            time.sleep(0.05)
+
+    def _logger(self, level, message):
+        if level == "debug":
+            self.logger.debug(message)
+        elif level == "error":
+            self.logger.error(message)
+        elif level == "info":
+            self.logger.info(message)
+        elif level == "warning":
+            self.logger.warning(message)
+
+    def run(self, exec_path, timestamp, tags, payload):
+        """
+        Start a script without waiting for it, return False if a working directory cannot be created.
+        "payload" - grabbed data of a message written by MosquitoSpool.write(), results - wait()
+        """
+
+        working_path, files = self.spool.link(payload)
+
+        if not working_path:
+            return False
+
+        if not tags:
+            tags = {"None": "None"}
+
+        self._wait_slot(exec_path)
+
+        stderr = tempfile.TemporaryFile()
+        started = time.monotonic()
 
         try:
-            subprocess.call(
+            process = subprocess.Popen(
                 [
                     exec_path,
                     str(timestamp),
                     ";".join("{}:{}".format(key, value) for key, value in tags.items()),
                     working_path
-                ]
+                ],
+                stdin=subprocess.DEVNULL,
+                stderr=stderr,
+                start_new_session=True
             )
 
-            self._logger(
-                "debug",
-                "Script has been executed: {}".format(exec_path)
-            )
+            self.running.append([process, exec_path, working_path, started, stderr])
 
         except Exception as error:
-            self._logger(
-                "warning",
-                "Script execution was finished with errors: {} -> {}".format(exec_path, error)
-            )
+            # Like a shell does for a command which cannot be started
+            stderr.write(str(error).encode('utf-8'))
+            self._finish(None, exec_path, working_path, started, stderr, 127)
+
+        return True
+
+    def wait(self):
+        """
+        Wait for all started scripts (not longer than exec_timeout and what is left of the time budget of the
+        configuration), return and forget their results
+        """
+
+        while self.running:
+            self._reap()
+
+            if self.running:
+                time.sleep(0.05)
+
+        finished = self.finished
+        self.finished = []
+
+        return finished
 
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import os
+import select
+import signal
+import subprocess
+import tempfile
+import time
+
+from mosquito.deadline import remaining
+from mosquito.metrics import get_metrics
+from mosquito.plugins.dst_exec import MosquitoExec
+
+
+class MosquitoExecBatch(MosquitoExec):
+    """
+    Stream messages to long-running scripts: one JSON object per line on stdin, one acknowledgement line per message
+    on stdout ("ok" - a message has been processed, anything else - an error). A script is started on the first
+    message and is kept running until close(): one script per pool worker, for all configurations of its chunk.
+    """
+
+    def __init__(self):
+        super().__init__()
+
+        self.logger = logging.getLogger('[EXECBATCH]')
+
+        # Running scripts: exec path -> [process, stderr file, bytes of stdout which aren't a complete line yet]
+        self.scripts = {}
+
+    def _start(self, exec_path):
+        """ Start a script or return the running one """
+
+        if exec_path in self.scripts:
+            process = self.scripts[exec_path][0]
+
+            if process.poll() is None:
+                return process
+
+            self._stop(exec_path)
+
+        stderr = tempfile.TemporaryFile()
+
+        process = subprocess.Popen(
+            [exec_path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+            start_new_session=True
+        )
+
+        self.scripts[exec_path] = [process, stderr, b'']
+
+        self._logger(
+            "debug",
+            "Script has been started: {} ({})".format(exec_path, process.pid)
+        )
+
+        return process
+
+    def _stop(self, exec_path, kill=False):
+        """ Close stdin of a script and wait for it, kill the process group if it doesn't exit in time """
+
+        process, stderr, _ = self.scripts.pop(exec_path)
+
+        if not kill:
+            try:
+                process.stdin.close()
+                process.wait(self.settings.exec_timeout_seconds)
+            except Exception:
+                kill = True
+
+        if kill:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+            process.wait()
+
+        stderr.seek(0)
+        errors = stderr.read().decode('utf-8', errors='replace')[-self.settings.exec_stderr_size:]
+        stderr.close()
+
+        self._logger(
+            "debug",
+            "Script has been stopped: {} -> {}".format(exec_path, process.returncode)
+        )
+
+        return process.returncode, errors
+
+    def _readline(self, exec_path, deadline):
+        """
+        Read an acknowledgement line of a script until a deadline (time.monotonic()). Stdout is read from the pipe
+        itself: select() doesn't see data in a buffered reader and readline() would block on a partial line.
+        Return None if the deadline has been reached, a line without the line break if the script has exited.
+        """
+
+        script = self.scripts[exec_path]
+        fd = script[0].stdout.fileno()
+
+        while b'\n' not in script[2]:
+            timeout = deadline - time.monotonic()
+
+            if timeout <= 0 or not select.select([fd], [], [], timeout)[0]:
+                return None
+
+            data = os.read(fd, 65536)
+
+            if not data:
+                line, script[2] = script[2], b''
+                return line
+
+            script[2] += data
+
+        line, _, script[2] = script[2].partition(b'\n')
+
+        return line + b'\n'
+
+    def _result(self, exec_path, working_path, started, returncode, errors):
+        """ Save a result of a message and release its working directory """
+
+        get_metrics().observe('mosquito_exec_seconds', time.monotonic() - started)
+
+        if returncode == 0:
+            get_metrics().inc('mosquito_exec_total', result='ok')
+        else:
+            get_metrics().inc('mosquito_exec_total', result='error' if returncode is not None else 'timeout')
+
+            self._logger(
+                "warning",
+                "Script cannot process a message: {} -> {} {}".format(exec_path, returncode, errors.strip())
+            )
+
+        self.finished.append([exec_path, returncode, errors])
+
+        self.spool.release(working_path, returncode == 0)
+
+    def run(self, exec_path, timestamp, tags, payload):
+        """
+        Send a message to a script and wait for its acknowledgement, return False if a working directory cannot be
+        created
+        """
+
+        working_path, files = self.spool.link(payload)
+
+        if not working_path:
+            return False
+
+        message = {
+            'timestamp': timestamp,
+            'tags': tags,
+            'title': payload['title'],
+            'path': working_path,
+            'files': files
+        }
+
+        started = time.monotonic()
+
+        # An acknowledgement is waited for exec_timeout, but not longer than what is left of the time budget of
+        # the configuration
+        try:
+            timeout = remaining(self.settings.exec_timeout_seconds) or 0
+        except TimeoutError:
+            timeout = 0
+
+        try:
+            process = self._start(exec_path)
+
+            process.stdin.write(json.dumps(message, ensure_ascii=False).encode('utf-8') + b'\n')
+            process.stdin.flush()
+
+            line = self._readline(exec_path, started + timeout)
+
+            if line is None:
+                self._stop(exec_path, kill=True)
+                self._result(
+                    exec_path, working_path, started, None,
+                    "Timeout was reached: {:.0f}s".format(timeout)
+                )
+
+                return True
+
+            answer = line.decode('utf-8', errors='replace').strip()
+
+            if not line.endswith(b'\n'):
+                # The script has exited
+                returncode, errors = self._stop(exec_path)
+                self._result(exec_path, working_path, started, returncode or 1, errors)
+            elif answer == 'ok':
+                self._result(exec_path, working_path, started, 0, '')
+            else:
+                # Like a failed script
+                self._result(exec_path, working_path, started, 1, answer or "Empty acknowledgement")
+
+        except Exception as error:
+            if exec_path in self.scripts:
+                self._stop(exec_path, kill=True)
+
+            self._result(exec_path, working_path, started, 127, str(error))
+
+        return True
+
+    def close(self):
+        """ Stop all scripts """
+
+        for exec_path in list(self.scripts):
+            self._stop(exec_path)
@@ -1,30 +1,93 @@
 #!/usr/bin/env python3
 
 import logging
+import re
 import smtplib
+import time
 
+from email.generator import BytesGenerator
 from email.header import Header
 from email.mime.image import MIMEImage
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
-from mosquito.settings import MosquitoSettings
+from mosquito.deadline import remaining
+from mosquito.images import image_format
+from mosquito.metrics import get_metrics
+from mosquito.settings import get_settings
+from mosquito.spool import MosquitoSpilled
+
+
+class MosquitoDataWriter(object):
+    """ Stream a message to the DATA command of a SMTP session: dot-stuffing, writes in large chunks """
+
+    def __init__(self, sock, chunk_size=65536):
+        self.sock = sock
+        self.chunk_size = chunk_size
+
+        self.buffer = b''
+        self.chunks = []
+        self.size = 0
+        self.last = b'\r\n'
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('ascii')
+
+        self.buffer += data
+
+        # Only complete lines can be dot-stuffed
+        end = self.buffer.rfind(b'\n') + 1
+
+        if end:
+            self._add(self.buffer[:end])
+            self.buffer = self.buffer[end:]
+
+    def _add(self, lines):
+        self.chunks.append(re.sub(br'(?m)^\.', b'..', lines))
+        self.size += len(lines)
+        self.last = lines[-2:]
+
+        if self.size >= self.chunk_size:
+            self._send()
+
+    def _send(self):
+        if self.chunks:
+            self.sock.sendall(b''.join(self.chunks))
+
+        self.chunks = []
+        self.size = 0
+
+    def close(self):
+        """ Send the rest of a message and the end of data """
+
+        if self.buffer:
+            self._add(self.buffer + b'\r\n')
+            self.buffer = b''
+
+        if self.last != b'\r\n':
+            self.chunks.append(b'\r\n')
+
+        self.chunks.append(b'.\r\n')
+        self._send()
 
 
 class MosquitoMail(object):
     
-    def __init__(self, id=None, queue=None):
-        self.id = id
-        self.queue = queue
-
+    def __init__(self):
         self.logger = logging.getLogger('[MAIL]')
-        self.settings = MosquitoSettings()
+        self.settings = get_settings()
         self.server = None
         self.status = False
 
+        # Recipients which haven't got the last message
+        self.refused = []
+
         if self.settings.smtp_usessl:
             try:
-                self.server = smtplib.SMTP_SSL(self.settings.smtp_server, self.settings.smtp_port)
+                self.server = smtplib.SMTP_SSL(
+                    self.settings.smtp_server, self.settings.smtp_port, timeout=self._timeout()
+                )
 
                 self._logger(
                     "debug",
@@ -34,7 +97,9 @@ class MosquitoMail(object):
                 )
             except smtplib.ssl.SSLError:
                 try:
-                    self.server = smtplib.SMTP(self.settings.smtp_server, self.settings.smtp_port)
+                    self.server = smtplib.SMTP(
+                        self.settings.smtp_server, self.settings.smtp_port, timeout=self._timeout()
+                    )
                     self.server.starttls()
 
                     self._logger(
@@ -59,7 +124,9 @@ class MosquitoMail(object):
                 )
         else:
             try:
-                self.server = smtplib.SMTP(self.settings.smtp_server, self.settings.smtp_port)
+                self.server = smtplib.SMTP(
+                    self.settings.smtp_server, self.settings.smtp_port, timeout=self._timeout()
+                )
 
             except Exception:
                 self._logger(
@@ -92,119 +159,281 @@ class MosquitoMail(object):
                     )
 
     def _logger(self, level, message):
-        if self.id and self.queue:
+        if level == "debug":
+            self.logger.debug(message)
+        elif level == "error":
+            self.logger.error(message)
+        elif level == "info":
+            self.logger.info(message)
+        elif level == "warning":
+            self.logger.warning(message)
+
+    def _timeout(self):
+        """ Timeout of a step of the SMTP session: smtp_timeout within the time budget of a configuration """
+
+        return remaining(self.settings.smtp_timeout_seconds)
+
+    def close(self):
+        """ Close the SMTP session """
+
+        if self.server:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+
+        self.server = None
+        self.status = False
+
+    def is_alive(self):
+        """ Check that the SMTP session is still usable """
+
+        if self.status:
+            try:
+                return self.server.noop()[0] == 250
+            except Exception:
+                return False
+
+        return False
+
+    def _transmit(self, recipients, msg):
+        """
+        Send a message to all recipients in a single transaction, the message is serialized straight to the socket.
+        Return recipients which have been refused.
+        """
+
+        self.server.sock.settimeout(self._timeout())
+        self.server.ehlo_or_helo_if_needed()
+
+        code, response = self.server.mail(self.settings.smtp_from)
+
+        if code != 250:
+            self.server.rset()
+            raise smtplib.SMTPSenderRefused(code, response, self.settings.smtp_from)
+
+        refused = []
+
+        for recipient in recipients:
+            code, response = self.server.rcpt(recipient)
+
+            if code not in (250, 251):
+                refused.append(recipient)
+
+        if len(refused) == len(recipients):
+            self.server.rset()
+            return refused
+
+        code, response = self.server.docmd("DATA")
+
+        if code != 354:
+            self.server.rset()
+            raise smtplib.SMTPDataError(code, response)
+
+        writer = MosquitoDataWriter(self.server.sock)
+        BytesGenerator(writer, mangle_from_=False, policy=msg.policy.clone(linesep='\r\n')).flatten(msg)
+        writer.close()
+
+        code, response = self.server.getreply()
+
+        if code != 250:
+            raise smtplib.SMTPDataError(code, response)
+
+        return refused
+
+    def _envelope(self, recipients, headers, priority, subject, body):
+        """ A message with headers and a body, attachments are added by _attach() """
+
+        msg = MIMEMultipart()
+        msg.set_charset('utf-8')
+
+        msg['From'] = self.settings.smtp_from
+        msg['To'] = ", ".join(recipients)
+
+        # Add headers
+        if headers:
+            for name, value in headers.items():
+                msg.add_header(name, value)
+
+        # Set a priority
+        if priority:
+            msg['X-Priority'] = priority
+
+        # Set a subject
+        subject = Header(subject, 'utf-8')
+        msg['Subject']= subject
+
+        # Add body
+        body = MIMEText(body, 'plain')
+        body.set_charset('utf-8')
+        msg.attach(body)
 
-            self.queue.put([
-                self.id,
-                level,
-                message
-            ])
+        return msg
+
+    def _attach(self, msg, grabbed, suffix=''):
+        """ Attach grabbed data (MosquitoGrabResult), "suffix" distinguishes file names of different messages """
+
+        name = self.settings.attachment_name + suffix
+
+        # Add grabbed html
+        if grabbed.html:
+            html = MIMEText(grabbed.html, self.settings.attachment_mime)
+            html.add_header('Content-Disposition', 'attachment', filename=name + '.html')
+            msg.attach(html)
+
+        # Add grabbed image
+        if grabbed.screenshot:
+            screenshot_format = image_format(grabbed.screenshot)
+
+            image = MIMEImage(grabbed.screenshot, screenshot_format)
+            image.add_header('Content-Disposition', 'attachment', filename=name + '.' + screenshot_format)
+            msg.attach(image)
+
+        # Add grabbed text
+        if grabbed.text:
+            text = MIMEText(grabbed.text, self.settings.attachment_mime)
+            text.add_header('Content-Disposition', 'attachment', filename=name + '.txt')
+            text.set_charset('utf-8')
+            msg.attach(text)
+
+        # Add grabbed image
+        if grabbed.images:
+            for image in grabbed.images:
+                image_data = image[0]
+                data_format = image[1]
+                image_name = image[2]
+
+                # Large images are read from the spool only while a message is assembled
+                if isinstance(image_data, MosquitoSpilled):
+                    image_data = image_data.read()
+
+                image = MIMEImage(image_data, data_format)
+                image.add_header(
+                    'Content-Disposition',
+                    'attachment',
+                    filename=name + image_name + "." + data_format.lower())
+                msg.attach(image)
+
+    def _deliver(self, recipients, msg):
+        """ Send an assembled message, return True if all recipients have got it """
+
+        try:
+            with get_metrics().timer('mosquito_mail_send_seconds'):
+                self.refused = self._transmit(recipients, msg)
+
+            if self.refused:
+                self._logger(
+                    "warning",
+                    "Recipients were refused: {}".format(", ".join(self.refused))
+                )
+
+                return False
+
+            self._logger(
+                "debug",
+                "Email has been sent: {}".format(", ".join(recipients))
+            )
+
+            return True
+
+        except Exception as error:
+
+            self._logger(
+                "warning",
+                "Cannot send letter to: {} -> {}".format(", ".join(recipients), error)
+            )
+
+            return False
+
+    def _recipients(self, email):
+        if isinstance(email, str):
+            return [email]
         else:
-            if level == "debug":
-                self.logger.debug(message)
-            elif level == "error":
-                self.logger.error(message)
-            elif level == "info":
-                self.logger.info(message)
-            elif level == "warning":
-                self.logger.warning(message)
+            return list(email)
+
+    def send(self, email, headers, priority, subject, body, grabbed=None):
+        """
+        Assemble a message once and send it to an email or a list of emails, grabbed data (MosquitoGrabResult) is
+        attached. Return True if all recipients have got the message, otherwise they are in "refused".
+        """
+
+        recipients = self._recipients(email)
 
-    def send(self, email, headers, priority, subject, body, html, screenshot, text, images):
+        self.refused = recipients
 
         if self.status:
             try:
-                msg = MIMEMultipart()
-                msg.set_charset('utf-8')
-
-                msg['From'] = self.settings.smtp_from
-                msg['To'] = email
-
-                # Add headers
-                if headers:
-                    for name, value in headers.items():
-                        msg.add_header(name, value)
-
-                # Set a priority
-                if priority:
-                    msg['X-Priority'] = priority
-
-                # Set a subject
-                subject = Header(subject, 'utf-8')
-                msg['Subject']= subject
-
-                # Add body
-                body = MIMEText(body, 'plain')
-                body.set_charset('utf-8')
-                msg.attach(body)
-
-                # Add grabbed html
-                if html:
-                    html = MIMEText(html, self.settings.attachment_mime)
-                    html.add_header('Content-Disposition', 'attachment', filename=self.settings.attachment_name + '.html')
-                    msg.attach(html)
-
-                # Add grabbed image
-                if screenshot:
-                    image = MIMEImage(screenshot, 'png')
-                    image.add_header('Content-Disposition', 'attachment', filename=self.settings.attachment_name + '.png')
-                    msg.attach(image)
-
-                # Add grabbed text
-                if text:
-                    text = MIMEText(text, self.settings.attachment_mime)
-                    text.add_header('Content-Disposition', 'attachment', filename=self.settings.attachment_name + '.txt')
-                    text.set_charset('utf-8')
-                    msg.attach(text)
-
-                # Add grabbed image
-                if images:
-                    for image in images:
-                        image_data = image[0]
-                        image_format = image[1]
-                        image_name = image[2]
-
-                        image = MIMEImage(image_data, image_format)
-                        image.add_header(
-                            'Content-Disposition',
-                            'attachment',
-                            filename=self.settings.attachment_name + image_name + "." + image_format.lower())
-                        msg.attach(image)
-
-                # Convert envelope to string
-                text = msg.as_string()
+                start = time.monotonic()
+
+                msg = self._envelope(recipients, headers, priority, subject, body)
+
+                if grabbed:
+                    self._attach(msg, grabbed)
+
+                get_metrics().observe('mosquito_mail_assemble_seconds', time.monotonic() - start)
 
                 self._logger(
                     "debug",
                     "Envelope has been assembled"
                 )
 
-                # Try to send letter
-                try:
-                    self.server.sendmail(self.settings.smtp_from, email, text)
+            except Exception as error:
+                self._logger(
+                    "warning",
+                    "Cannot assemble envelope: {}".format(error)
+                )
 
-                    self._logger(
-                        "debug",
-                        "Email has been sent: {}".format(email)
-                    )
+                return False
 
-                    return True
+            return self._deliver(recipients, msg)
 
-                except Exception as error:
+        else:
+            return False
 
-                    self._logger(
-                        "warning",
-                        "Cannot send letter to: {} -> {}".format(email, error)
-                    )
+    def send_digest(self, email, headers, priority, subject, body, items, max_size):
+        """
+        Send many messages as one email: "items" - grabbed data (MosquitoGrabResult) of every message.
+        Grabbed data is attached while its total size is under "max_size" (0 - no limit).
+        Return True if all recipients have got the digest, otherwise they are in "refused".
+        """
+
+        recipients = self._recipients(email)
+
+        self.refused = recipients
+
+        if self.status:
+            try:
+                start = time.monotonic()
+
+                msg = self._envelope(recipients, headers, priority, subject, body)
+                size = 0
 
-                    return False
+                for number, item in enumerate(items, 1):
+                    item_size = sum(len(x) for x in [item.html, item.screenshot, item.text] if x)
+                    item_size += sum(len(x[0]) for x in item.images)
+
+                    if max_size and size + item_size > max_size:
+                        self._logger(
+                            "debug",
+                            "Digest size limit has been reached, data of messages is not attached: {}".format(
+                                len(items) - number + 1)
+                        )
+
+                        break
+
+                    self._attach(msg, item, '-{}'.format(number))
+                    size += item_size
+
+                get_metrics().observe('mosquito_mail_assemble_seconds', time.monotonic() - start)
 
             except Exception as error:
                 self._logger(
                     "warning",
-                    "Cannot assemble envelope: {}".format(error)
+                    "Cannot assemble digest: {}".format(error)
                 )
 
                 return False
 
+            return self._deliver(recipients, msg)
+
         else:
             return False
@@ -1,79 +1,101 @@
 #!/usr/bin/env python3
 
-import ast
-import eventlet
+import calendar
 import feedparser
 import logging
+import re
 import requests
 import time
 
 from datetime import datetime
+from email.utils import parsedate_tz
 from io import BytesIO
-from mosquito.settings import MosquitoSettings
+from mosquito.cache import read_response
+from mosquito.deadline import remaining
+from mosquito.message import MosquitoMessage
+from mosquito.metrics import get_metrics
+from mosquito.settings import get_settings
 
+# Ordering of a feed (reverse-chronological or not) is re-checked by reading all entries once a day
+ORDER_CHECK_INTERVAL = 86400
 
-class MosquitoRSS(object):
-    def __init__(self, id=None, queue=None):
-        self.id = id
-        self.queue = queue
+# Root elements of feeds which are read by the lxml parser: RSS 0.9x/2.0, RSS 1.0 (RDF), Atom
+FEED_ROOTS = ['rss', 'RDF', 'feed']
 
-        self.logger = logging.getLogger('[RSS]')
-        self.settings = MosquitoSettings()
+ISO8601 = re.compile(
+    r'(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2})(?::(\d{2}))?(?:\.\d+)?)?\s*(Z|[+-]\d{2}:?\d{2})?$'
+)
 
-    def _logger(self, level, message):
-        if self.id and self.queue:
 
-            self.queue.put([
-                self.id,
-                level,
-                message
-            ])
+def _localname(tag):
+    """ Tag name without a namespace, comments and processing instructions don't have a name """
+
+    if isinstance(tag, str):
+        return tag.rpartition('}')[2]
+
+    return ''
+
+
+def _parse_date(value):
+    """ RFC 822 (RSS) or ISO 8601 (Atom, Dublin Core) date to a timestamp like feedparser does, None if it's invalid """
+
+    if not value:
+        return None
+
+    value = value.strip()
+    match = ISO8601.match(value)
+
+    try:
+        if match:
+            year, month, day, hour, minute, second, zone = match.groups()
+            utc = calendar.timegm((int(year), int(month), int(day), int(hour or 0), int(minute or 0),
+                                   int(second or 0), 0, 0, 0))
+
+            if zone and zone != 'Z':
+                zone = zone.replace(':', '')
+                offset = int(zone[1:3]) * 3600 + int(zone[3:5]) * 60
+                utc -= offset if zone[0] == '+' else -offset
         else:
-            if level == "debug":
-                self.logger.debug(message)
-            elif level == "error":
-                self.logger.error(message)
-            elif level == "info":
-                self.logger.info(message)
-            elif level == "warning":
-                self.logger.warning(message)
-
-    def fetch(self, url):
-        messages = []
+            parsed = parsedate_tz(value)
 
-        eventlet.monkey_patch()
+            if not parsed:
+                return None
 
-        headers = {'User-Agent': self.settings.user_agent}
+            utc = calendar.timegm(parsed[:6] + (0, 0, 0)) - (parsed[9] or 0)
 
-        with eventlet.Timeout(self.settings.grab_timeout):
-            try:
-                with requests.get(url, headers=headers, verify=ast.literal_eval(self.settings.check_ssl)) as r:
-                    content = BytesIO(r.content)
-                    feed = feedparser.parse(content)
+        return time.mktime(time.gmtime(utc))
 
-            except eventlet.timeout.Timeout:
-                self._logger(
-                    "warning",
-                    "Timeout for URL was reached: {}".format(url)
-                )
+    except (ValueError, OverflowError):
+        return None
 
-                return messages
 
-            except requests.exceptions.SSLError:
-                self._logger(
-                    "warning",
-                    "SSL verification for URL was failed: {}".format(url)
-                )
+class MosquitoRSS(object):
+    def __init__(self, parser=None):
+        self.logger = logging.getLogger('[RSS]')
+        self.settings = get_settings()
 
-                return messages
+        # Feed parser: "auto" - lxml with a fallback to feedparser, "lxml" or "feedparser"
+        self.parser = parser or self.settings.rss_parser
 
-            except Exception as error:
-                self._logger(
-                    "warning",
-                    "Cannot grab HTML from URL: {} -> {}".format(url, error)
-                )
+        # Response of the last fetch, None if the source couldn't be reached, amount of entries in a feed
+        self.http_status = None
+        self.feed_bytes = 0
+        self.entries = 0
+
+    def _logger(self, level, message):
+        if level == "debug":
+            self.logger.debug(message)
+        elif level == "error":
+            self.logger.error(message)
+        elif level == "info":
+            self.logger.info(message)
+        elif level == "warning":
+            self.logger.warning(message)
+
+    def _feedparser_entries(self, content):
+        """ Entries of any feed which feedparser understands: [timestamp, title, url] """
 
-                return messages
+        feed = feedparser.parse(BytesIO(content))
 
         for post in feed.entries:
             url = None
@@ -84,45 +106,220 @@ class MosquitoRSS(object):
                 if len(post.links[0]['href']) > 0:
                     url = post.links[0]['href']
             except Exception:
+                pass
+
+            # Get timestamp from a post
+            for key in ['updated_parsed', 'published_parsed']:
+                try:
+                    timestamp = time.mktime(post[key])
+                    break
+                except Exception:
+                    pass
+
+            # Try to obtain title of a post
+            try:
+                title = post.title
+            except Exception:
+                title = "None"
+
+            yield [timestamp, title, url]
+
+    def _lxml_entries(self, content):
+        """
+        Entries of a well-formed RSS/Atom feed: [timestamp, title, url]. The document is parsed while entries are
+        read, processed elements are freed.
+        """
+
+        from lxml import etree
+
+        root = None
+
+        for event, element in etree.iterparse(BytesIO(content), events=('start', 'end'), resolve_entities=False,
+                                              no_network=True):
+            if root is None:
+                root = element
+
+                if _localname(root.tag) not in FEED_ROOTS:
+                    raise ValueError("Unknown feed format: {}".format(_localname(root.tag)))
+
+            if event != 'end' or _localname(element.tag) not in ['item', 'entry']:
+                continue
+
+            title = "None"
+            url = None
+            updated = None
+            published = None
+
+            for child in element:
+                name = _localname(child.tag)
+
+                if name == 'title':
+                    title = ''.join(child.itertext()).strip()
+                elif name == 'link' and not url:
+                    url = child.get('href') or (child.text or '').strip() or None
+                elif name in ['updated', 'modified'] and not updated:
+                    updated = child.text
+                elif name in ['pubDate', 'published', 'date', 'issued'] and not published:
+                    published = child.text
+
+            yield [_parse_date(updated) or _parse_date(published), title, url]
+
+            # Entries which have been read aren't needed anymore
+            element.clear()
+
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+    def _read(self, entries, state, since):
+        """
+        Read entries which are newer than "since". A reverse-chronological feed is read up to the first older entry,
+        "state" of a configuration keeps the detected ordering.
+        """
+
+        messages = []
+
+        # Ordering of a feed is verified by a full pass once per ORDER_CHECK_INTERVAL
+        ordered = bool(state and state.get('ordered'))
+        full_pass = state is None or not ordered or \
+            time.time() - state.get('order_checked', 0) > ORDER_CHECK_INTERVAL
+
+        in_order = True
+        previous = None
+        count = 0
+        skipped = 0
+
+        for timestamp, title, url in entries:
+            count += 1
+
+            if timestamp is None:
+                in_order = False
+
+                # Make timestamp based on current time if there are no any internal timestamps in a post
+                self._logger(
+                    "warning",
+                    "Cannot find timestamp of a post. Set current timestamp as a post timestamp"
+                )
+
+                timestamp = time.mktime(datetime.utcnow().timetuple())
+
+            elif previous is not None and timestamp > previous:
+                in_order = False
+
+            previous = timestamp
+
+            if since is not None and timestamp <= since:
+                skipped += 1
+
+                if ordered and in_order and not full_pass:
+                    # The rest of a reverse-chronological feed is older
+                    break
+
+                continue
+
+            if not url:
                 self._logger(
                     "warning",
                     "Cannot find an URL in a post"
                 )
 
-            # Get timestamp from a post
+            messages.append(MosquitoMessage(int(timestamp), title, url))
+
+        self.entries = count
+
+        if skipped:
+            get_metrics().inc('mosquito_messages_skipped_total', skipped, reason='old')
+
+        if state is not None:
+            if full_pass:
+                state['ordered'] = in_order
+                state['order_checked'] = int(time.time())
+            elif not in_order:
+                state['ordered'] = False
+
+        return messages
+
+    def fetch(self, url, state=None, since=None):
+        """ Fetch entries which are newer than "since" (see _read()) """
+
+        messages = []
+
+        self.http_status = None
+        self.feed_bytes = 0
+        self.entries = 0
+
+        headers = {'User-Agent': self.settings.user_agent}
+
+        try:
+            timeout = remaining(self.settings.grab_timeout)
+
+            with requests.get(url, headers=headers, verify=self.settings.check_ssl, stream=True, timeout=timeout) as r:
+                self.http_status = r.status_code
+
+                content = read_response(r, self.settings.http_max_size, timeout)
+                self.feed_bytes = len(content)
+
+                get_metrics().inc('mosquito_downloaded_bytes_total', len(content), stage='feed')
+
+        except (requests.exceptions.Timeout, TimeoutError):
+            self._logger(
+                "warning",
+                "Timeout for URL was reached: {}".format(url)
+            )
+
+            return messages
+
+        except requests.exceptions.SSLError:
+            self._logger(
+                "warning",
+                "SSL verification for URL was failed: {}".format(url)
+            )
+
+            return messages
+
+        except Exception as error:
+            self._logger(
+                "warning",
+                "Cannot grab HTML from URL: {} -> {}".format(url, error)
+            )
+
+            return messages
+
+        messages = None
+
+        if self.parser != "feedparser":
             try:
-                timestamp = time.mktime(post.updated_parsed)
-            except Exception:
+                messages = self._read(self._lxml_entries(content), state, since)
+
+            except ImportError as error:
+                if self.parser == "lxml":
+                    self._logger(
+                        "error",
+                        "lxml is required by rss_parser = lxml: {}".format(error)
+                    )
+
+                    return []
+
                 self._logger(
-                    "warning",
-                    "Cannot find timestamp of a post"
+                    "debug",
+                    "lxml isn't available, using feedparser: {}".format(error)
                 )
 
-            if not timestamp:
-                try:
-                    timestamp = time.mktime(post.published_parsed)
-                except Exception:
+            except Exception as error:
+                if self.parser == "lxml":
                     self._logger(
                         "warning",
-                        "Cannot find timestamp of a post"
+                        "Cannot parse a feed: {} -> {}".format(url, error)
                     )
 
-            # Make timestamp based on current time if there are no any internal timestamps in a post
-            if not timestamp:
+                    return []
+
                 self._logger(
-                    "warning",
-                    "Set current timestamp as a post timestamp"
+                    "debug",
+                    "Feed isn't a well-formed RSS/Atom, using feedparser: {} -> {}".format(url, error)
                 )
 
-                timestamp = time.mktime(datetime.utcnow().timetuple())
-
-            # Try to obtain title of a post
-            try:
-                title = post.title
-            except Exception:
-                title = "None"
-                
-            messages.append([int(timestamp), title, url])
+        if messages is None:
+            messages = self._read(self._feedparser_entries(content), state, since)
 
         self._logger(
             "debug",
@@ -1,34 +1,73 @@
 #!/usr/bin/env python3
 
-import eventlet
 import logging
+import requests
 import time
 import twitter
 
 from datetime import datetime
-from mosquito.settings import MosquitoSettings
+from mosquito.deadline import remaining
+from mosquito.message import MosquitoMessage
+from mosquito.settings import get_settings
 
+# Twitter client of a pool worker: [api, status], it's kept once credentials have been verified
+_client = None
+
+# Size of a timeline page and maximum amount of pages (Twitter returns up to 3200 recent tweets)
+PAGE_SIZE = 200
+PAGES = 16
 
-class MosquitoTwitter(object):
-    def __init__(self, id=None, queue=None):
-        self.id = id
-        self.queue = queue
 
+class MosquitoTwitter(object):
+    def __init__(self):
         self.logger = logging.getLogger('[TWITTER]')
-        self.settings = MosquitoSettings()
-        self.status = False
-        
+        self.settings = get_settings()
+
+        # Result of the last fetch, None if the timeline couldn't be retrieved, amount of tweets
+        self.http_status = None
+        self.feed_bytes = 0
+        self.entries = 0
+
+        self.api, self.status = self._connect()
+
+    def _logger(self, level, message):
+        if level == "debug":
+            self.logger.debug(message)
+        elif level == "error":
+            self.logger.error(message)
+        elif level == "info":
+            self.logger.info(message)
+        elif level == "warning":
+            self.logger.warning(message)
+
+    def _api(self, timeout):
+        """ Return a client whose requests time out after "timeout" seconds (None - no limit) """
+
+        return twitter.Api(
+            consumer_key=self.settings.twitter_consumer_key,
+            consumer_secret=self.settings.twitter_consumer_secret,
+            access_token_key=self.settings.twitter_access_token_key,
+            access_token_secret=self.settings.twitter_access_token_secret,
+            timeout=timeout
+        )
+
+    def _connect(self):
+        """ Return the client of the current worker, log in until it succeeds """
+
+        global _client
+
+        if _client:
+            return _client
+
+        api = None
+        status = False
+
         if self.settings.twitter:
             try:
-                self.api = twitter.Api(
-                    consumer_key=self.settings.twitter_consumer_key,
-                    consumer_secret=self.settings.twitter_consumer_secret,
-                    access_token_key=self.settings.twitter_access_token_key,
-                    access_token_secret=self.settings.twitter_access_token_secret
-                )
+                api = self._api(self.settings.grab_timeout or None)
 
-                self.api.VerifyCredentials()
-                self.status = True
+                api.VerifyCredentials()
+                status = True
 
                 self._logger(
                     "debug",
@@ -46,40 +85,74 @@ class MosquitoTwitter(object):
                 "Twitter settings are not set. The plugin has been disabled"
             )
 
-    def _logger(self, level, message):
-        if self.id and self.queue:
+        if status:
+            _client = [api, status]
+
+        return [api, status]
+
+    def fetch(self, url, state=None, since=None):
+        """
+        Fetch new tweets of a timeline. "state" of a configuration keeps the highest seen tweet ID (since_id), older
+        pages are requested (max_id) while every page is full.
+        """
 
-            self.queue.put([
-                self.id,
-                level,
-                message
-            ])
-        else:
-            if level == "debug":
-                self.logger.debug(message)
-            elif level == "error":
-                self.logger.error(message)
-            elif level == "info":
-                self.logger.info(message)
-            elif level == "warning":
-                self.logger.warning(message)
-
-    def fetch(self, url):
         messages = []
 
-        eventlet.monkey_patch()
+        self.http_status = None
+        self.entries = 0
 
         if self.status:
-            with eventlet.Timeout(self.settings.grab_timeout):
-                try:
-                    posts = self.api.GetUserTimeline(screen_name=url, count=200)
-                except eventlet.timeout.Timeout:
-                    self._logger(
-                        "warning",
-                        "Timeout for URL was reached: {}".format(url)
-                    )
+            since_id = state.get('since_id') if state is not None else None
+            max_id = None
+            posts = []
+
+            try:
+                for page in range(1, PAGES + 1):
+                    # Every page gets grab_timeout within what is left of the time budget of the configuration,
+                    # python-twitter takes a timeout on construction only (which doesn't make requests)
+                    api = self._api(remaining(self.settings.grab_timeout))
+
+                    timeline = api.GetUserTimeline(
+                        screen_name=url, count=PAGE_SIZE, since_id=since_id, max_id=max_id)
+                    posts.extend(timeline)
+
+                    # The first fetch takes one page only, a full page means there can be a gap
+                    if not since_id or len(timeline) < PAGE_SIZE:
+                        break
+
+                    if page == PAGES:
+                        # The API doesn't return older tweets than the last 3200
+                        self._logger(
+                            "warning",
+                            "Timeline has more new tweets than can be fetched, older ones are skipped: {} ({})".format(
+                                url, len(posts))
+                        )
+
+                    max_id = min(x.id for x in timeline) - 1
+
+                self.http_status = 200
+
+            except (requests.exceptions.Timeout, TimeoutError):
+                self._logger(
+                    "warning",
+                    "Timeout for URL was reached: {}".format(url)
+                )
+
+                return messages
+
+            except Exception as error:
+                self._logger(
+                    "warning",
+                    "Cannot get a timeline: {} -> {}".format(url, error)
+                )
+
+                return messages
+
+            self.entries = len(posts)
 
-                    return messages
+            # The state isn't saved if a part of tweets hasn't been delivered in time, since_id doesn't pass them
+            if posts and state is not None:
+                state['since_id'] = max(x.id for x in posts)
 
             for post in posts:
                 url = None
@@ -88,7 +161,7 @@ class MosquitoTwitter(object):
                 if len(post.urls) > 0:
                     url = post.urls[0].expanded_url
 
-                messages.append([int(timestamp), post.text, url])
+                messages.append(MosquitoMessage(int(timestamp), post.text, url))
 
             self._logger(
                 "debug",
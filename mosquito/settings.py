@@ -2,13 +2,65 @@
 
 import logging
 import os
+import re
 import sys
 import configparser
 
+# Process-wide settings snapshot, forked workers inherit it
+_settings = None
+
+
+def get_settings():
+    """ Return the settings snapshot, load it once per process """
+
+    global _settings
+
+    if not _settings:
+        _settings = MosquitoSettings()
+
+    return _settings
+
+
+def parse_interval(interval):
+    """ Convert an interval (1s, 2m, 3h, 4d or digits) to seconds """
+
+    match = re.fullmatch('([0-9]+)([smhd]?)', str(interval))
+
+    if not match:
+        raise ValueError("Time interval must be a digit or a digit with suffix: {}".format(interval))
+
+    return int(match.group(1)) * {'': 1, 's': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}[match.group(2)]
+
+
+def reload_settings():
+    """
+    Reload the settings snapshot if the configuration file has been changed.
+    The snapshot is replaced as a whole, invalid changes are ignored. Return True if settings have been reloaded.
+    """
+
+    global _settings
+
+    settings = get_settings()
+
+    try:
+        if os.stat(settings.inifile).st_mtime_ns == settings.mtime:
+            return False
+
+        _settings = MosquitoSettings(strict=False)
+
+        settings.logger.info("Configuration file has been reloaded: {}".format(settings.inifile))
+
+        return True
+
+    except Exception as error:
+        settings.logger.error("Cannot reload configuration file, previous settings are kept: {}".format(error))
+
+        return False
+
 
 class MosquitoSettings(object):
     
-    def __init__(self):
+    def __init__(self, strict=True):
         # Set logger
         self.logger = logging.getLogger('[SETTINGS]')
         
@@ -17,25 +69,63 @@ class MosquitoSettings(object):
         
         if not os.path.exists(inifile):
             self.logger.error("Configuration file doesn't found. You should place \".mosquito.ini\" into your home directory.")
+
+            if not strict:
+                raise FileNotFoundError(inifile)
+
             sys.exit(1)        
+
+        self.inifile = inifile
+        self.mtime = os.stat(inifile).st_mtime_ns
+        self.twitter = False
         
         settings = configparser.RawConfigParser(
             {
                 'alert_email': None,
                 'alert_interval': '1d',
                 'alert_subject': '***Mosquito: No new data ***',
+                'archive_max_age': '30d',
+                'archive_max_rows': 0,
+                'archive_max_size': 1073741824,
                 'attachment_mime': 'logstash',
                 'attachment_name': 'mosquito',
                 'check_ssl': 'True',
+                'config_timeout': '10m',
+                'daemon_interval': '1m',
                 'destination': None,
+                'digest_max_size': 10485760,
+                'drain_batch': 50,
+                'drain_backoff_min': '5s',
+                'drain_backoff_max': '30m',
+                'drain_interval': '1m',
+                'drain_retries': 5,
+                'exec_keep': 'failed',
+                'exec_keep_age': '1d',
+                'exec_max_inflight': 4,
                 'exec_path': '/tmp/mosquito',
+                'exec_pool': 8,
+                'exec_spool_size': 0,
+                'exec_stderr_size': 1024,
+                'exec_timeout': '5m',
                 'browser_path': None,
                 'browser_driver_path': None,
+                'grab_spill_size': 1048576,
                 'grab_timeout': 60,
+                'http_cache_path': '/tmp/mosquito-cache',
+                'http_cache_size': 0,
+                'http_max_size': 20971520,
+                'images_convert': '',
+                'images_edge': 0,
                 'images_min': '600x300',
                 'images_max': '800x600',
+                'images_quality': 85,
+                'images_strip': 'False',
+                'journal_max_age': '30d',
                 'lock_file': '/tmp/mosquito.lock',
+                'metrics_file': None,
+                'metrics_port': 0,
                 'regex': '.*',
+                'rss_parser': 'auto',
                 'regex_action': 'subject=Mosquito:',
                 'smtp_server': 'localhost',
                 'smtp_port': 25,
@@ -44,11 +134,15 @@ class MosquitoSettings(object):
                 'smtp_from': None,
                 'smtp_username': None,
                 'smtp_password': None,
+                'smtp_timeout': '1m',
                 'subject_length': 100,
                 'pool': 2,
+                'pool_max_rss': 0,
+                'pool_max_tasks': 0,
                 'update_alert': '7d',
                 'update_interval': '15m',
                 'user_agent': 'Mozilla/5.0 (Windows NT 10.0; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/52.0.2743.116 Safari/537.36',
+                'log_format': 'text',
                 'log_level': 'info'
             }
         )
@@ -58,20 +152,50 @@ class MosquitoSettings(object):
             settings.read(inifile)
             
             self.destination = self._parse_variables(settings.get('main', 'destination'))
+            self.daemon_interval = settings.get('main', 'daemon_interval')
+            self.digest_max_size = int(settings.get('main', 'digest_max_size'))
+            self.drain_batch = int(settings.get('main', 'drain_batch'))
+            self.drain_backoff_min = settings.get('main', 'drain_backoff_min')
+            self.drain_backoff_max = settings.get('main', 'drain_backoff_max')
+            self.drain_interval = settings.get('main', 'drain_interval')
+            self.drain_retries = int(settings.get('main', 'drain_retries'))
             self.alert_email = settings.get('main', 'alert_email')
             self.alert_interval = settings.get('main', 'alert_interval')
             self.alert_subject = settings.get('main', 'alert_subject')
+            self.archive_max_age = settings.get('main', 'archive_max_age')
+            self.archive_max_rows = int(settings.get('main', 'archive_max_rows'))
+            self.archive_max_size = int(settings.get('main', 'archive_max_size'))
             self.attachment_mime = settings.get('main', 'attachment_mime')
             self.attachment_name = settings.get('main', 'attachment_name')
             self.browser_path = settings.get('main', 'browser_path')
             self.browser_driver_path = settings.get('main', 'browser_driver_path')
-            self.check_ssl = settings.get('main', 'check_ssl')
+            self.check_ssl = settings.getboolean('main', 'check_ssl')
+            self.config_timeout = settings.get('main', 'config_timeout')
+            self.exec_keep = settings.get('main', 'exec_keep')
+            self.exec_keep_age = settings.get('main', 'exec_keep_age')
+            self.exec_max_inflight = int(settings.get('main', 'exec_max_inflight'))
             self.exec_path = settings.get('main', 'exec_path')
+            self.exec_pool = int(settings.get('main', 'exec_pool'))
+            self.exec_spool_size = int(settings.get('main', 'exec_spool_size'))
+            self.exec_stderr_size = int(settings.get('main', 'exec_stderr_size'))
+            self.exec_timeout = settings.get('main', 'exec_timeout')
+            self.grab_spill_size = int(settings.get('main', 'grab_spill_size'))
             self.grab_timeout = int(settings.get('main', 'grab_timeout'))
+            self.http_cache_path = settings.get('main', 'http_cache_path')
+            self.http_cache_size = int(settings.get('main', 'http_cache_size'))
+            self.http_max_size = int(settings.get('main', 'http_max_size'))
+            self.images_convert = settings.get('main', 'images_convert').lower()
+            self.images_edge = int(settings.get('main', 'images_edge'))
             self.images_min = settings.get('main', 'images_min')
             self.images_max = settings.get('main', 'images_max')
+            self.images_quality = int(settings.get('main', 'images_quality'))
+            self.images_strip = settings.getboolean('main', 'images_strip')
+            self.journal_max_age = settings.get('main', 'journal_max_age')
             self.lock_file = settings.get('main', 'lock_file')
+            self.metrics_file = settings.get('main', 'metrics_file')
+            self.metrics_port = int(settings.get('main', 'metrics_port'))
             self.regex = self._parse_variables(settings.get('main', 'regex'))
+            self.rss_parser = settings.get('main', 'rss_parser')
             self.regex_action = self._parse_variables(settings.get('main', 'regex_action'))
             self.smtp_server = settings.get('main', 'smtp_server')
             self.smtp_port = int(settings.get('main', 'smtp_port'))
@@ -80,11 +204,15 @@ class MosquitoSettings(object):
             self.smtp_from = settings.get('main', 'smtp_from')
             self.smtp_username = settings.get('main', 'smtp_username')
             self.smtp_password = settings.get('main', 'smtp_password')
+            self.smtp_timeout = settings.get('main', 'smtp_timeout')
             self.subject_length = int(settings.get('main', 'subject_length'))
             self.pool = int(settings.get('main', 'pool'))
+            self.pool_max_rss = int(settings.get('main', 'pool_max_rss'))
+            self.pool_max_tasks = int(settings.get('main', 'pool_max_tasks'))
             self.update_alert = settings.get('main', 'update_alert')
             self.update_interval = settings.get('main', 'update_interval')
             self.user_agent = settings.get('main', 'user_agent')
+            self.log_format = settings.get('main', 'log_format')
             self.log_level = settings.get('main', 'log_level')
             
             # Try to obtain Twitter settings
@@ -98,10 +226,45 @@ class MosquitoSettings(object):
                 except:
                     pass
 
+            if self.exec_keep not in ['never', 'failed', 'always']:
+                raise ValueError("exec_keep must be one of: never, failed, always")
+
+            if self.rss_parser not in ['auto', 'lxml', 'feedparser']:
+                raise ValueError("rss_parser must be one of: auto, lxml, feedparser")
+
+            if self.images_convert not in ['', 'jpeg', 'png', 'webp']:
+                raise ValueError("images_convert must be one of: jpeg, png, webp")
+
+            # Pre-parsed values
+            self.alert_interval_seconds = parse_interval(self.alert_interval)
+            self.archive_max_age_seconds = parse_interval(self.archive_max_age)
+            self.config_timeout_seconds = parse_interval(self.config_timeout)
+            self.daemon_interval_seconds = parse_interval(self.daemon_interval)
+            self.drain_backoff_min_seconds = parse_interval(self.drain_backoff_min)
+            self.drain_backoff_max_seconds = parse_interval(self.drain_backoff_max)
+            self.drain_interval_seconds = parse_interval(self.drain_interval)
+            self.exec_keep_age_seconds = parse_interval(self.exec_keep_age)
+            self.exec_timeout_seconds = parse_interval(self.exec_timeout)
+            self.journal_max_age_seconds = parse_interval(self.journal_max_age)
+            self.smtp_timeout_seconds = parse_interval(self.smtp_timeout)
+
         except Exception as error:
             self.logger.error('Invalid configuration file: {} {}'.format(inifile, error))
+
+            if not strict:
+                raise
+
             sys.exit(1)
 
+        # Settings are shared between processes, they must not be changed after loading
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        if getattr(self, '_frozen', False):
+            raise AttributeError("Settings are read-only: {}".format(name))
+
+        object.__setattr__(self, name, value)
+
     def _parse_variables(self, values):
         if values:
             values = values.split(',')
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import shutil
+import time
+
+from uuid import UUID, uuid4
+
+from mosquito.images import image_format
+from mosquito.settings import get_settings
+
+# Spool of a pool worker, its usage is shared by all spills and scripts of the worker
+_spool = None
+
+# Names of entries which are created by the spool in exec_path
+PAYLOAD_PREFIX = '.payload-'
+WORK_PREFIX = 'work-'
+
+
+def get_spool():
+    """ Return the spool of the current process """
+
+    global _spool
+
+    if not _spool:
+        _spool = MosquitoSpool()
+
+    return _spool
+
+
+class MosquitoSpilled(object):
+    """ Grabbed data which is kept in a spool file instead of memory, its length is the size of the file """
+
+    __slots__ = ['path', 'size']
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def read(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+
+class MosquitoSpool(object):
+    """
+    Working directories of exec destinations (exec_path, e.g. on a tmpfs):
+    ".payload-<uuid>" - grabbed data of a message, it's written once
+    ".spill/<uuid>" - large grabbed images which are not kept in memory (grab_spill_size)
+    "work-<uuid>" - a working directory of a script, files are hard links to a payload
+    ".kept/work-<uuid>" - working directories of finished scripts which are kept by the exec_keep policy
+    Other entries of exec_path are never touched.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger('[SPOOL]')
+        self.settings = get_settings()
+
+        self.path = self.settings.exec_path
+        self.kept_path = os.path.join(self.path, '.kept')
+        self.spill_path = os.path.join(self.path, '.spill')
+
+        # Size of the spool, it's recalculated once per second
+        self.usage = 0
+        self.usage_time = 0
+
+    def _logger(self, level, message):
+        if level == "debug":
+            self.logger.debug(message)
+        elif level == "error":
+            self.logger.error(message)
+        elif level == "info":
+            self.logger.info(message)
+        elif level == "warning":
+            self.logger.warning(message)
+
+    def _remove(self, path):
+        shutil.rmtree(path, ignore_errors=True)
+
+    def _size(self, path):
+        """ Size of files in a directory, hard links are counted once """
+
+        size = 0
+        inodes = set()
+
+        for root, dirs, files in os.walk(path):
+            for filename in files:
+                try:
+                    stat = os.lstat(os.path.join(root, filename))
+                except OSError:
+                    continue
+
+                if stat.st_ino not in inodes:
+                    inodes.add(stat.st_ino)
+                    size += stat.st_size
+
+        return size
+
+    def _reserve(self, size):
+        """ Check that data fits the spool, drop the oldest kept directories if it doesn't """
+
+        if not self.settings.exec_spool_size:
+            return True
+
+        if time.monotonic() - self.usage_time >= 1:
+            self.usage = self._size(self.path)
+            self.usage_time = time.monotonic()
+
+        if self.usage + size > self.settings.exec_spool_size and os.path.isdir(self.kept_path):
+            kept = sorted(os.scandir(self.kept_path), key=lambda x: x.stat().st_mtime)
+
+            for entry in kept:
+                if self.usage + size <= self.settings.exec_spool_size:
+                    break
+
+                self.usage -= self._size(entry.path)
+                self._remove(entry.path)
+
+                self._logger(
+                    "debug",
+                    "Spool is full, kept directory has been dropped: {}".format(entry.path)
+                )
+
+        if self.usage + size > self.settings.exec_spool_size:
+            self._logger(
+                "warning",
+                "Spool is full: {} ({} + {} > {} bytes)".format(
+                    self.path, self.usage, size, self.settings.exec_spool_size)
+            )
+
+            return False
+
+        self.usage += size
+
+        return True
+
+    def _write(self, filename, data, mode):
+        if data:
+            try:
+                # Spilled data is already in the spool
+                if isinstance(data, MosquitoSpilled):
+                    try:
+                        os.link(data.path, filename)
+                    except OSError:
+                        shutil.copyfile(data.path, filename)
+
+                    return True
+
+                with open(filename, mode) as f:
+                    f.write(data)
+
+                return True
+
+            except Exception as error:
+                self._logger(
+                    "error",
+                    "Cannot write data to a temporary file: {} -> {}".format(filename, error)
+                )
+
+        return False
+
+    def write(self, message):
+        """ Write a title and grabbed data of a message once, return a payload for link() or None """
+
+        title = message.title
+        grabbed = message.grabbed
+        size = 0
+
+        for data in [title, grabbed.html, grabbed.text]:
+            if data:
+                size += len(data.encode('utf-8'))
+
+        size += len(grabbed.screenshot or b'')
+
+        for image in grabbed.images:
+            if not isinstance(image[0], MosquitoSpilled):
+                size += len(image[0])
+
+        if not self._reserve(size):
+            return None
+
+        path = os.path.join(self.path, PAYLOAD_PREFIX + str(uuid4()))
+
+        try:
+            os.makedirs(path)
+        except Exception as error:
+            self._logger(
+                "error",
+                "Cannot create a temporary directory where data will be processed: {}".format(error)
+            )
+
+            return None
+
+        files = {}
+
+        for name, filename, data, mode in [
+            ["title", "title.txt", title, "w"],
+            ["html", "content.html", grabbed.html, "w"],
+            ["screenshot", "screenshot." + image_format(grabbed.screenshot or b''), grabbed.screenshot, "wb"],
+            ["text", "content.txt", grabbed.text, "w"]
+        ]:
+            if self._write(os.path.join(path, filename), data, mode):
+                files[name] = filename
+
+        if grabbed.images:
+            files["images"] = []
+
+            try:
+                os.makedirs(os.path.join(path, "images"))
+            except Exception as error:
+                self._logger(
+                    "error",
+                    "Cannot create a temporary directory where images will be saved: {}".format(error)
+                )
+
+            for image_data, data_format, image_name in grabbed.images:
+                filename = "images/" + image_name + "." + data_format.lower()
+
+                if self._write(os.path.join(path, filename), image_data, "wb"):
+                    files["images"].append(filename)
+
+        self._logger(
+            "debug",
+            "Payload has been written: {}".format(path)
+        )
+
+        return {'path': path, 'title': title, 'files': files}
+
+    def spill(self, data):
+        """ Move data to a spool file, the data itself is returned if it cannot be written """
+
+        if not self._reserve(len(data)):
+            return data
+
+        path = os.path.join(self.spill_path, str(uuid4()))
+
+        try:
+            os.makedirs(self.spill_path, exist_ok=True)
+
+            with open(path, 'wb') as f:
+                f.write(data)
+
+        except Exception as error:
+            self._logger(
+                "warning",
+                "Cannot spill data to a file: {} -> {}".format(path, error)
+            )
+
+            return data
+
+        self._logger(
+            "debug",
+            "Data has been spilled to a file: {} ({} bytes)".format(path, len(data))
+        )
+
+        return MosquitoSpilled(path, len(data))
+
+    def discard_spilled(self, images):
+        """ Remove spool files of grabbed images: [[data, format, name], ...] """
+
+        for image in images or []:
+            if isinstance(image[0], MosquitoSpilled):
+                try:
+                    os.remove(image[0].path)
+                except OSError:
+                    pass
+
+    def link(self, payload):
+        """ Create a working directory of a script, return the directory and paths of files """
+
+        working_path = os.path.join(self.path, WORK_PREFIX + str(uuid4()))
+
+        try:
+            os.makedirs(working_path)
+
+            if "images" in payload['files']:
+                os.makedirs(os.path.join(working_path, "images"))
+
+            for filename in [x for x in payload['files'].values() if isinstance(x, str)] + \
+                    payload['files'].get("images", []):
+                try:
+                    os.link(os.path.join(payload['path'], filename), os.path.join(working_path, filename))
+                except OSError:
+                    shutil.copyfile(os.path.join(payload['path'], filename), os.path.join(working_path, filename))
+
+        except Exception as error:
+            self._logger(
+                "error",
+                "Cannot create a working directory: {} -> {}".format(working_path, error)
+            )
+
+            self._remove(working_path)
+
+            return None, {}
+
+        files = {}
+
+        for name, value in payload['files'].items():
+            if isinstance(value, list):
+                files[name] = [os.path.join(working_path, x) for x in value]
+            else:
+                files[name] = os.path.join(working_path, value)
+
+        return working_path, files
+
+    def discard(self, payload):
+        """ Remove a payload, data is freed when the last working directory is released """
+
+        self._remove(payload['path'])
+
+    def release(self, working_path, success):
+        """ Remove a working directory of a finished script or keep it (exec_keep: never, failed, always) """
+
+        if self.settings.exec_keep == 'always' or (self.settings.exec_keep == 'failed' and not success):
+            try:
+                os.makedirs(self.kept_path, exist_ok=True)
+                os.rename(working_path, os.path.join(self.kept_path, os.path.basename(working_path)))
+
+                return
+
+            except Exception as error:
+                self._logger(
+                    "warning",
+                    "Cannot keep a working directory: {} -> {}".format(working_path, error)
+                )
+
+        self._remove(working_path)
+
+    def _owned(self, name):
+        """ Check that an entry of exec_path has been created by the spool (bare UUIDs - by older versions) """
+
+        if name.startswith(PAYLOAD_PREFIX) or name.startswith(WORK_PREFIX):
+            return True
+
+        try:
+            return str(UUID(name)) == name
+        except ValueError:
+            return False
+
+    def clean(self):
+        """ Remove kept and abandoned directories which are older than exec_keep_age """
+
+        deadline = time.time() - self.settings.exec_keep_age_seconds
+        count = 0
+
+        for path in [self.path, self.kept_path, self.spill_path]:
+            if not os.path.isdir(path):
+                continue
+
+            for entry in os.scandir(path):
+                if (path == self.path and not self._owned(entry.name)) or \
+                        entry.stat(follow_symlinks=False).st_mtime >= deadline:
+                    continue
+
+                if entry.is_dir(follow_symlinks=False):
+                    self._remove(entry.path)
+                    count += 1
+
+                # Files of messages which haven't been delivered because a worker has failed
+                elif path == self.spill_path:
+                    os.remove(entry.path)
+                    count += 1
+
+        if count:
+            self._logger(
+                "info",
+                "Old working directories and spilled files have been removed: {}".format(count)
+            )
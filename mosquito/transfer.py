@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+import ast
+import csv
+import json
+import logging
+
+from xml.etree import ElementTree
+from xml.sax.saxutils import quoteattr
+
+# Columns of a configuration in export files, lists are stored as strings in the database
+FIELDS = ['id', 'enabled', 'plugin', 'source', 'destination', 'update_alert', 'update_interval', 'description',
+          'regex', 'regex_action', 'timestamp', 'counter', 'alert_timestamp', 'images_settings', 'url_tags']
+
+LISTS = ['destination', 'regex', 'regex_action', 'images_settings', 'url_tags']
+
+
+class MosquitoTransfer(object):
+    """
+    Configurations in portable formats:
+    "jsonl" - one JSON object per line with all fields of a configuration
+    "opml" - RSS sources with descriptions (outline xmlUrl/text), other fields are set on import
+    "json", "csv" - output of "mosquito list"
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger('[TRANSFER]')
+
+    def _logger(self, level, message):
+        if level == "debug":
+            self.logger.debug(message)
+        elif level == "error":
+            self.logger.error(message)
+        elif level == "info":
+            self.logger.info(message)
+        elif level == "warning":
+            self.logger.warning(message)
+
+    def read(self, f, file_format):
+        """ Configurations from a file: a list of dicts with fields which are present in the file """
+
+        if file_format == "opml":
+            return self._read_opml(f)
+        else:
+            return self._read_jsonl(f)
+
+    def _read_jsonl(self, f):
+        rows = []
+
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+
+            try:
+                row = json.loads(line)
+
+                if not isinstance(row, dict):
+                    raise ValueError("an object is expected")
+
+            except ValueError as error:
+                raise ValueError("Line {}: {}".format(number, error))
+
+            rows.append(row)
+
+        return rows
+
+    def _read_opml(self, f):
+        rows = []
+
+        for outline in ElementTree.parse(f).iter('outline'):
+            # Folders don't have a feed URL
+            source = outline.get('xmlUrl')
+
+            if source:
+                rows.append({
+                    'plugin': 'rss',
+                    'source': source,
+                    'description': outline.get('title') or outline.get('text')
+                })
+
+        return rows
+
+    def write(self, f, file_format, configs):
+        """ Write configurations (rows of the database) one by one, return an amount of written configurations """
+
+        if file_format == "opml":
+            return self._write_opml(f, configs)
+        elif file_format == "json":
+            return self._write_json(f, configs)
+        elif file_format == "csv":
+            return self._write_csv(f, configs)
+        else:
+            return self._write_jsonl(f, configs)
+
+    def row(self, config):
+        """ A configuration (a row of the database) as a dict, lists are parsed """
+
+        row = dict(zip(FIELDS, config))
+
+        for k in LISTS:
+            try:
+                row[k] = ast.literal_eval(row[k]) if row[k] else None
+            except (ValueError, SyntaxError):
+                pass
+
+        return row
+
+    def _write_jsonl(self, f, configs):
+        count = 0
+
+        for config in configs:
+            f.write(json.dumps(self.row(config), ensure_ascii=False) + "\n")
+            count += 1
+
+        return count
+
+    def _write_json(self, f, configs):
+        """ Configurations as a JSON array which is written row by row """
+
+        count = 0
+
+        f.write("[")
+
+        for config in configs:
+            f.write((",\n" if count else "\n") + json.dumps(self.row(config), ensure_ascii=False))
+            count += 1
+
+        f.write("\n]\n" if count else "]\n")
+
+        return count
+
+    def _write_csv(self, f, configs):
+        """ Configurations as CSV with a header, items of lists are separated by new lines """
+
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+
+        count = 0
+
+        for config in configs:
+            row = self.row(config)
+            writer.writerow(['\n'.join(row[k]) if isinstance(row[k], list) else row[k] for k in FIELDS])
+            count += 1
+
+        return count
+
+    def _write_opml(self, f, configs):
+        count = 0
+
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        f.write('<opml version="2.0">\n<head><title>mosquito</title></head>\n<body>\n')
+
+        for config in configs:
+            row = dict(zip(FIELDS, config))
+
+            if row['plugin'] != "rss":
+                self._logger(
+                    "debug",
+                    "Only RSS configurations can be exported to OPML, skipping: {}".format(row['id'])
+                )
+
+                continue
+
+            text = row['description'] or row['source']
+
+            f.write('<outline type="rss" text={} title={} xmlUrl={}/>\n'.format(
+                quoteattr(text), quoteattr(text), quoteattr(row['source'])))
+            count += 1
+
+        f.write('</body>\n</opml>\n')
+
+        return count
@@ -9,6 +9,22 @@ setup(
     author_email='o.popov@livelace.ru',
     license='BSD',
     packages=['mosquito', 'mosquito.plugins'],
+    install_requires=[
+        'argparse',
+        'beautifulsoup4',
+        'chardet',
+        'coloredlogs',
+        'feedparser',
+        'html2text',
+        'lxml',
+        'pathos',
+        'python-twitter',
+        'requests',
+        'selenium',
+        'terminaltables',
+        'validators',
+        'Pillow'
+    ],
     entry_points={
         'console_scripts': ['mosquito=mosquito.__main__:main'],
     }